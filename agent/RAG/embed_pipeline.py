@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+知识库构建的嵌入与写入阶段
+
+  - TokenBatcher：按 token 数（tiktoken，不可用时按字符数估算）和条数组批
+  - EmbeddingStage：多个批次同时请求嵌入接口，并发数自适应——连续成功时逐步加 1，
+    遇到 429 限流时减半并退避重试（优先使用 Retry-After）
+  - VectorWriter：后台线程把嵌入好的块攒成大批次，一次 upsert 提交；
+    某个文件的块全部提交后回调，由调用方记录进度（断点续建）
+"""
+
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+load_dotenv()
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "8"))          # 最大同时请求数
+EMBED_BATCH_TOKENS = int(os.getenv("EMBED_BATCH_TOKENS", "100000"))   # 每次请求的 token 上限
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "256"))          # 每次请求的条数上限
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "6"))          # 限流后的最大重试次数
+VECTOR_WRITE_BATCH = int(os.getenv("VECTOR_WRITE_BATCH", "2000"))     # 每次提交到向量库的块数
+
+_encodings: Dict[str, object] = {}
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding(model: Optional[str]):
+    """按模型取 tiktoken 编码；tiktoken 未安装或编码文件无法获取时返回 None"""
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    key = model or ""
+    with _encoding_lock:
+        if key not in _encodings:
+            try:
+                _encodings[key] = tiktoken.encoding_for_model(model)
+            except Exception:
+                try:
+                    _encodings[key] = tiktoken.get_encoding("cl100k_base")
+                except Exception as e:
+                    print(f"⚠️ [嵌入] tiktoken 不可用，按字符数估算 token: {e}")
+                    _encodings[key] = None
+        return _encodings[key]
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    encoding = _get_encoding(model)
+    if encoding is None:
+        return len(text)  # 中文约每字 1 token 以上，按字符数估算偏保守
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class TokenBatcher:
+    """累积待嵌入的块，超过 token 或条数上限时产出一批"""
+
+    def __init__(self, model: Optional[str] = None, max_tokens: int = EMBED_BATCH_TOKENS,
+                 max_items: int = EMBED_BATCH_SIZE):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.max_items = max_items
+        self.items: List = []
+        self.tokens = 0
+
+    def add(self, item, text: str) -> Optional[List]:
+        """加入一条；加入前若已放不下，先返回已累积的批次"""
+        tokens = count_tokens(text, self.model)
+        batch = None
+        if self.items and (self.tokens + tokens > self.max_tokens or len(self.items) >= self.max_items):
+            batch = self.flush()
+        self.items.append(item)
+        self.tokens += tokens
+        return batch
+
+    def flush(self) -> Optional[List]:
+        batch, self.items, self.tokens = self.items or None, [], 0
+        return batch
+
+
+def is_rate_limited(error: Exception) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429 or type(error).__name__ == "RateLimitError" or "429" in str(error)
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveConcurrency:
+    """加性增、乘性减的并发上限"""
+
+    def __init__(self, maximum: int = EMBED_CONCURRENCY, start: Optional[int] = None):
+        self.maximum = max(1, maximum)
+        self.limit = float(min(self.maximum, start or max(1, self.maximum // 2)))
+        self.active = 0
+        self.successes = 0
+        self.throttled = 0
+        self.peak = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self.active >= int(self.limit):
+                self._condition.wait()
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def release(self, throttled: bool = False):
+        with self._condition:
+            self.active -= 1
+            if throttled:
+                self.throttled += 1
+                self.successes = 0
+                self.limit = max(1.0, self.limit / 2)
+            else:
+                self.successes += 1
+                if self.successes >= int(self.limit):
+                    self.successes = 0
+                    self.limit = min(float(self.maximum), self.limit + 1)
+            self._condition.notify_all()
+
+
+class EmbeddingStage:
+    """并发嵌入：submit 返回 Future[List[向量]]"""
+
+    def __init__(self, embeddings, concurrency: int = EMBED_CONCURRENCY, max_retries: int = EMBED_MAX_RETRIES):
+        self.embeddings = embeddings
+        self.max_retries = max_retries
+        self.limiter = AdaptiveConcurrency(concurrency)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="embed")
+        self.batches = 0
+        self.texts = 0
+        self.retries = 0
+        self._stats_lock = threading.Lock()
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        delay = 1.0
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            try:
+                vectors = self.embeddings.embed_documents(texts)
+            except Exception as e:
+                throttled = is_rate_limited(e)
+                self.limiter.release(throttled=throttled)
+                if not throttled or attempt == self.max_retries:
+                    raise
+                wait_seconds = _retry_after(e) or delay * (1 + random.random())
+                delay = min(delay * 2, 60.0)
+                with self._stats_lock:
+                    self.retries += 1
+                print(f"⏳ [嵌入] 触发限流，并发降为 {int(self.limiter.limit)}，{wait_seconds:.1f}s 后重试")
+                time.sleep(wait_seconds)
+                continue
+            self.limiter.release()
+            with self._stats_lock:
+                self.batches += 1
+                self.texts += len(texts)
+            return vectors
+
+    def submit(self, texts: List[str]) -> Future:
+        return self.pool.submit(self._embed, texts)
+
+    def shutdown(self, cancel: bool = False):
+        self.pool.shutdown(wait=True, cancel_futures=cancel)
+
+    def stats(self) -> Dict:
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "retries": self.retries,
+            "throttled": self.limiter.throttled,
+            "peak_concurrency": self.limiter.peak,
+            "final_concurrency": int(self.limiter.limit),
+        }
+
+
+Record = Tuple[str, str, object, List[float]]  # (文件键, 块ID, Document, 向量)
+
+
+class VectorWriter:
+    """
+    后台写入线程
+
+    register(key, count, payload) 登记一个文件待写入的块数，之后 put 该文件的块；
+    块攒够 batch_size 或 close 时一次 upsert 提交，文件的块全部提交后调用 on_committed(key, payload)。
+    """
+
+    def __init__(self, collection, on_committed: Callable[[str, Dict], None],
+                 batch_size: int = VECTOR_WRITE_BATCH, max_queue: int = 64):
+        self.collection = collection
+        self.on_committed = on_committed
+        self.batch_size = batch_size
+        self.queue: "queue.Queue" = queue.Queue(maxsize=max_queue)
+        self.pending: Dict[str, list] = {}
+        self.buffer: List[Record] = []
+        self.commits = 0
+        self.committed_chunks = 0
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self._run, name="vector-writer", daemon=True)
+        self.thread.start()
+
+    def _check(self):
+        if self.error is not None:
+            raise RuntimeError(f"向量写入失败: {self.error}") from self.error
+
+    def register(self, key: str, count: int, payload: Dict):
+        self._check()
+        self.queue.put(("file", key, count, payload))
+
+    def put(self, records: List[Record]):
+        self._check()
+        self.queue.put(("records", records))
+
+    def close(self):
+        """提交剩余的块并等待写入线程结束；写入出错时抛出"""
+        self.queue.put(None)
+        self.thread.join()
+        self._check()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if self.error is not None:
+                # 出错后只消费队列，避免生产者阻塞
+                if item is None:
+                    return
+                continue
+            try:
+                if item is None:
+                    self._commit()
+                    return
+                if item[0] == "file":
+                    _, key, count, payload = item
+                    self.pending[key] = [count, payload]
+                    if count == 0:
+                        self._finish(key)
+                else:
+                    self.buffer.extend(item[1])
+                    if len(self.buffer) >= self.batch_size:
+                        self._commit()
+            except BaseException as e:
+                self.error = e
+                if item is None:
+                    return
+
+    def _commit(self):
+        if not self.buffer:
+            return
+        records, self.buffer = self.buffer, []
+        self.collection.upsert(
+            ids=[chunk_id for _, chunk_id, _, _ in records],
+            embeddings=[vector for _, _, _, vector in records],
+            documents=[doc.page_content for _, _, doc, _ in records],
+            metadatas=[doc.metadata for _, _, doc, _ in records],
+        )
+        self.commits += 1
+        self.committed_chunks += len(records)
+        for key, _, _, _ in records:
+            self.pending[key][0] -= 1
+        for key in [key for key, (count, _) in self.pending.items() if count == 0]:
+            self._finish(key)
+
+    def _finish(self, key: str):
+        _, payload = self.pending.pop(key)
+        self.on_committed(key, payload)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+查询嵌入缓存
+
+按 (嵌入模型, 规范化文本的哈希) 缓存嵌入向量：
+  1. 进程内 LRU，命中时不做任何IO
+  2. 本地 SQLite（float32 二进制），重启后仍然有效，多个工作进程共享；
+     超过 EMBED_CACHE_DISK_SIZE 条时删除最早写入的向量
+
+只缓存查询嵌入：知识库导入时的文档块各不相同且只嵌入一次，缓存它们只会挤掉热点查询。
+
+行程规划请求大多由 format_travel_request_prompt 生成，措辞高度重复，
+相同或仅空白/全半角不同的查询直接复用向量，省去一次远程嵌入调用。
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+
+from agent.shared_cache import LRUTTLCache
+
+load_dotenv()
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", str(Path(__file__).resolve().parent / "embedding_cache.sqlite3"))
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "4096"))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", str(30 * 86400)))
+EMBED_CACHE_DISK_SIZE = int(os.getenv("EMBED_CACHE_DISK_SIZE", "100000"))
+PRUNE_EVERY = 100  # 每写入这么多次检查一次磁盘条数
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """全半角统一（NFKC）、合并空白、英文小写"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", text)).strip().lower()
+
+
+def make_embedding_key(model: str, text: str) -> str:
+    return hashlib.sha1(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """内存 LRU + SQLite 两级嵌入缓存"""
+
+    def __init__(self, path: Optional[str] = EMBED_CACHE_PATH, maxsize: int = EMBED_CACHE_SIZE,
+                 ttl: float = EMBED_CACHE_TTL, max_disk: int = EMBED_CACHE_DISK_SIZE):
+        """
+        Args:
+            path: SQLite 文件路径，为None时只使用内存缓存
+            maxsize: 内存中最多缓存的向量数
+            ttl: 内存缓存过期时间（秒）；磁盘中的向量不过期，模型变化时键自然不同
+            max_disk: 磁盘中最多保留的向量数，超出时删除最早写入的
+        """
+        self.path = path
+        self.memory = LRUTTLCache("embedding", maxsize=maxsize, ttl=ttl)
+        self.max_disk = max_disk
+        self.disk_hits = 0
+        self.disk_errors = 0
+        self.disk_evictions = 0
+        self._writes = 0
+        self._local = threading.local()
+        self._pid = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            with self._connection() as connection:
+                connection.execute("""
+                    CREATE TABLE IF NOT EXISTS embeddings (
+                        key TEXT PRIMARY KEY,
+                        model TEXT NOT NULL,
+                        dim INTEGER NOT NULL,
+                        vector BLOB NOT NULL,
+                        created_at REAL NOT NULL
+                    )
+                """)
+                connection.execute("CREATE INDEX IF NOT EXISTS embeddings_created_at ON embeddings (created_at)")
+            self._prune()
+
+    def _connection(self) -> sqlite3.Connection:
+        """每个线程一个连接；fork 后的子进程重新连接"""
+        pid = os.getpid()
+        if self._pid != pid:
+            self._local = threading.local()
+            self._pid = pid
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """批量查找，返回命中的 {键: 向量}"""
+        found = {}
+        missing = []
+        for key in keys:
+            vector = self.memory.get(key)
+            if vector is not None:
+                found[key] = vector
+            else:
+                missing.append(key)
+        if not missing or not self.path:
+            return found
+
+        try:
+            connection = self._connection()
+            # SQLite 单条语句的参数个数有上限，分批查询
+            for i in range(0, len(missing), 500):
+                batch = missing[i:i + 500]
+                placeholders = ", ".join("?" * len(batch))
+                rows = connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = np.frombuffer(blob, dtype=np.float32).tolist()
+                    self.memory.set(key, vector)
+                    found[key] = vector
+                    self.disk_hits += 1
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            print(f"⚠️ [嵌入缓存] 读取失败: {e}")
+        return found
+
+    def set_many(self, model: str, items: Dict[str, List[float]]):
+        """写入内存和磁盘"""
+        for key, vector in items.items():
+            self.memory.set(key, vector)
+        if not items or not self.path:
+            return
+        now = time.time()
+        rows = [
+            (key, model, len(vector), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for key, vector in items.items()
+        ]
+        try:
+            connection = self._connection()
+            with connection:
+                connection.execute("BEGIN")
+                connection.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)", rows)
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            print(f"⚠️ [嵌入缓存] 写入失败: {e}")
+            return
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self._prune()
+
+    def _prune(self):
+        """磁盘条数超过 max_disk 时删除最早写入的向量"""
+        try:
+            connection = self._connection()
+            excess = connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] - self.max_disk
+            if excess > 0:
+                connection.execute(
+                    "DELETE FROM embeddings WHERE key IN "
+                    "(SELECT key FROM embeddings ORDER BY created_at, rowid LIMIT ?)", (excess,)
+                )
+                self.disk_evictions += excess
+        except sqlite3.Error as e:
+            self.disk_errors += 1
+            print(f"⚠️ [嵌入缓存] 清理失败: {e}")
+
+    def disk_size(self) -> int:
+        if not self.path:
+            return 0
+        try:
+            return self._connection().execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+
+class CachedEmbeddings(Embeddings):
+    """在任意 LangChain Embeddings 前加一层查询嵌入缓存；文档嵌入直接透传，不进缓存"""
+
+    def __init__(self, embeddings: Embeddings, model: str, cache: Optional[EmbeddingCache] = None):
+        self.embeddings = embeddings
+        self.model = model or "default"
+        self.cache = cache or EmbeddingCache()
+        self.requests = 0
+        self.remote_calls = 0
+        self.remote_texts = 0
+        self.remote_ms = 0.0
+        self._stats_lock = threading.Lock()
+
+    def _embed(self, texts: List[str], remote) -> List[List[float]]:
+        keys = [make_embedding_key(self.model, text) for text in texts]
+        found = self.cache.get_many(keys)
+
+        # 同一批里重复的文本只请求一次
+        pending: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in found and key not in pending:
+                pending[key] = text
+        if pending:
+            started = time.perf_counter()
+            vectors = remote(list(pending.values()))
+            elapsed = (time.perf_counter() - started) * 1000
+            computed = dict(zip(pending.keys(), vectors))
+            self.cache.set_many(self.model, computed)
+            found.update(computed)
+            with self._stats_lock:
+                self.remote_calls += 1
+                self.remote_texts += len(pending)
+                self.remote_ms += elapsed
+        with self._stats_lock:
+            self.requests += len(texts)
+        return [found[key] for key in keys]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # 导入时整个语料只嵌入一次，写入缓存会挤掉热点查询、让磁盘缓存随语料增长
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], lambda pending: [self.embeddings.embed_query(pending[0])])[0]
+
+    def stats(self) -> Dict:
+        """命中率统计：hit_rate 为无需远程调用的文本比例"""
+        with self._stats_lock:
+            requests, remote_texts = self.requests, self.remote_texts
+            remote_calls, remote_ms = self.remote_calls, self.remote_ms
+        memory = self.cache.memory.stats()
+        return {
+            "model": self.model,
+            "requests": requests,
+            "memory_hits": memory["hits"],
+            "disk_hits": self.cache.disk_hits,
+            "remote_texts": remote_texts,
+            "remote_calls": remote_calls,
+            "hit_rate": round(1 - remote_texts / requests, 4) if requests else 0.0,
+            "avg_remote_ms": round(remote_ms / remote_calls, 2) if remote_calls else 0.0,
+            "memory_size": memory["size"],
+            "disk_size": self.cache.disk_size(),
+            "disk_evictions": self.cache.disk_evictions,
+            "disk_errors": self.cache.disk_errors,
+        }
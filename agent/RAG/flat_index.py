@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+扁平向量索引（RAG 备选后端）
+
+知识库规模不大时，对一块连续矩阵做暴力点积比 Chroma 的 HNSW + SQLite 更快。
+导出器把集合中的嵌入归一化后量化为 int8（每行一个缩放系数）或 float16，
+正文按 UTF-8 打包，与块ID、元数据一起保存在 VECTOR_DIR/flat 下；
+各工作进程以只读内存映射方式加载，同一份页缓存在进程间共享。
+RAG_VECTOR_BACKEND=flat 时检索改用本索引，不再打开 Chroma；ingest 同步后自动重新导出。
+
+用法：
+    python -m agent.RAG.flat_index export [--dtype int8|float16]
+    python -m agent.RAG.flat_index bench [--queries 200] [--top-k 5]   # 与 Chroma 对比召回率和延迟
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from agent.RAG.knowledge_base import EMBED_MODEL, VECTOR_DIR, _read_version, mark_vectorstore_changed, sync_lock
+from agent.RAG.locations import has_location
+
+load_dotenv()
+FLAT_INDEX_DIR = Path(os.getenv("FLAT_INDEX_DIR", str(VECTOR_DIR / "flat")))
+FLAT_INDEX_DTYPE = os.getenv("FLAT_INDEX_DTYPE", "int8")  # int8 / float16
+RAG_VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "chroma")  # chroma / flat
+BLOCK_ROWS = 256  # 分块反量化：块小到能留在CPU缓存里，避免每次查询生成整个 float32 矩阵
+
+
+def _pack_strings(values: List[bytes]):
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(v) for v in values])
+    return np.frombuffer(b"".join(values), dtype=np.uint8), offsets
+
+
+def quantize(vectors: np.ndarray, dtype: str = FLAT_INDEX_DTYPE) -> Tuple[np.ndarray, np.ndarray]:
+    """按行 L2 归一化后量化，返回 (矩阵, 每行缩放系数)；float16 的缩放系数全为1"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors = vectors / np.where(norms == 0, 1, norms)
+    if dtype == "float16":
+        return vectors.astype(np.float16), np.ones(len(vectors), dtype=np.float32)
+    if dtype != "int8":
+        raise ValueError(f"不支持的类型: {dtype}")
+    scale = np.abs(vectors).max(axis=1) / 127.0
+    scale[scale == 0] = 1.0
+    matrix = np.clip(np.rint(vectors / scale[:, None]), -127, 127).astype(np.int8)
+    return matrix, scale.astype(np.float32)
+
+
+def export_flat_index(collection, out_dir: Path = FLAT_INDEX_DIR, dtype: str = FLAT_INDEX_DTYPE,
+                      page_size: int = 5000) -> str:
+    """把 Chroma 集合的嵌入、正文和元数据导出为扁平索引，写入临时目录后整体替换"""
+    started = time.time()
+    ids: List[str] = []
+    texts: List[bytes] = []
+    metadatas: List[Optional[Dict]] = []
+    matrices, scales = [], []
+
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        if not len(page["ids"]):
+            break
+        matrix, scale = quantize(np.asarray(page["embeddings"], dtype=np.float32), dtype)
+        matrices.append(matrix)
+        scales.append(scale)
+        ids.extend(page["ids"])
+        texts.extend((text or "").encode("utf-8") for text in page["documents"])
+        metadatas.extend(page["metadatas"])
+        offset += len(page["ids"])
+
+    if matrices:
+        matrix, scale = np.concatenate(matrices), np.concatenate(scales)
+    else:
+        matrix, scale = np.zeros((0, 0), dtype=np.int8 if dtype == "int8" else np.float16), np.zeros(0, np.float32)
+
+    out_dir = Path(out_dir)
+    tmp_dir = out_dir.with_name(f"{out_dir.name}.tmp-{os.getpid()}")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+    text_blob, text_offsets = _pack_strings(texts)
+    np.save(tmp_dir / "matrix.npy", matrix)
+    np.save(tmp_dir / "scale.npy", scale)
+    np.save(tmp_dir / "texts.npy", text_blob)
+    np.save(tmp_dir / "text_offsets.npy", text_offsets)
+    with open(tmp_dir / "chunks.json", "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "metadatas": metadatas}, f, ensure_ascii=False)
+    with open(tmp_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({"count": len(ids), "dim": int(matrix.shape[1]) if matrix.ndim == 2 else 0, "dtype": dtype,
+                   "embed_model": EMBED_MODEL, "built_at": time.time()}, f)
+
+    # 旧进程已映射的文件在替换后仍然有效
+    old_dir = out_dir.with_name(f"{out_dir.name}.old-{os.getpid()}")
+    if out_dir.exists():
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    size_mb = (matrix.nbytes + text_blob.nbytes) / 1024 / 1024
+    print(f"✔ 扁平向量索引导出完成: {out_dir}（{len(ids)} 个块，{dtype}，{size_mb:.1f}MB，"
+          f"耗时 {time.time() - started:.2f}s）")
+    return str(out_dir)
+
+
+class FlatIndex:
+    """内存映射加载的扁平向量索引，检索为分块的向量化点积 + argpartition 取 top-k"""
+
+    def __init__(self, index_dir: Path = FLAT_INDEX_DIR):
+        index_dir = Path(index_dir)
+        with open(index_dir / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(index_dir / "chunks.json", encoding="utf-8") as f:
+            chunks = json.load(f)
+        self.ids: List[str] = chunks["ids"]
+        self.metadatas: List[Optional[Dict]] = chunks["metadatas"]
+        self.rows = {chunk_id: i for i, chunk_id in enumerate(self.ids)}
+        self._location_masks: Dict[str, np.ndarray] = {}
+        self.matrix = np.load(index_dir / "matrix.npy", mmap_mode="r")
+        self.scale = np.load(index_dir / "scale.npy", mmap_mode="r")
+        self.texts = np.load(index_dir / "texts.npy", mmap_mode="r")
+        self.text_offsets = np.load(index_dir / "text_offsets.npy", mmap_mode="r")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, query_vector) -> np.ndarray:
+        """查询向量与所有块的余弦相似度"""
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        out = np.empty(len(self.ids), dtype=np.float32)
+        for start in range(0, len(self.ids), BLOCK_ROWS):
+            block = self.matrix[start:start + BLOCK_ROWS]
+            out[start:start + len(block)] = block.astype(np.float32) @ query
+        return out * self.scale
+
+    def location_mask(self, locations: List[str]) -> np.ndarray:
+        """提到任一地点的块，按地点缓存"""
+        mask = np.zeros(len(self.ids), dtype=bool)
+        for name in locations:
+            if name not in self._location_masks:
+                self._location_masks[name] = np.fromiter(
+                    (has_location(metadata, [name]) for metadata in self.metadatas), dtype=bool, count=len(self.ids)
+                )
+            mask |= self._location_masks[name]
+        return mask
+
+    def search(self, query_vector, top_k: int = 5, locations: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """返回 [(块ID, 余弦相似度)]，相似度降序；指定 locations 时只在提到这些地点的块中检索"""
+        if not self.ids:
+            return []
+        scores = self.scores(query_vector)
+        if locations:
+            scores[~self.location_mask(locations)] = -np.inf
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[i], float(scores[i])) for i in top if np.isfinite(scores[i])]
+
+    def text(self, row: int) -> str:
+        return self.texts[self.text_offsets[row]:self.text_offsets[row + 1]].tobytes().decode("utf-8")
+
+    def get(self, chunk_ids: List[str]) -> Dict[str, Tuple[str, Optional[Dict]]]:
+        """按块ID取 (正文, 元数据)，与 Chroma get 的用途相同"""
+        found = {}
+        for chunk_id in chunk_ids:
+            row = self.rows.get(chunk_id)
+            if row is not None:
+                found[chunk_id] = (self.text(row), self.metadatas[row])
+        return found
+
+
+# 每个进程首次调用时映射索引文件；知识库版本变化后重新加载
+_flat_index = None
+_flat_index_key = None
+_flat_index_lock = threading.Lock()
+
+
+def get_flat_index() -> Optional[FlatIndex]:
+    """获取扁平向量索引，索引文件不存在时返回None"""
+    global _flat_index, _flat_index_key
+    key = (os.getpid(), _read_version())
+    if _flat_index is None or _flat_index_key != key:
+        with _flat_index_lock:
+            if _flat_index is None or _flat_index_key != key:
+                if not (FLAT_INDEX_DIR / "meta.json").exists():
+                    return None
+                _flat_index, _flat_index_key = FlatIndex(FLAT_INDEX_DIR), key
+                print(f"✔ 已加载扁平向量索引（{len(_flat_index)} 个块，{_flat_index.meta['dtype']}）")
+    return _flat_index
+
+
+def _percentile(samples: List[float], q: float) -> float:
+    return float(np.percentile(samples, q)) if samples else 0.0
+
+
+def benchmark(collection, index: FlatIndex, queries: int = 200, top_k: int = 5, seed: int = 0) -> Dict:
+    """
+    以库中随机块的嵌入（加少量噪声）为查询，对比：
+      - 精确结果：float32 暴力检索
+      - flat：量化矩阵暴力检索
+      - chroma：collection.query（HNSW）
+    返回 recall@k（相对精确结果）和单次检索延迟
+    """
+    rng = np.random.default_rng(seed)
+    page = collection.get(include=["embeddings"])
+    ids = list(page["ids"])
+    exact = np.asarray(page["embeddings"], dtype=np.float32)
+    exact /= np.linalg.norm(exact, axis=1, keepdims=True)
+    picks = rng.choice(len(ids), size=min(queries, len(ids)), replace=False)
+    noise = rng.normal(scale=0.01, size=(len(picks), exact.shape[1])).astype(np.float32)
+    query_vectors = exact[picks] + noise
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+
+    recall = {"flat": [], "chroma": []}
+    latency = {"flat": [], "chroma": []}
+    for query in query_vectors:
+        truth = {ids[i] for i in np.argsort(-(exact @ query))[:top_k]}
+
+        started = time.perf_counter()
+        flat_hits = {chunk_id for chunk_id, _ in index.search(query, top_k)}
+        latency["flat"].append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        chroma_hits = set(collection.query(query_embeddings=[query.tolist()], n_results=top_k, include=[])["ids"][0])
+        latency["chroma"].append((time.perf_counter() - started) * 1000)
+
+        recall["flat"].append(len(flat_hits & truth) / top_k)
+        recall["chroma"].append(len(chroma_hits & truth) / top_k)
+
+    return {
+        "chunks": len(ids),
+        "queries": len(picks),
+        "top_k": top_k,
+        "dtype": index.meta["dtype"],
+        **{
+            name: {
+                "recall": round(float(np.mean(recall[name])), 4),
+                "p50_ms": round(_percentile(latency[name], 50), 3),
+                "p95_ms": round(_percentile(latency[name], 95), 3),
+            }
+            for name in ("flat", "chroma")
+        },
+    }
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="扁平向量索引")
+    parser.add_argument("command", choices=["export", "bench"])
+    parser.add_argument("--dtype", choices=["int8", "float16"], default=FLAT_INDEX_DTYPE)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    from agent.RAG.ingest import open_collection
+    collection = open_collection()._collection
+    if args.command == "export":
+        with sync_lock():
+            export_flat_index(collection, dtype=args.dtype)
+            mark_vectorstore_changed()
+        return
+
+    index = get_flat_index()
+    if index is None:
+        print("❌ 扁平向量索引不存在，请先执行 export")
+        return
+    print(json.dumps(benchmark(collection, index, queries=args.queries, top_k=args.top_k), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+知识库增量导入
+
+VECTOR_DIR/manifest.json 记录每个文件的内容哈希和它切出的每个块的哈希（即向量库中的块ID）：
+  - 文件大小和修改时间都没变：直接跳过，不读文件
+  - 内容哈希变化：重新切块，只嵌入新出现的块，删除不再存在的块
+  - 文件被删除：删除它的所有块
+文件的块全部写入向量库后才记入清单；中途失败后再次执行，已写入的块按ID跳过，从中断处继续。
+同步在 VECTOR_DIR/.sync.lock 文件锁内进行，同一时间只有一个进程写向量库、清单和索引；
+Web 进程只读取已提交的结果，不会自行构建。
+
+解析和切块在进程池中并行进行（INGEST_WORKERS 个进程），完成的文件经有界队列
+（最多 INGEST_QUEUE_SIZE 个文件）交给主进程；嵌入按 token 数组批并发请求（见 embed_pipeline），
+写入由后台线程攒成大批次提交，不会把整个语料的块都堆在内存里。
+每个块按 cities / provinces 表打上地点标签（见 locations）。
+同步结束后重建 BM25 词法索引（见 lexical_index），使用扁平向量后端时重新导出（见 flat_index）。
+
+用法：
+    python -m agent.RAG.ingest sync              # 增量同步 DOC_DIR -> 向量库
+    python -m agent.RAG.ingest sync --dry-run    # 只显示将要进行的变更
+    python -m agent.RAG.ingest sync --full       # 清空后全量重建
+    python -m agent.RAG.ingest status
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from dotenv import load_dotenv
+
+from agent.RAG.embed_pipeline import EmbeddingStage, TokenBatcher, VectorWriter
+from agent.RAG.flat_index import FLAT_INDEX_DIR, RAG_VECTOR_BACKEND, export_flat_index
+from agent.RAG.lexical_index import LEXICAL_INDEX_DIR, build_lexical_index
+from agent.RAG.locations import LocationTagger, gazetteer_fingerprint, load_gazetteer, retag_collection
+from agent.RAG.knowledge_base import (
+    BUILD_MARKER, COLLECTION, DOC_DIR, EMBED_MODEL, VECTOR_DIR, embeddings, load_docs_from_path,
+    mark_vectorstore_changed, splitter, sync_lock,
+)
+
+MANIFEST_PATH = VECTOR_DIR / "manifest.json"
+SUPPORTED_SUFFIXES = {".txt", ".pdf"}
+
+load_dotenv()
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(os.cpu_count() or 1)))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", str(max(2, INGEST_WORKERS * 2))))
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _chunk_ids(rel_path: str, docs) -> List[str]:
+    """块ID = 文件路径哈希 + 块内容哈希；同一文件内内容相同的块按出现次数区分"""
+    file_key = hashlib.sha1(rel_path.encode("utf-8")).hexdigest()[:12]
+    ids, seen = [], {}
+    for doc in docs:
+        chunk_key = hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()[:20]
+        occurrence = seen.get(chunk_key, 0)
+        seen[chunk_key] = occurrence + 1
+        ids.append(f"{file_key}-{chunk_key}" + (f"-{occurrence}" if occurrence else ""))
+    return ids
+
+
+def _parse_file(rel_path: str, source: str) -> Dict:
+    """在工作进程中执行：读取、切块、计算哈希和块ID；失败时返回错误而不是抛出"""
+    started = time.perf_counter()
+    path = Path(source)
+    result = {"rel_path": rel_path, "source": source, "docs": [], "ids": [], "error": None}
+    try:
+        stat = path.stat()
+        docs = load_docs_from_path(path)
+        result.update({
+            "docs": docs,
+            "ids": _chunk_ids(rel_path, docs),
+            "sha256": _file_hash(path),
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+        })
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    result["parse_seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def iter_parsed_files(items: Iterable[Tuple[str, Path]], workers: int = INGEST_WORKERS,
+                      queue_size: int = INGEST_QUEUE_SIZE) -> Iterator[Dict]:
+    """
+    并行解析并切块，按完成顺序逐个产出 _parse_file 的结果
+
+    同时在途（解析中或已解析待取走）的文件不超过 queue_size 个：调用方嵌入写入当前文件时，
+    工作进程继续解析后面的文件，但不会无限制地领先。workers <= 1 时在当前进程内顺序执行。
+    """
+    items = list(items)
+    if workers <= 1 or len(items) <= 1:
+        for rel_path, path in items:
+            yield _parse_file(rel_path, str(path))
+        return
+
+    remaining = iter(items)
+    with ProcessPoolExecutor(max_workers=min(workers, len(items))) as pool:
+        pending = {
+            pool.submit(_parse_file, rel_path, str(path))
+            for rel_path, path in itertools.islice(remaining, max(queue_size, 1))
+        }
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                # 每取走一个结果再补充一个任务，保持队列有界
+                for rel_path, path in itertools.islice(remaining, 1):
+                    pending.add(pool.submit(_parse_file, rel_path, str(path)))
+                yield future.result()
+
+
+def _splitter_config() -> Dict:
+    """切块参数或嵌入模型变化后，已有的块ID不再可信，需要全量重建"""
+    return {
+        "embed_model": EMBED_MODEL,
+        "collection": COLLECTION,
+        "chunk_size": splitter._chunk_size,
+        "chunk_overlap": splitter._chunk_overlap,
+    }
+
+
+def load_manifest(path: Path = MANIFEST_PATH) -> Dict:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {"config": None, "files": {}}
+
+
+def save_manifest(manifest: Dict, path: Path = MANIFEST_PATH):
+    """先写临时文件再替换，中断时不会留下半个清单"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+
+def scan_documents(doc_dir: Path = DOC_DIR) -> Dict[str, Path]:
+    """DOC_DIR 下所有支持的文件 {相对路径: 路径}"""
+    return {
+        file.name: file
+        for file in sorted(doc_dir.iterdir())
+        if file.is_file() and file.suffix.lower() in SUPPORTED_SUFFIXES
+    }
+
+
+def open_collection():
+    """直接打开（必要时创建）Chroma 集合，供同步和索引导出写入"""
+    from langchain_community.vectorstores import Chroma
+    return Chroma(
+        embedding_function=embeddings,
+        persist_directory=str(VECTOR_DIR),
+        collection_name=COLLECTION,
+    )
+
+
+def plan_sync(manifest: Dict, files: Dict[str, Path], full: bool = False) -> Dict[str, List[str]]:
+    """比较清单和当前文件，返回 {"unchanged": [...], "touched": [...], "changed": [...], "deleted": [...]}"""
+    plan = {"unchanged": [], "touched": [], "changed": [], "deleted": []}
+    known = {} if full else manifest["files"]
+    for rel_path, path in files.items():
+        entry = known.get(rel_path)
+        stat = path.stat()
+        if entry is None:
+            plan["changed"].append(rel_path)
+        elif entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns:
+            plan["unchanged"].append(rel_path)
+        elif entry["sha256"] == _file_hash(path):
+            plan["touched"].append(rel_path)  # 只是修改时间变了
+        else:
+            plan["changed"].append(rel_path)
+    plan["deleted"] = sorted(set(known) - set(files))
+    return plan
+
+
+def _delete_file_chunks(vs, source: str, ids: List[str]):
+    """按ID删除；清单建立之前写入的块没有确定的ID，按来源路径删除"""
+    if ids:
+        vs.delete(ids=ids)
+    vs._collection.delete(where={"source": source})
+
+
+def sync_knowledge_base(full: bool = False, dry_run: bool = False, workers: int = INGEST_WORKERS) -> Dict:
+    """
+    把 DOC_DIR 同步到向量库，返回变更统计；已有其他进程在同步时抛出 RuntimeError
+
+    Args:
+        full: 清空向量库和清单后全量导入
+        dry_run: 只计算变更，不读写向量库
+        workers: 解析切块的进程数
+    """
+    if dry_run:
+        return _sync_knowledge_base(full, dry_run, workers)
+    with sync_lock():
+        return _sync_knowledge_base(full, dry_run, workers)
+
+
+def _sync_knowledge_base(full: bool, dry_run: bool, workers: int) -> Dict:
+    started = time.perf_counter()
+    manifest = load_manifest()
+    if manifest.get("config") != _splitter_config() and manifest["files"]:
+        print("⚠️  切块参数或嵌入模型已变化，执行全量重建")
+        full = True
+
+    files = scan_documents()
+    plan = plan_sync(manifest, files, full=full)
+    report = {key: len(value) for key, value in plan.items()}
+    report.update({"chunks_added": 0, "chunks_deleted": 0, "chunks_kept": 0, "failed": [], "parse_seconds": {}})
+    print(f"📋 文件：新增/变更 {report['changed']}，删除 {report['deleted']}，未变化 {report['unchanged'] + report['touched']}")
+    if dry_run:
+        report["plan"] = {key: value for key, value in plan.items() if key != "unchanged"}
+        return report
+
+    vs = open_collection()
+    # 所有块提交前一直保留标记；中断后标记留下，提示需要再次同步
+    if BUILD_MARKER.exists():
+        print("🔄 上次同步未完成，已提交的块会被跳过，从中断处继续")
+    VECTOR_DIR.mkdir(parents=True, exist_ok=True)
+    BUILD_MARKER.write_text(str(time.time()), encoding="utf-8")
+    if full:
+        existing = vs.get(include=[])["ids"]
+        for i in range(0, len(existing), 5000):
+            vs.delete(ids=existing[i:i + 5000])
+        manifest = {"config": _splitter_config(), "files": {}}
+        save_manifest(manifest)
+    manifest["config"] = _splitter_config()
+
+    # 地名词典变化（如新增城市）时，只重写已有块的地点标签，不重新嵌入
+    aliases = load_gazetteer()
+    tagger = LocationTagger(aliases)
+    fingerprint = gazetteer_fingerprint(aliases)
+    report["retagged"] = 0
+    if manifest.get("gazetteer") != fingerprint and manifest["files"]:
+        report["retagged"] = retag_collection(vs._collection, tagger)
+        print(f"🏷️  地名词典已变化，重写 {report['retagged']} 个块的地点标签")
+    manifest["gazetteer"] = fingerprint
+    save_manifest(manifest)
+
+    for rel_path in plan["touched"]:
+        manifest["files"][rel_path]["mtime_ns"] = files[rel_path].stat().st_mtime_ns
+
+    for rel_path in plan["deleted"]:
+        entry = manifest["files"].pop(rel_path)
+        _delete_file_chunks(vs, entry["source"], entry["chunks"])
+        report["chunks_deleted"] += len(entry["chunks"])
+        save_manifest(manifest)
+        print(f"🗑️  {rel_path}: 删除 {len(entry['chunks'])} 个块")
+
+    def on_committed(rel_path: str, entry: Dict):
+        # 在写入线程中调用：文件的块全部提交后才记入清单，中断后从这里续建
+        manifest["files"][rel_path] = entry
+        save_manifest(manifest)
+
+    stage = EmbeddingStage(embeddings)
+    writer = VectorWriter(vs._collection, on_committed)
+    batcher = TokenBatcher(EMBED_MODEL)
+    in_flight: Dict = {}
+    max_in_flight = stage.limiter.maximum * 2
+
+    def submit(batch):
+        in_flight[stage.submit([doc.page_content for _, _, doc in batch])] = batch
+
+    def drain(block: bool):
+        # 把已完成的嵌入交给写入线程；block 时至少等到一批完成
+        if not in_flight:
+            return
+        done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED, timeout=None if block else 0)
+        for future in done:
+            batch = in_flight.pop(future)
+            writer.put([(key, chunk_id, doc, vector) for (key, chunk_id, doc), vector in zip(batch, future.result())])
+
+    changed = [(rel_path, files[rel_path]) for rel_path in plan["changed"]]
+    try:
+        for parsed in iter_parsed_files(changed, workers=workers):
+            rel_path = parsed["rel_path"]
+            if parsed["error"]:
+                # 不写入清单，下次同步时重试
+                report["failed"].append(rel_path)
+                print(f"❌ {rel_path}: 解析失败 {parsed['error']}（{parsed['parse_seconds']:.1f}s）")
+                continue
+            docs, ids = parsed["docs"], parsed["ids"]
+            tagger.tag_documents(docs)
+
+            # 向量库中该来源已有的块：清单记录的、旧版本构建的（随机ID）、上次中断前已提交的
+            entry = manifest["files"].get(rel_path)
+            present = set(entry["chunks"]) if entry else set()
+            present.update(vs._collection.get(where={"source": parsed["source"]}, include=[])["ids"])
+            new_chunks = [(doc, chunk_id) for doc, chunk_id in zip(docs, ids) if chunk_id not in present]
+            stale = sorted(present - set(ids))
+            if stale:
+                vs._collection.delete(ids=stale)
+
+            writer.register(rel_path, len(new_chunks), {
+                "source": parsed["source"],
+                "sha256": parsed["sha256"],
+                "size": parsed["size"],
+                "mtime_ns": parsed["mtime_ns"],
+                "chunks": ids,
+            })
+            for doc, chunk_id in new_chunks:
+                batch = batcher.add((rel_path, chunk_id, doc), doc.page_content)
+                if batch:
+                    submit(batch)
+                    while len(in_flight) >= max_in_flight:
+                        drain(block=True)
+            drain(block=False)
+
+            report["chunks_added"] += len(new_chunks)
+            report["chunks_deleted"] += len(stale)
+            report["chunks_kept"] += len(ids) - len(new_chunks)
+            report["parse_seconds"][rel_path] = parsed["parse_seconds"]
+            print(f"✅ {rel_path}: {len(ids)} 个块，新增 {len(new_chunks)}，删除 {len(stale)}"
+                  f"（解析 {parsed['parse_seconds']:.1f}s）")
+
+        batch = batcher.flush()
+        if batch:
+            submit(batch)
+        while in_flight:
+            drain(block=True)
+    finally:
+        # 出错时已完成的嵌入照常提交，未开始的请求取消；再次同步会跳过已提交的块
+        stage.shutdown(cancel=True)
+        for future, batch in list(in_flight.items()):
+            if not future.cancelled() and future.exception() is None:
+                writer.put([(key, chunk_id, doc, vector) for (key, chunk_id, doc), vector in zip(batch, future.result())])
+        writer.close()
+
+    report["embedding"] = stage.stats()
+    report["writes"] = {"commits": writer.commits, "chunks": writer.committed_chunks}
+    save_manifest(manifest)
+    changed_any = report["chunks_added"] or report["chunks_deleted"] or report["retagged"] or full
+    if changed_any or not (LEXICAL_INDEX_DIR / "meta.json").exists():
+        # 词法/扁平索引在版本号更新前重建，各进程随向量库一起重新加载
+        build_lexical_index(vs._collection)
+    flat_exported = (FLAT_INDEX_DIR / "meta.json").exists()
+    if (RAG_VECTOR_BACKEND == "flat" or flat_exported) and (changed_any or not flat_exported):
+        export_flat_index(vs._collection)
+    if changed_any:
+        if hasattr(vs, "persist"):
+            vs.persist()
+        mark_vectorstore_changed()
+    # 写入线程已正常结束，登记的块都已提交；解析失败的文件不在清单中，下次同步重试，不影响标记
+    BUILD_MARKER.unlink(missing_ok=True)
+    report["seconds"] = round(time.perf_counter() - started, 2)
+    slowest = sorted(report["parse_seconds"].items(), key=lambda item: item[1], reverse=True)[:5]
+    if slowest:
+        print("🐢 解析最慢的文件: " + "，".join(f"{name} {seconds:.1f}s" for name, seconds in slowest))
+    print(f"🎉 同步完成：新增 {report['chunks_added']} 个块，删除 {report['chunks_deleted']} 个块，"
+          f"复用 {report['chunks_kept']} 个块，耗时 {report['seconds']}s")
+    return report
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="知识库增量导入工具")
+    parser.add_argument("command", choices=["sync", "status"])
+    parser.add_argument("--full", action="store_true", help="清空后全量重建")
+    parser.add_argument("--dry-run", action="store_true", help="只显示将要进行的变更")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="解析切块的进程数")
+    args = parser.parse_args()
+
+    if args.command == "sync":
+        report = sync_knowledge_base(full=args.full, dry_run=args.dry_run, workers=args.workers)
+    else:
+        manifest = load_manifest()
+        report = plan_sync(manifest, scan_documents())
+        report["manifest_files"] = len(manifest["files"])
+        report["manifest_chunks"] = sum(len(entry["chunks"]) for entry in manifest["files"].values())
+        report["interrupted"] = BUILD_MARKER.exists()
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -7,12 +7,17 @@ retriever.py  —  目录下 TXT / PDF 向量库初始化脚本
   1. 读取目录下所有 .txt/.pdf 文件
   2. 切块并生成嵌入
   3. 持久化到 Chroma 向量库
-  4. 更新资料，请删除chroma.sqlite3
+  4. 构建和更新都通过 python -m agent.RAG.ingest sync（只嵌入新增/变化的文件，删除已移除文件的块），
+     同一时间只允许一个同步进程写入；Web 进程只加载已提交的向量库，不在请求中构建
+  5. get_vectorstore() 为每个进程只打开一次向量库；同步后 .version 文件变化，各进程自动重新加载
 
 不包含 LLM 调用或问答功能。
 由 RAG 上层逻辑调用。
 """
 import os
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
 from dotenv import load_dotenv
 from langchain_community.document_loaders import TextLoader, PyPDFLoader, UnstructuredPDFLoader
@@ -20,6 +25,14 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings
 
+from agent.RAG.embedding_cache import CachedEmbeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 # 加载环境变量
 load_dotenv(override=True)
 
@@ -30,14 +43,21 @@ VECTOR_DIR = Path(os.getenv("VECTOR_DIR"))    # 向量库存放目录
 COLLECTION = os.getenv("COLLECTION_NAME")     # 向量集合名称
 EMBED_MODEL = os.getenv("EMBED_MODEL")        # 嵌入模型
 
+VERSION_FILE = VECTOR_DIR / ".version"      # 向量库重建后更新，工作进程据此自动重新加载
+BUILD_MARKER = VECTOR_DIR / ".building"     # 同步开始时写入，所有块提交后删除；存在说明上次同步中断
+SYNC_LOCK = VECTOR_DIR / ".sync.lock"       # 同步、索引导出持有的文件锁
+
 api_key = os.getenv("OPENAI_API_KEY")
 api_base = os.getenv("OPENAI_API_BASE")
 
-# 嵌入与切块配置
-embeddings = OpenAIEmbeddings(
+# 嵌入与切块配置；相同（规范化后）文本的嵌入走本地缓存，不再重复请求
+embeddings = CachedEmbeddings(
+    OpenAIEmbeddings(
+        model=EMBED_MODEL,
+        openai_api_key=api_key,
+        openai_api_base=api_base,
+    ),
     model=EMBED_MODEL,
-    openai_api_key=api_key,
-    openai_api_base=api_base,
 )
 splitter = RecursiveCharacterTextSplitter(
     chunk_size=1200,
@@ -64,122 +84,126 @@ def load_docs_from_path(path: Path):
 
 def load_all_docs(dir_path: Path):
     """
-    遍历目录下所有 .txt/.pdf 文件并切分，返回所有文档块。
+    遍历目录下所有 .txt/.pdf 文件并切分（多进程并行），返回所有文档块。
+    构建向量库请使用 agent.RAG.ingest，它按文件流式写入，不会一次性持有所有块。
     """
+    from agent.RAG.ingest import iter_parsed_files, scan_documents
+
     docs = []
-    for file in dir_path.iterdir():
-        if file.is_file() and file.suffix.lower() in {".txt", ".pdf"}:
-            docs.extend(load_docs_from_path(file))
+    for parsed in iter_parsed_files(scan_documents(dir_path).items()):
+        if parsed["error"]:
+            raise RuntimeError(f"{parsed['source']}: {parsed['error']}")
+        docs.extend(parsed["docs"])
     return docs
 
 
 def init_vectorstore():
     """
-    初始化向量库：
-    - 如果向量库不存在，创建新的向量库
-    - 如果向量库已存在，直接返回现有实例
-     
-    如果需要重建，请先删除 VECTOR_DIR 目录
+    加载已提交的向量库，不存在时返回None
+
+    只读：构建、续建和更新都由 python -m agent.RAG.ingest sync 在锁内完成，
+    Web 进程（包括同步进行中启动或回收重启的进程）不会在用户请求中写向量库。
     """
-    # 如果向量库已存在，直接返回
-    if VECTOR_DIR.exists() and any(VECTOR_DIR.iterdir()):
-        print(f"✔ 向量库已存在，直接加载")
-        vs = Chroma(
-            embedding_function=embeddings,
-            persist_directory=str(VECTOR_DIR),
-            collection_name=COLLECTION,
-        )
-        print(f"✔ 向量库加载完成，共 {vs._collection.count()} chunks")
-        return vs
-     
-    # 创建新的向量库
-    print("🔄 开始构建向量库...")
-    docs = load_all_docs(DOC_DIR)
-     
-    if not docs:
-        print("❌ 没有找到任何文档")
+    if not VECTOR_DIR.exists() or not any(VECTOR_DIR.iterdir()):
+        print("❌ 向量库不存在，请先运行 python -m agent.RAG.ingest sync 构建")
         return None
-    
-    print(f"📚 总共需要处理 {len(docs)} 个文档块")
-    
-    # 分批处理，避免单次请求token过多
-    batch_size = 100  # 每批100个文档块，可根据实际情况调整
-    vs = None
-    
-    try:
-        for i in range(0, len(docs), batch_size):
-            batch_docs = docs[i:i+batch_size]
-            current_batch = i // batch_size + 1
-            total_batches = (len(docs) + batch_size - 1) // batch_size
-            
-            print(f"📦 处理第 {current_batch}/{total_batches} 批，共 {len(batch_docs)} 个文档块")
-            
-            if vs is None:
-                # 第一批：创建向量库
-                vs = Chroma.from_documents(
-                    batch_docs,
-                    embeddings,
-                    persist_directory=str(VECTOR_DIR),
-                    collection_name=COLLECTION,
-                )
-                print(f"✅ 第1批处理完成，已创建向量库")
-            else:
-                # 后续批次：添加到现有向量库
-                vs.add_documents(batch_docs)
-                print(f"✅ 第{current_batch}批处理完成")
-            
-            # 每批处理后都保存
-            vs.persist()
-        
-        final_count = vs._collection.count()
-        print(f"🎉 向量库构建完成！")
-        print(f"📊 总文档块数: {final_count}")
-        print(f"📊 处理批次数: {total_batches}")
-        return vs
-        
-    except Exception as e:
-        print(f"❌ 向量库构建失败: {e}")
-        # 如果构建失败，清理可能的残留文件
-        if VECTOR_DIR.exists():
-            import shutil
-            try:
-                shutil.rmtree(VECTOR_DIR)
-                print("🧹 已清理失败的向量库文件")
-            except:
-                pass
+    if BUILD_MARKER.exists():
+        print("⚠️ 向量库同步进行中或上次同步中断，先加载已提交的部分；"
+              "中断时请重新运行 python -m agent.RAG.ingest sync 继续")
+    vs = Chroma(
+        embedding_function=embeddings,
+        persist_directory=str(VECTOR_DIR),
+        collection_name=COLLECTION,
+    )
+    count = vs._collection.count()
+    if not count:
+        print("❌ 向量库为空，请先运行 python -m agent.RAG.ingest sync 构建")
         return None
+    print(f"✔ 向量库加载完成，共 {count} chunks")
+    return vs
+
+
+@contextmanager
+def sync_lock():
     """
-    初始化向量库：
-    - 如果向量库不存在，创建新的向量库
-    - 如果向量库已存在，直接返回现有实例
-    
-    如果需要重建，请先删除 VECTOR_DIR 目录
+    向量库写入锁：同步和单独导出索引时持有，保证同一时间只有一个进程写向量库、清单和索引
+
+    锁已被其他进程持有时立即抛出 RuntimeError，不等待。
     """
-    # 如果向量库已存在，直接返回
-    if VECTOR_DIR.exists() and any(VECTOR_DIR.iterdir()):
-        print(f" 向量库已存在，直接加载")
-        vs = Chroma(
-            embedding_function=embeddings,
-            persist_directory=str(VECTOR_DIR),
-            collection_name=COLLECTION,
-        )
-        print(f"✔ 向量库加载完成，共 {vs._collection.count()} chunks")
-        return vs
-    
-    # 创建新的向量库
-    print("开始构建向量库...")
-    docs = load_all_docs(DOC_DIR)
-    
-    if not docs:
-        print("没有找到任何文档")
+    VECTOR_DIR.mkdir(parents=True, exist_ok=True)
+    with open(SYNC_LOCK, "a+") as f:
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.seek(0)
+            holder = f.read().strip() or "未知"
+            raise RuntimeError(f"另一个同步进程（pid {holder}）正在写入向量库，请等待其结束") from None
+        f.seek(0)
+        f.truncate()
+        f.write(str(os.getpid()))
+        f.flush()
+        try:
+            yield
+        finally:
+            f.seek(0)
+            f.truncate()
+            f.flush()
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def mark_vectorstore_changed():
+    """知识库内容变化后调用：更新版本文件，各进程下次检索时重新打开向量库"""
+    VECTOR_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_file = VERSION_FILE.with_name(f"{VERSION_FILE.name}.{os.getpid()}.tmp")
+    tmp_file.write_text(f"{time.time():.6f}", encoding="utf-8")
+    os.replace(tmp_file, VERSION_FILE)
+
+
+def _read_version():
+    try:
+        return VERSION_FILE.read_text(encoding="utf-8").strip()
+    except OSError:
         return None
-    
-    vs = Chroma.from_documents(
-        docs,
-        embeddings,
-        persist_directory=str(VECTOR_DIR),
-        collection_name=COLLECTION,
-    )
-    vs.persist()
-    print(f"✔ 向量库构建完成，共 {len(docs)} chunks")
-    return vs
\ No newline at end of file
+
+
+# 每个进程只打开一次向量库（Chroma客户端、索引和嵌入配置），fork后或版本变化时重新打开
+_vectorstore = None
+_vectorstore_pid = None
+_vectorstore_version = None
+_vectorstore_lock = threading.Lock()
+
+
+def get_vectorstore(reload: bool = False):
+    """
+    获取当前进程的向量库（懒加载，线程安全）
+
+    Args:
+        reload: 强制重新打开（知识库在本进程内被修改后使用）
+    """
+    global _vectorstore, _vectorstore_pid, _vectorstore_version
+    pid = os.getpid()
+    version = _read_version()
+    if reload or _vectorstore is None or _vectorstore_pid != pid or _vectorstore_version != version:
+        with _vectorstore_lock:
+            if reload or _vectorstore is None or _vectorstore_pid != pid or _vectorstore_version != version:
+                started = time.perf_counter()
+                vs = init_vectorstore()
+                if vs is None:
+                    return _vectorstore if _vectorstore_pid == pid else None
+                _vectorstore, _vectorstore_pid = vs, pid
+                _vectorstore_version = version
+                print(f"✔ 向量库已加载到进程 {pid}，耗时 {(time.perf_counter() - started) * 1000:.1f}ms")
+    return _vectorstore
+
+
+def reload_vectorstore():
+    """重新打开当前进程的向量库"""
+    return get_vectorstore(reload=True)
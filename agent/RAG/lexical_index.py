@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+知识库词法索引（BM25）
+
+导入时用 jieba（加载景点名词典）对向量库中的每个块分词，构建倒排表：
+词 -> [(块序号, BM25权重)]，权重在构建时按 k1/b 预先算好，查询时只需按词累加。
+索引以 .npy 文件保存在 VECTOR_DIR/lexical 下，各进程以内存映射方式加载。
+
+用法：
+    python -m agent.RAG.lexical_index build        # 从现有向量库重建
+    python -m agent.RAG.lexical_index query 故宫博物院开放时间
+"""
+
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import jieba
+import numpy as np
+from dotenv import load_dotenv
+
+from agent.RAG.embedding_cache import normalize_text
+from agent.RAG.knowledge_base import VECTOR_DIR, _read_version, mark_vectorstore_changed, sync_lock
+from agent.RAG.locations import LOCATION_PREFIX
+
+load_dotenv()
+LEXICAL_INDEX_DIR = Path(os.getenv("LEXICAL_INDEX_DIR", str(VECTOR_DIR / "lexical")))
+# 查询中实体名（景点名）占内容字符的比例达到该值时，只走词法检索，不做嵌入
+LEXICAL_ENTITY_RATIO = float(os.getenv("LEXICAL_ENTITY_RATIO", "0.5"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+SQL_DIR = Path(__file__).resolve().parent.parent / "sql"
+_TOKEN = re.compile(r"[\w一-鿿]")
+_ENTITY_NAME = re.compile(r"^[\w一-鿿]{2,}$")
+STOPWORDS = {
+    "的", "了", "是", "在", "和", "与", "及", "或", "有", "我", "你", "他", "吗", "呢", "吧", "啊", "呀",
+    "哪些", "哪里", "什么", "怎么", "怎样", "如何", "一下", "请", "给", "推荐", "介绍", "一些", "这个", "那个",
+}
+
+
+def load_entity_names() -> List[str]:
+    """景点名：scenic_dictionary.json 和 spot_dict.txt（jieba词典格式：名称 词频）"""
+    names = set()
+    try:
+        with open(SQL_DIR / "scenic_dictionary.json", encoding="utf-8") as f:
+            names.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(SQL_DIR / "spot_dict.txt", encoding="utf-8") as f:
+            for line in f:
+                name = line.rsplit(" ", 1)[0].strip()
+                if name:
+                    names.add(name)
+    except OSError:
+        pass
+    return sorted(name for name in (normalize_text(n) for n in names) if _ENTITY_NAME.match(name))
+
+
+class Tokenizer:
+    """独立的 jieba 分词器，加入景点名词典，不影响全局 jieba"""
+
+    def __init__(self, entity_names: Optional[List[str]] = None):
+        self.entities = set(load_entity_names() if entity_names is None else entity_names)
+        self.jieba = jieba.Tokenizer()
+        for name in self.entities:
+            self.jieba.add_word(name, freq=1000)
+
+    @staticmethod
+    def _keep(token: str) -> bool:
+        return bool(_TOKEN.search(token)) and token not in STOPWORDS
+
+    def tokenize(self, text: str) -> List[str]:
+        """搜索引擎模式：长词同时产出其中的短词，提高召回"""
+        return [t for t in (t.strip() for t in self.jieba.cut_for_search(normalize_text(text))) if self._keep(t)]
+
+    def entity_ratio(self, text: str) -> Tuple[float, List[str]]:
+        """精确模式分词，返回实体名占内容字符的比例和命中的实体名"""
+        tokens = [t.strip() for t in self.jieba.cut(normalize_text(text))]
+        tokens = [t for t in tokens if self._keep(t)]
+        total = sum(len(t) for t in tokens)
+        entities = [t for t in tokens if t in self.entities]
+        return (sum(len(t) for t in entities) / total if total else 0.0), entities
+
+
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+
+def get_tokenizer() -> Tokenizer:
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                started = time.perf_counter()
+                _tokenizer = Tokenizer()
+                print(f"✔ 分词器已加载（{len(_tokenizer.entities)} 个景点名，{time.perf_counter() - started:.2f}s）")
+    return _tokenizer
+
+
+def build_lexical_index(collection, out_dir: Path = LEXICAL_INDEX_DIR, page_size: int = 5000) -> str:
+    """从 Chroma 集合中的全部块构建 BM25 倒排索引，写入临时目录后整体替换"""
+    started = time.time()
+    tokenizer = get_tokenizer()
+    chunk_ids: List[str] = []
+    vocab: Dict[str, int] = {}
+    doc_terms: List[np.ndarray] = []
+    doc_tfs: List[np.ndarray] = []
+    locations: Dict[str, List[int]] = {}  # 地点 -> 提到它的块序号
+
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        for chunk_id, text, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+            for key, value in (metadata or {}).items():
+                if key.startswith(LOCATION_PREFIX) and value is True:
+                    locations.setdefault(key[len(LOCATION_PREFIX):], []).append(len(chunk_ids))
+            counts: Dict[int, int] = {}
+            for token in tokenizer.tokenize(text or ""):
+                term = vocab.setdefault(token, len(vocab))
+                counts[term] = counts.get(term, 0) + 1
+            chunk_ids.append(chunk_id)
+            doc_terms.append(np.fromiter(counts.keys(), dtype=np.int32, count=len(counts)))
+            doc_tfs.append(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+        offset += len(page["ids"])
+
+    n_docs = len(chunk_ids)
+    lengths = np.asarray([tfs.sum() for tfs in doc_tfs], dtype=np.float32)
+    avgdl = float(lengths.mean()) if n_docs else 0.0
+    if n_docs:
+        terms = np.concatenate(doc_terms)
+        tfs = np.concatenate(doc_tfs)
+        docs = np.repeat(np.arange(n_docs, dtype=np.int32), [len(t) for t in doc_terms])
+    else:
+        terms = np.zeros(0, dtype=np.int32)
+        tfs = np.zeros(0, dtype=np.float32)
+        docs = np.zeros(0, dtype=np.int32)
+
+    # 按词排序得到倒排表，并预先算好每条 posting 的 BM25 权重
+    order = np.lexsort((docs, terms))
+    terms, docs, tfs = terms[order], docs[order], tfs[order]
+    df = np.bincount(terms, minlength=len(vocab)).astype(np.float32)
+    idf = np.log1p((n_docs - df + 0.5) / (df + 0.5))
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[docs] / (avgdl or 1.0))
+    weights = (idf[terms] * tfs * (BM25_K1 + 1) / (tfs + norm)).astype(np.float32)
+    offsets = np.zeros(len(vocab) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum(df.astype(np.int64))
+
+    out_dir = Path(out_dir)
+    tmp_dir = out_dir.with_name(f"{out_dir.name}.tmp-{os.getpid()}")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+    np.save(tmp_dir / "offsets.npy", offsets)
+    np.save(tmp_dir / "postings_doc.npy", docs)
+    np.save(tmp_dir / "postings_weight.npy", weights)
+    with open(tmp_dir / "terms.json", "w", encoding="utf-8") as f:
+        json.dump(sorted(vocab, key=vocab.get), f, ensure_ascii=False)
+    with open(tmp_dir / "chunk_ids.json", "w", encoding="utf-8") as f:
+        json.dump(chunk_ids, f)
+    with open(tmp_dir / "locations.json", "w", encoding="utf-8") as f:
+        json.dump(locations, f, ensure_ascii=False)
+    with open(tmp_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({"docs": n_docs, "terms": len(vocab), "postings": len(docs), "avgdl": avgdl,
+                   "k1": BM25_K1, "b": BM25_B, "built_at": time.time()}, f)
+
+    # 旧进程已映射的文件在替换后仍然有效
+    old_dir = out_dir.with_name(f"{out_dir.name}.old-{os.getpid()}")
+    if out_dir.exists():
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    print(f"✔ 词法索引构建完成: {out_dir}（{n_docs} 个块，{len(vocab)} 个词，{len(docs)} 条倒排，"
+          f"耗时 {time.time() - started:.2f}s）")
+    return str(out_dir)
+
+
+class LexicalIndex:
+    """内存映射加载的 BM25 倒排索引"""
+
+    def __init__(self, index_dir: Path = LEXICAL_INDEX_DIR):
+        index_dir = Path(index_dir)
+        with open(index_dir / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(index_dir / "terms.json", encoding="utf-8") as f:
+            self.term_ids = {term: i for i, term in enumerate(json.load(f))}
+        with open(index_dir / "chunk_ids.json", encoding="utf-8") as f:
+            self.chunk_ids = json.load(f)
+        try:
+            with open(index_dir / "locations.json", encoding="utf-8") as f:
+                self.locations = {name: np.asarray(rows, dtype=np.int64) for name, rows in json.load(f).items()}
+        except OSError:
+            self.locations = {}
+        self.offsets = np.load(index_dir / "offsets.npy", mmap_mode="r")
+        self.postings_doc = np.load(index_dir / "postings_doc.npy", mmap_mode="r")
+        self.postings_weight = np.load(index_dir / "postings_weight.npy", mmap_mode="r")
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def search(self, query: str, top_k: int = 10, tokenizer: Optional[Tokenizer] = None,
+               locations: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """返回 [(块ID, BM25分数)]，分数降序；指定 locations 时只在提到这些地点的块中检索"""
+        tokenizer = tokenizer or get_tokenizer()
+        terms = {self.term_ids[t] for t in tokenizer.tokenize(query) if t in self.term_ids}
+        if not terms or not self.chunk_ids:
+            return []
+        scores = np.zeros(len(self.chunk_ids), dtype=np.float32)
+        for term in terms:
+            start, end = self.offsets[term], self.offsets[term + 1]
+            scores[self.postings_doc[start:end]] += self.postings_weight[start:end]
+        if locations:
+            allowed = np.zeros(len(self.chunk_ids), dtype=bool)
+            for name in locations:
+                if name in self.locations:
+                    allowed[self.locations[name]] = True
+            scores[~allowed] = 0
+        hits = np.flatnonzero(scores)
+        if len(hits) > top_k:
+            hits = hits[np.argpartition(-scores[hits], top_k - 1)[:top_k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [(self.chunk_ids[i], float(scores[i])) for i in hits]
+
+
+# 每个进程首次调用时映射索引文件；知识库版本变化后重新加载
+_lexical_index = None
+_lexical_index_key = None
+_lexical_index_lock = threading.Lock()
+
+
+def get_lexical_index() -> Optional[LexicalIndex]:
+    """获取词法索引，索引文件不存在时返回None"""
+    global _lexical_index, _lexical_index_key
+    key = (os.getpid(), _read_version())
+    if _lexical_index is None or _lexical_index_key != key:
+        with _lexical_index_lock:
+            if _lexical_index is None or _lexical_index_key != key:
+                if not (LEXICAL_INDEX_DIR / "meta.json").exists():
+                    return None
+                _lexical_index, _lexical_index_key = LexicalIndex(LEXICAL_INDEX_DIR), key
+                print(f"✔ 已加载词法索引（{len(_lexical_index)} 个块）")
+    return _lexical_index
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="知识库 BM25 词法索引")
+    parser.add_argument("command", choices=["build", "query"])
+    parser.add_argument("query", nargs="?", default="故宫博物院开放时间")
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        from agent.RAG.ingest import open_collection
+        with sync_lock():
+            build_lexical_index(open_collection()._collection)
+            mark_vectorstore_changed()
+        return
+
+    index = get_lexical_index()
+    if index is None:
+        print("❌ 词法索引不存在，请先执行 build")
+        return
+    ratio, entities = get_tokenizer().entity_ratio(args.query)
+    started = time.perf_counter()
+    hits = index.search(args.query, top_k=args.top_k)
+    elapsed = (time.perf_counter() - started) * 1000
+    print(f"分词: {get_tokenizer().tokenize(args.query)}，实体: {entities}（占比 {ratio:.2f}）")
+    for chunk_id, score in hits:
+        print(f"  {score:8.3f}  {chunk_id}")
+    print(f"⏱️ {elapsed:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+知识库块的城市/省份标签
+
+以数据库 cities / provinces 表为地名词典（全称和去掉“市”“省”的简称），导入时给每个块打上
+它提到的地点：元数据 loc:北京市 = True（Chroma 元数据只支持标量，每个地点一个布尔键）。
+检索时用元数据过滤只在目的地相关的块中检索：旅行表单请求用表单填写的目的地
+（提示词里还有出发地），自由文本问题才从问题中抽取。
+
+词典在导入时写入 VECTOR_DIR/gazetteer.json，检索进程只读该文件，不连接数据库。
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+from agent.RAG.knowledge_base import VECTOR_DIR
+from agent.sql.entity_matcher import EntityMatcher
+
+GAZETTEER_PATH = VECTOR_DIR / "gazetteer.json"
+LOCATION_PREFIX = "loc:"
+
+
+def _aliases(names: List[str], suffix: str) -> Dict[str, str]:
+    aliases = {}
+    for name in names:
+        aliases[name] = name
+        if name.endswith(suffix) and len(name) > 2:
+            aliases.setdefault(name[:-1], name)
+    return aliases
+
+
+def load_gazetteer(refresh: bool = True) -> Dict[str, str]:
+    """
+    返回 {地名或简称: 全称}
+
+    Args:
+        refresh: 先从数据库读取并保存到 gazetteer.json；数据库不可用时使用已保存的词典
+    """
+    if refresh:
+        try:
+            from agent.sql.attraction_ezqa_service import create_database_manager
+            db_manager = create_database_manager()
+            cities = db_manager.get_all_cities()
+            provinces = db_manager.get_all_provinces()
+            # 城市优先：直辖市在两张表中同名，简称“北京”指向同一个全称
+            aliases = _aliases(provinces, "省")
+            aliases.update(_aliases(cities, "市"))
+            GAZETTEER_PATH.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = GAZETTEER_PATH.with_name(f"{GAZETTEER_PATH.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps(aliases, ensure_ascii=False, indent=1), encoding="utf-8")
+            os.replace(tmp_path, GAZETTEER_PATH)
+            return aliases
+        except Exception as e:
+            print(f"⚠️ [地点标签] 无法从数据库读取城市/省份，使用已保存的词典: {e}")
+    try:
+        return json.loads(GAZETTEER_PATH.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def gazetteer_fingerprint(aliases: Dict[str, str]) -> str:
+    return hashlib.sha1(json.dumps(aliases, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class LocationTagger:
+    """Aho-Corasick 一次扫描找出文本中提到的所有地点，返回全称"""
+
+    def __init__(self, aliases: Dict[str, str]):
+        self.aliases = aliases
+        self.names = sorted(set(aliases.values()))
+        self.matcher = EntityMatcher(aliases) if aliases else None
+
+    def locations(self, text: str) -> List[str]:
+        if not self.matcher or not text:
+            return []
+        found = []
+        for _, _, name in self.matcher.find_all(text):
+            if name not in found:
+                found.append(name)
+        return found
+
+    def tag(self, metadata: Optional[Dict], text: str) -> Dict:
+        """返回打好标签的元数据副本；不再提到的地点置为 False（Chroma 更新元数据时不会删除键）"""
+        tagged = {key: value for key, value in (metadata or {}).items()}
+        for key in [key for key in tagged if key.startswith(LOCATION_PREFIX)]:
+            tagged[key] = False
+        for name in self.locations(text):
+            tagged[f"{LOCATION_PREFIX}{name}"] = True
+        return tagged
+
+    def tag_documents(self, docs) -> None:
+        for doc in docs:
+            doc.metadata = self.tag(doc.metadata, doc.page_content)
+
+
+def retag_collection(collection, tagger: LocationTagger, page_size: int = 2000) -> int:
+    """地名词典变化后，按页重写集合中所有块的地点标签（只更新元数据，不重新嵌入）"""
+    updated = 0
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        metadatas = [tagger.tag(metadata, text or "") for text, metadata in zip(page["documents"], page["metadatas"])]
+        collection.update(ids=page["ids"], metadatas=metadatas)
+        updated += len(page["ids"])
+        offset += len(page["ids"])
+    return updated
+
+
+def location_filter(locations: List[str]) -> Optional[Dict]:
+    """Chroma where 条件：块提到任一目的地"""
+    clauses = [{f"{LOCATION_PREFIX}{name}": True} for name in locations]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+
+def has_location(metadata: Optional[Dict], locations: List[str]) -> bool:
+    return any((metadata or {}).get(f"{LOCATION_PREFIX}{name}") is True for name in locations)
+
+
+# 检索进程只读已保存的词典；导入后知识库版本变化时重新加载
+_query_tagger = None
+_query_tagger_mtime = None
+_query_tagger_lock = threading.Lock()
+
+
+def get_query_tagger() -> LocationTagger:
+    global _query_tagger, _query_tagger_mtime
+    try:
+        mtime = GAZETTEER_PATH.stat().st_mtime_ns
+    except OSError:
+        mtime = None
+    if _query_tagger is None or _query_tagger_mtime != mtime:
+        with _query_tagger_lock:
+            if _query_tagger is None or _query_tagger_mtime != mtime:
+                _query_tagger = LocationTagger(load_gazetteer(refresh=False))
+                _query_tagger_mtime = mtime
+    return _query_tagger
+
+
+def destination_locations(destination: str) -> List[str]:
+    """表单目的地对应的城市/省份全称；识别不出（如国外目的地）时返回空列表，检索时不按地点过滤"""
+    return get_query_tagger().locations(destination or "")
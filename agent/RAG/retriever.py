@@ -4,14 +4,38 @@
 本地知识库搜索函数
 
 专注于本地向量库检索，返回格式化的搜索结果
+检索模式（RAG_SEARCH_MODE）：
+  - vector：纯向量相似度
+  - lexical：只用 BM25 词法索引，不做嵌入
+  - hybrid：词法与向量结果按倒数排名融合（RRF）；查询主要由景点名构成时只走词法检索
+词法索引不存在时自动退回 vector。
+按导入时打的地点标签过滤（见 locations）：调用方可直接传入目的地，否则从查询中抽取城市/省份。
+向量部分默认查 Chroma；RAG_VECTOR_BACKEND=flat 且已导出扁平索引时改为内存映射矩阵暴力检索（见 flat_index）。
 """
 
 import os
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from typing import List, Dict, Any, Optional, Tuple
 from dataclasses import dataclass
 
-# 导入本地向量库初始化
-from agent.RAG.knowledge_base import init_vectorstore
+from dotenv import load_dotenv
+
+# 导入本地向量库（进程级单例）
+from agent.RAG.knowledge_base import get_vectorstore, embeddings
+from agent.RAG.flat_index import RAG_VECTOR_BACKEND, FlatIndex, get_flat_index
+from agent.RAG.lexical_index import LEXICAL_ENTITY_RATIO, get_lexical_index, get_tokenizer
+from agent.RAG.locations import get_query_tagger, location_filter
+
+load_dotenv()
+RAG_SEARCH_MODE = os.getenv("RAG_SEARCH_MODE", "hybrid")
+RRF_K = 60  # 倒数排名融合常数
+# 从查询中抽取目的地（城市/省份），只在提到目的地的块中检索；结果不足时用全库结果补足
+RAG_LOCATION_FILTER = os.getenv("RAG_LOCATION_FILTER", "true").lower() == "true"
+
+# 检索耗时统计（当前进程）
+_search_stats = {"queries": 0, "total_ms": 0.0, "max_ms": 0.0, "modes": {}}
+_search_stats_lock = threading.Lock()
 
 @dataclass
 class SearchResult:
@@ -22,58 +46,170 @@ class SearchResult:
     score: Optional[float] = None
     metadata: Optional[Dict] = None
 
-def search_local_knowledge(query: str, top_k: int = 5, score_threshold: float = 0.0) -> List[SearchResult]:
+def search_local_knowledge(query: str, top_k: int = 5, score_threshold: float = 0.0,
+                           mode: str = RAG_SEARCH_MODE, locations: Optional[List[str]] = None) -> List[SearchResult]:
     """
     本地知识库搜索函数
     
     Args:
         query: 搜索查询
         top_k: 返回结果数量
-        score_threshold: 相似度阈值（0.0-1.0，越小越严格）
+        score_threshold: 相似度阈值（0.0-1.0，越小越严格，仅 vector 模式使用）
+        mode: 检索模式 vector / lexical / hybrid
+        locations: 只检索提到这些城市/省份的块；为None时从查询中抽取，为空列表时不按地点过滤
     
     Returns:
         搜索结果列表
     """
-    # 初始化向量库
-    vectorstore = init_vectorstore()
+    started = time.perf_counter()
+    # 获取进程内已打开的向量库（或扁平索引），只有首次调用或知识库变化后才会打开
+    vectorstore = _get_store()
     
     if not vectorstore:
         print("❌ 向量库未初始化")
         return []
     
+    lexical_index = get_lexical_index() if mode != "vector" else None
+    if lexical_index is None:
+        mode = "vector"
+    if locations is None and RAG_LOCATION_FILTER:
+        locations = get_query_tagger().locations(query)
+    
     try:
-        # 使用相似度搜索
-        docs_with_scores = vectorstore.similarity_search_with_score(
-            query, 
-            k=top_k
-        )
-        
-        results = []
-        for doc, score in docs_with_scores:
-            # 过滤低相似度结果
-            if score <= score_threshold:
-                continue
-                
-            # 提取文件名
-            source_path = doc.metadata.get('source', 'Unknown')
-            filename = os.path.basename(source_path) if source_path else 'Unknown'
-            
-            result = SearchResult(
-                source="knowledge_base",
-                title=f"📚 {filename}",
-                content=doc.page_content,
-                score=score,
-                metadata=doc.metadata
-            )
-            results.append(result)
+        results, used_mode = _search(vectorstore, lexical_index, query, top_k, score_threshold, mode, locations)
+        if locations and len(results) < top_k:
+            # 提到目的地的块不够，用全库检索结果补足
+            extra, _ = _search(vectorstore, lexical_index, query, top_k, score_threshold, mode, None)
+            seen = {result.content for result in results}
+            results += [result for result in extra if result.content not in seen][:top_k - len(results)]
+            used_mode += "+fallback"
         
-        print(f"✔ 找到 {len(results)} 个相关文档")
+        elapsed = (time.perf_counter() - started) * 1000
+        _record_latency(elapsed, used_mode)
+        where = f"，目的地 {'/'.join(locations)}" if locations else ""
+        print(f"✔ 找到 {len(results)} 个相关文档（{used_mode}{where}，{elapsed:.1f}ms）")
         return results
         
     except Exception as e:
         print(f"❌ 知识库检索失败: {e}")
         return []
 
+def _search(vectorstore, lexical_index, query: str, top_k: int, score_threshold: float, mode: str,
+            locations: Optional[List[str]]) -> Tuple[List[SearchResult], str]:
+    """按模式检索一次，返回 (结果, 实际使用的模式)"""
+    if mode == "vector":
+        return _vector_search(vectorstore, query, top_k, score_threshold, locations), mode
+    if mode == "hybrid":
+        ratio, _ = get_tokenizer().entity_ratio(query)
+        if ratio >= LEXICAL_ENTITY_RATIO:
+            mode = "lexical_fast_path"
+    ranked = lexical_index.search(query, top_k=top_k if mode != "hybrid" else max(top_k * 4, 20),
+                                  locations=locations)
+    if mode == "lexical_fast_path" and not ranked:
+        mode = "hybrid"  # 景点名在知识库中没有出现，退回混合检索
+    if mode == "hybrid":
+        ranked = _hybrid_rank(vectorstore, query, ranked, top_k, locations)
+    return _load_results(vectorstore, ranked[:top_k]), mode
+
+def _get_store():
+    if RAG_VECTOR_BACKEND == "flat":
+        flat_index = get_flat_index()
+        if flat_index is not None:
+            return flat_index
+    return get_vectorstore()
+
+def _make_result(content: str, metadata: Optional[Dict], score: Optional[float]) -> SearchResult:
+    # 提取文件名
+    source_path = (metadata or {}).get('source', 'Unknown')
+    filename = os.path.basename(source_path) if source_path else 'Unknown'
+    return SearchResult(
+        source="knowledge_base",
+        title=f"📚 {filename}",
+        content=content,
+        score=score,
+        metadata=metadata
+    )
+
+def _vector_search(vectorstore, query: str, top_k: int, score_threshold: float,
+                   locations: Optional[List[str]] = None) -> List[SearchResult]:
+    if isinstance(vectorstore, FlatIndex):
+        ranked = vectorstore.search(embeddings.embed_query(query), top_k, locations=locations)
+        return _load_results(vectorstore, [(chunk_id, score) for chunk_id, score in ranked if score > score_threshold])
+    
+    # 使用相似度搜索（有目的地时按地点标签过滤）
+    docs_with_scores = vectorstore.similarity_search_with_score(
+        query, 
+        k=top_k,
+        filter=location_filter(locations or [])
+    )
+    
+    results = []
+    for doc, score in docs_with_scores:
+        # 过滤低相似度结果
+        if score <= score_threshold:
+            continue
+        results.append(_make_result(doc.page_content, doc.metadata, score))
+    return results
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """倒数排名融合：score = Σ 1 / (k + 名次)，与各路分数的量纲无关"""
+    fused: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, 1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+def _hybrid_rank(vectorstore, query: str, lexical: List[Tuple[str, float]], top_k: int,
+                 locations: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+    """向量候选（带块ID）与词法候选融合"""
+    fetch_k = max(top_k * 4, 20)
+    if isinstance(vectorstore, FlatIndex):
+        vector_ids = [
+            chunk_id for chunk_id, _ in vectorstore.search(embeddings.embed_query(query), fetch_k, locations=locations)
+        ]
+    else:
+        vector_ids = vectorstore._collection.query(
+            query_embeddings=[embeddings.embed_query(query)],
+            n_results=fetch_k,
+            where=location_filter(locations or []),
+            include=[],
+        )["ids"][0]
+    return reciprocal_rank_fusion([vector_ids, [chunk_id for chunk_id, _ in lexical]])
+
+def _load_results(vectorstore, ranked: List[Tuple[str, float]]) -> List[SearchResult]:
+    """按块ID从向量库（SQLite 查询）或扁平索引（内存映射）取正文，不涉及嵌入"""
+    if not ranked:
+        return []
+    chunk_ids = [chunk_id for chunk_id, _ in ranked]
+    if isinstance(vectorstore, FlatIndex):
+        chunks = vectorstore.get(chunk_ids)
+    else:
+        found = vectorstore._collection.get(ids=chunk_ids, include=["documents", "metadatas"])
+        chunks = dict(zip(found["ids"], zip(found["documents"], found["metadatas"])))
+    return [
+        _make_result(chunks[chunk_id][0], chunks[chunk_id][1], score)
+        for chunk_id, score in ranked
+        if chunk_id in chunks
+    ]
+
+def _record_latency(elapsed_ms: float, mode: str = "vector"):
+    with _search_stats_lock:
+        _search_stats["modes"][mode] = _search_stats["modes"].get(mode, 0) + 1
+        _search_stats["queries"] += 1
+        _search_stats["total_ms"] += elapsed_ms
+        _search_stats["max_ms"] = max(_search_stats["max_ms"], elapsed_ms)
+
+def get_rag_stats() -> Dict[str, Any]:
+    """获取当前进程的检索耗时和嵌入缓存命中统计"""
+    with _search_stats_lock:
+        stats = dict(_search_stats)
+        stats["modes"] = dict(_search_stats["modes"])
+    stats["avg_ms"] = round(stats["total_ms"] / stats["queries"], 2) if stats["queries"] else 0.0
+    stats["total_ms"] = round(stats["total_ms"], 2)
+    stats["max_ms"] = round(stats["max_ms"], 2)
+    stats["embedding_cache"] = embeddings.stats()
+    return stats
+
 def format_search_results(results: List[SearchResult]) -> str:
     """
     将搜索结果格式化为可读字符串
@@ -115,13 +251,16 @@ def get_context_for_llm(results: List[SearchResult]) -> str:
     
     return "\n\n".join(context_parts)
 
-def rag_search(query: str, top_k: int = 3) -> Dict[str, Any]:
+def rag_search(query: str, top_k: int = 3, mode: str = RAG_SEARCH_MODE,
+               locations: Optional[List[str]] = None) -> Dict[str, Any]:
     """
     RAG搜索接口 - 供tool调用
     
     Args:
         query: 搜索查询
         top_k: 返回结果数量
+        mode: 检索模式 vector / lexical / hybrid
+        locations: 目的地城市/省份全称（如表单目的地）；为None时从查询中抽取
     
     Returns:
         包含搜索结果和格式化上下文的字典
@@ -129,7 +268,7 @@ def rag_search(query: str, top_k: int = 3) -> Dict[str, Any]:
     # print(f"🔍 RAG搜索: {query}")
     
     # 搜索本地知识库
-    results = search_local_knowledge(query, top_k=top_k)
+    results = search_local_knowledge(query, top_k=top_k, mode=mode, locations=locations)
     
     # 生成上下文
     context = get_context_for_llm(results)
@@ -139,4 +278,44 @@ def rag_search(query: str, top_k: int = 3) -> Dict[str, Any]:
         "results": results,
         "context": context,
         "count": len(results)
-    }
\ No newline at end of file
+    }
+
+def _benchmark(query: str, repeat: int = 10, top_k: int = 3):
+    """对比每次检索都重新打开向量库（旧做法）与复用进程内单例的单次检索耗时"""
+    from agent.RAG.knowledge_base import init_vectorstore
+
+    def timed(get_store):
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            get_store().similarity_search_with_score(query, k=top_k)
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        return samples[len(samples) // 2], sum(samples) / len(samples)
+
+    get_vectorstore()  # 预热：首次打开不计入
+    reopen = timed(init_vectorstore)
+    shared = timed(get_vectorstore)
+    print(f"⏱️ 每次重新打开向量库: p50 {reopen[0]:.1f}ms / 平均 {reopen[1]:.1f}ms")
+    print(f"⏱️ 复用进程内向量库:   p50 {shared[0]:.1f}ms / 平均 {shared[1]:.1f}ms")
+
+    # 各检索模式的端到端耗时（嵌入缓存会让重复查询的向量部分变快，这里取首轮之后的稳定值）
+    for mode in ("vector", "lexical", "hybrid"):
+        search_local_knowledge(query, top_k=top_k, mode=mode)
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            search_local_knowledge(query, top_k=top_k, mode=mode)
+            samples.append((time.perf_counter() - started) * 1000)
+        samples.sort()
+        print(f"⏱️ {mode:8s} 检索: p50 {samples[len(samples) // 2]:.1f}ms")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地知识库检索耗时对比")
+    parser.add_argument("query", nargs="?", default="北京三日游推荐")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    _benchmark(args.query, repeat=args.repeat)
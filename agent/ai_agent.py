@@ -2,11 +2,14 @@ import warnings
 import os
 import asyncio
 import time
+import threading
 import traceback
 import concurrent.futures
 from typing import Dict, Any, List, Optional, Generator
-from agent.RAG.retriever import rag_search
-from agent.sql.attraction_ezqa_service import myanswer
+from agent.RAG.retriever import rag_search, get_rag_stats
+from agent.RAG.locations import destination_locations
+from agent.sql.attraction_ezqa_service import get_sql_qa_engine, get_sql_qa_stats
+from agent.sql.route_planner import build_route_context
 from agent.shared_cache import INFO_CACHE
 # 抑制LangChain弃用警告
 warnings.filterwarnings("ignore", category=DeprecationWarning)
@@ -56,6 +59,10 @@ class ConfigManager:
         self.base_url = os.getenv("OPENAI_API_URL")
         self.searchapi_key = os.getenv("SEARCHAPI_API_KEY", "")
         self.mcp_server_path = "agent/mcp_server.py"
+        # 上下文组装（对话历史、SQL问答等）的时间预算，超时后不再等待SQL资料，直接开始生成
+        self.context_budget = float(os.getenv("CONTEXT_BUDGET_MS", "800")) / 1000
+        # SQL问答后台线程数，也是同时在执行的SQL问答上限（超预算被放弃的查询仍占用名额直到结束）
+        self.context_workers = int(os.getenv("CONTEXT_WORKERS", "8"))
         
         if not self.api_key:
             raise ValueError("未配置OpenAI API密钥")
@@ -486,16 +493,20 @@ class PlannerAgent:
         self.llm_normal = llm_normal
         print("行程规划智能体已创建")
         
-    def get_response_stream(self, message: str, collected_info: str = "", conversation_history: list = None, raw_mcp_results: dict = None):
-        """获取真流式响应（支持对话记忆和原始MCP数据）"""
+    def get_response_stream(self, message: str, collected_info: str = "", conversation_history: list = None, raw_mcp_results: dict = None, form_data: dict = None, route_context: str = ""):
+        """获取真流式响应（支持对话记忆和原始MCP数据；form_data 为旅行表单，route_context 为预计算的游览路线）"""
         # 构建规划请求内容
         if collected_info:
             planning_content = f"用户原始需求：\n{message}\n\n信息收集智能体提供的详细信息：\n{collected_info}"
         else:
             planning_content = f"用户需求：\n{message}"
         
-        # 添加RAG搜索结果
-        planning_content = planning_content + rag_search(message, top_k=3)['context']
+        # 添加RAG搜索结果；表单请求按表单目的地过滤，避免提示词中的出发地占用结果
+        locations = destination_locations(form_data.get('destination', '')) if form_data else None
+        planning_content = planning_content + rag_search(message, top_k=3, locations=locations)['context']
+
+        # 按景点坐标预计算的每日分组和游览顺序（AgentService 在上下文预算内计算）
+        planning_content += route_context
         
         # 如果有原始MCP数据，添加到规划内容中
         if raw_mcp_results:
@@ -622,6 +633,15 @@ class AgentService:
         self.redis_memory_manager = get_redis_memory_manager(**redis_config)
         
         self.agent_sessions: Dict[str, Dict[str, Any]] = {}
+        # SQL问答和路线预计算专用线程池：请求线程读取对话历史的同时在后台查询
+        self._sql_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.config.context_workers, thread_name_prefix="context-sql"
+        )
+        # 名额用完（慢查询堆积）时直接跳过SQL，不在线程池队列里排队
+        self._sql_slots = threading.BoundedSemaphore(self.config.context_workers)
+        self.context_stats = {"requests": 0, "sql_timeouts": 0, "sql_errors": 0, "sql_skipped": 0,
+                              "route_timeouts": 0, "route_skipped": 0}
+        self._context_stats_lock = threading.Lock()
         print("AgentService 初始化完成（使用懒加载模式 + Redis记忆）。")
 
     @property
@@ -730,6 +750,81 @@ class AgentService:
             self.agent_sessions[session_key] = self._create_agent_session(user_email, conv_id)
         return self.agent_sessions[session_key]
 
+    def _count_context(self, key: str):
+        with self._context_stats_lock:
+            self.context_stats[key] += 1
+
+    def _submit_context(self, task) -> Optional[concurrent.futures.Future]:
+        """在SQL专用线程池中提交任务；同时执行的任务已达上限时返回None"""
+        if not self._sql_slots.acquire(blocking=False):
+            return None
+        try:
+            future = self._sql_executor.submit(task)
+        except Exception:
+            self._sql_slots.release()
+            raise
+        future.add_done_callback(lambda _: self._sql_slots.release())
+        return future
+
+    def _submit_sql(self, user_message: str) -> Optional[concurrent.futures.Future]:
+        """提交SQL问答；引擎首次创建（加载词典、连接数据库）也放在后台线程，同样受预算约束"""
+        return self._submit_context(lambda: get_sql_qa_engine().answer(user_message))
+
+    def _route_context(self, user_message: str, collected_info: str, form_data: Optional[dict]) -> str:
+        """
+        预计算游览路线：与SQL问答共用线程池和名额，受 context_budget 限制
+
+        超时或名额用完时不注入路线，由模型自行安排；未完成的计算在后台继续，预热路线规划器。
+        """
+        future = self._submit_context(lambda: build_route_context(user_message, collected_info, form_data))
+        if future is None:
+            self._count_context("route_skipped")
+            print(f"⚠️ [路线规划] 后台任务已达上限 {self.config.context_workers}，本次不预计算路线")
+            return ""
+        try:
+            # build_route_context 自己捕获规划错误，这里只会超时
+            return future.result(timeout=self.config.context_budget)
+        except concurrent.futures.TimeoutError:
+            self._count_context("route_timeouts")
+            print(f"⚠️ [路线规划] 超过上下文预算 {self.config.context_budget * 1000:.0f}ms，本次不预计算路线")
+            return ""
+
+    def _assemble_context(self, user_message: str, memory: RedisSimpleMemory, with_sql: bool):
+        """
+        获取对话历史和SQL问答资料
+
+        SQL问答在后台线程执行，请求线程同时读取对话历史；SQL受 context_budget 限制，
+        超时或出错时返回空资料，不阻塞首个token。未完成的查询会在后台继续执行，
+        结果写入SQL问答缓存供下次使用；这类查询堆积到 CONTEXT_WORKERS 个时，新请求直接跳过SQL。
+
+        Returns:
+            (conversation_history, sql_answer)
+        """
+        started = time.perf_counter()
+        self._count_context("requests")
+        sql_future = self._submit_sql(user_message) if with_sql else None
+        if with_sql and sql_future is None:
+            self._count_context("sql_skipped")
+            print(f"⚠️ [SQL查询] 后台查询已达上限 {self.config.context_workers}，本次不使用SQL资料")
+
+        # 对话历史是生成回答的必要输入，在请求线程读取，不与SQL查询争用线程
+        conversation_history = memory.messages
+
+        sql_answer = ""
+        if sql_future is not None:
+            remaining = max(0.0, self.config.context_budget - (time.perf_counter() - started))
+            try:
+                sql_answer = sql_future.result(timeout=remaining)
+            except concurrent.futures.TimeoutError:
+                self._count_context("sql_timeouts")
+                print(f"⚠️ [SQL查询] 超过上下文预算 {self.config.context_budget * 1000:.0f}ms，本次不使用SQL资料")
+            except Exception as e:
+                self._count_context("sql_errors")
+                print(f"❌ [SQL查询] 查询失败，本次不使用SQL资料: {e}")
+
+        print(f"⏱️ [上下文] 组装耗时 {(time.perf_counter() - started) * 1000:.1f}ms")
+        return conversation_history, sql_answer
+
     def get_response_stream(self, user_message: str, user_email: str, agent_type: str = "general", conv_id: Optional[str] = None, form_data: dict = None,collected_info: str = ""):
         """处理用户请求并返回响应流（支持Redis记忆）"""
         if not conv_id:
@@ -740,12 +835,13 @@ class AgentService:
             session = self.get_or_create_agent_session(user_email, conv_id)
             memory: RedisSimpleMemory = session['memory']
             
-            # 获取对话历史记忆
-            conversation_history = memory.messages
+            # 并行获取对话历史记忆和SQL问答资料
+            conversation_history, answer = self._assemble_context(
+                user_message, memory, with_sql=(agent_type == "general")
+            )
 
             if agent_type == "general":
                 agent = session['normal_agent']
-                answer = myanswer(user_message)
                 if answer == '':
                     print(f"🔍 [SQL查询] 未找到相关信息，使用普通对话智能体处理。")
                     generator = agent.get_response_stream(user_message, conversation_history)
@@ -771,10 +867,13 @@ class AgentService:
                             continue                                     # <— 关键：跳过本轮，其它逻辑留给下一轮
                         yield event
                         
+                    route_context = self._route_context(user_message, info_text, form_data)
                     for txt in planner.get_response_stream(
                             user_message,
                             collected_info=info_text,
-                            conversation_history=conversation_history):
+                            conversation_history=conversation_history,
+                            form_data=form_data,
+                            route_context=route_context):
                         full_response += txt
                         yield txt
                     # return
@@ -846,6 +945,10 @@ class AgentService:
         """获取记忆统计信息"""
         stats = self.redis_memory_manager.get_memory_stats()
         stats["active_agent_sessions"] = len(self.agent_sessions)
+        stats["sql_qa"] = get_sql_qa_stats()
+        with self._context_stats_lock:
+            stats["context"] = dict(self.context_stats)
+        stats["rag"] = get_rag_stats()
         return stats
 
 # =============================================================================
@@ -1,2 +1,167 @@
 # shared_cache.py
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+load_dotenv()
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
+REDIS_PASSWORD = os.getenv("REDIS_PASSWORD") or None
+
 INFO_CACHE: dict[str, dict] = {}
+
+_MISSING = object()
+
+
+class LRUTTLCache:
+    """
+    进程内LRU+TTL缓存，可选叠加一层Redis供所有工作进程共享
+
+    查找顺序：本地LRU -> Redis -> 未命中；Redis中的命中会回填本地。
+    Redis不可用或出错时自动退化为纯本地缓存。
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 600,
+                 redis_client=None, key_prefix: Optional[str] = None):
+        """
+        Args:
+            name: 缓存名称（用于统计信息）
+            maxsize: 本地最多缓存条数
+            ttl: 过期时间（秒）
+            redis_client: Redis客户端，为None时仅使用本地缓存
+            key_prefix: Redis键前缀，默认 "<name>:"
+        """
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.redis_client = redis_client
+        self.key_prefix = key_prefix or f"{name}:"
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.redis_hits = 0
+        self.redis_errors = 0
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """读取缓存，未命中返回 default"""
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+
+        value = self._redis_get(key)
+        if value is not _MISSING:
+            self._local_set(key, value)
+            with self._lock:
+                self.hits += 1
+                self.redis_hits += 1
+            return value
+
+        with self._lock:
+            self.misses += 1
+        return default
+
+    def set(self, key: str, value: Any):
+        """写入缓存（值需可被JSON序列化才能写入Redis）"""
+        self._local_set(key, value)
+        if self.redis_client is not None:
+            try:
+                self.redis_client.setex(self.key_prefix + key, max(1, int(self.ttl)),
+                                        json.dumps(value, ensure_ascii=False))
+            except Exception as e:
+                self.redis_errors += 1
+                print(f"⚠️ [{self.name}] Redis写入失败: {e}")
+
+    def clear(self):
+        """清空本地缓存（Redis中的条目按TTL自然过期）"""
+        with self._lock:
+            self._data.clear()
+
+    def _local_set(self, key: str, value: Any):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def _redis_get(self, key: str) -> Any:
+        if self.redis_client is None:
+            return _MISSING
+        try:
+            raw = self.redis_client.get(self.key_prefix + key)
+        except Exception as e:
+            self.redis_errors += 1
+            print(f"⚠️ [{self.name}] Redis读取失败: {e}")
+            return _MISSING
+        if raw is None:
+            return _MISSING
+        try:
+            return json.loads(raw)
+        except (TypeError, ValueError):
+            return _MISSING
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率等统计信息"""
+        total = self.hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            "using_redis": self.redis_client is not None,
+            "redis_hits": self.redis_hits,
+            "redis_errors": self.redis_errors,
+        }
+
+
+_shared_redis = None
+_shared_redis_pid = None
+_shared_redis_lock = threading.Lock()
+
+def get_shared_redis():
+    """获取当前进程共享的Redis客户端（REDIS_URL），不可用时返回None"""
+    global _shared_redis, _shared_redis_pid
+    if not REDIS_AVAILABLE:
+        return None
+    pid = os.getpid()
+    if _shared_redis_pid != pid:
+        with _shared_redis_lock:
+            if _shared_redis_pid != pid:
+                try:
+                    client = redis.Redis.from_url(
+                        REDIS_URL,
+                        password=REDIS_PASSWORD,
+                        decode_responses=True,
+                        socket_connect_timeout=2,
+                        socket_timeout=2,
+                    )
+                    client.ping()
+                    _shared_redis = client
+                except Exception as e:
+                    print(f"⚠️ 共享缓存Redis连接失败，使用进程内缓存: {e}")
+                    _shared_redis = None
+                _shared_redis_pid = pid
+    return _shared_redis
@@ -1,8 +1,11 @@
 import os
+import threading
 from dotenv import load_dotenv
 from agent.sql.question_processor import QuestionProcessor
-from agent.sql.database import DatabaseManager
+from agent.sql.database import DatabaseManager, DatabaseUnavailableError
 from agent.sql.response_generator import ResponseGenerator
+from agent.sql.result_cache import create_result_cache, make_cache_key
+from agent.sql.intent_gate import IntentGate
 
 
 load_dotenv()
@@ -11,26 +14,97 @@ DB_USER = os.getenv("DB_USER")
 DB_AUTH_PLUGIN = os.getenv("DB_AUTH_PLUGIN", "auth_plugin")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_DATABASE = os.getenv("DB_NAME", "tourism")
+# SQL问答后端：mysql（默认）或 sqlite（本地镜像，见 agent/sql/sqlite_backend.py）
+SQL_QA_BACKEND = os.getenv("SQL_QA_BACKEND", "mysql").lower()
+# 意图门控：与景点无关的问题直接跳过SQL问答（以及大模型规范化）
+SQL_QA_INTENT_GATE = os.getenv("SQL_QA_INTENT_GATE", "true").lower() in ("1", "true", "yes")
+
+
+def create_database_manager() -> DatabaseManager:
+    """按环境变量配置创建数据库管理器"""
+    if SQL_QA_BACKEND == "sqlite":
+        from agent.sql.sqlite_backend import SQLiteDatabaseManager
+        return SQLiteDatabaseManager()
+    return DatabaseManager(DB_HOST, DB_USER, DB_PASSWORD, DB_AUTH_PLUGIN, DB_DATABASE)
+
+
+class SQLQAEngine:
+    """常驻进程的SQL问答引擎：词典只加载一次，数据库连接在多次提问间复用"""
+
+    def __init__(self, db_manager: DatabaseManager = None):
+        # 初始化核心组件（每个进程只做一次）
+        self.db_manager = db_manager or create_database_manager()
+        self.question_processor = QuestionProcessor(self.db_manager)
+        self.response_generator = ResponseGenerator()
+        self.result_cache = create_result_cache()
+        self.intent_gate = IntentGate(self.question_processor) if SQL_QA_INTENT_GATE else None
+        self.db_errors = 0
+
+    def answer(self, user_question: str) -> str:
+        """回答用户问题，未找到相关信息时返回空字符串（数据库连接由连接池管理，可多线程并发调用）"""
+        # 闲聊等无关问题不进入解析，也不会触发大模型规范化
+        if self.intent_gate is not None and not self.intent_gate.is_scenic(user_question):
+            return ""
+
+        # 处理用户问题
+        processed_questions = self.question_processor.process(user_question)
+
+        # 相同的解析结果直接复用之前的回答
+        cache_key = make_cache_key(processed_questions)
+        cached = self.result_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        # 执行数据库查询（只取回答需要的行，排序和行数下推到数据库）
+        limit, order_by = self.response_generator.get_result_spec(processed_questions)
+        try:
+            db_results = self.db_manager.query(processed_questions, limit=limit, order_by=order_by)
+        except DatabaseUnavailableError as e:
+            # 数据库故障不能当作"没有结果"缓存下来
+            self.db_errors += 1
+            print(f"❌ [SQL查询] 数据库不可用，本次跳过SQL问答: {e}")
+            return ""
+
+        # 生成响应
+        response = self.response_generator.generate(processed_questions, db_results)
+        self.result_cache.set(cache_key, response)
+        return response
+
+    def get_stats(self):
+        """获取SQL问答统计信息"""
+        return {
+            "db_pool": self.db_manager.get_pool_stats(),
+            "db_errors": self.db_errors,
+            "intent_gate": self.intent_gate.stats() if self.intent_gate is not None else None,
+            "result_cache": self.result_cache.stats(),
+            "normalization_cache": self.question_processor.normalization_cache.stats(),
+            "negative_normalization_cache": self.question_processor.negative_normalization_cache.stats(),
+        }
+
+
+# 每个工作进程一个引擎实例（懒加载）
+_sql_qa_engine = None
+_sql_qa_engine_pid = None
+_sql_qa_engine_lock = threading.Lock()
+
+def get_sql_qa_engine() -> SQLQAEngine:
+    """获取当前进程的SQL问答引擎（懒加载，fork后自动重建）"""
+    global _sql_qa_engine, _sql_qa_engine_pid
+    pid = os.getpid()
+    if _sql_qa_engine is None or _sql_qa_engine_pid != pid:
+        with _sql_qa_engine_lock:
+            if _sql_qa_engine is None or _sql_qa_engine_pid != pid:
+                # gunicorn preload 后 fork 出的子进程不能沿用父进程的连接
+                _sql_qa_engine = SQLQAEngine()
+                _sql_qa_engine_pid = pid
+    return _sql_qa_engine
+
+def get_sql_qa_stats():
+    """获取当前进程SQL问答引擎的统计信息（引擎尚未创建时返回None）"""
+    if _sql_qa_engine is None or _sql_qa_engine_pid != os.getpid():
+        return None
+    return _sql_qa_engine.get_stats()
 
 def myanswer(user_question: str) -> str:
-    # 配置数据库连接信息
-    host = DB_HOST
-    user = DB_USER
-    password = DB_PASSWORD
-    auth_plugin = DB_AUTH_PLUGIN
-    database = DB_DATABASE
-
-    # 初始化核心组件
-    db_manager = DatabaseManager(host, user, password, auth_plugin, database)
-    question_processor = QuestionProcessor(db_manager)
-    response_generator = ResponseGenerator()
-    # 处理用户问题
-    processed_questions = question_processor.process(user_question)
-    
-    # 执行数据库查询
-    db_results = db_manager.query(processed_questions)
-        
-    # 生成响应
-    response = response_generator.generate(processed_questions, db_results)
-    
-    return response
\ No newline at end of file
+    """[兼容性接口] 使用进程级SQL问答引擎回答问题"""
+    return get_sql_qa_engine().answer(user_question)
@@ -0,0 +1,239 @@
+"""
+SQL问答压测模块
+用 spot_dict.txt / scenic_dictionary.json 中的景点名生成贴近真实的问题语料
+（景点信息、城市景点、复合条件、附近景点、无法识别），在本地后端上逐段计时
+QuestionProcessor.process -> DatabaseManager.query -> ResponseGenerator.generate，
+输出各阶段 p50/p95/p99 延迟和吞吐量；指定基线文件时，任一阶段退化超过阈值则以非零状态退出。
+
+用法：
+    python -m agent.sql.benchmark                                   # SQLite镜像，默认2000个问题
+    python -m agent.sql.benchmark --save-baseline baseline.json     # 保存基线
+    python -m agent.sql.benchmark --baseline baseline.json --threshold 0.2
+"""
+
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from agent.sql.question_processor import QuestionProcessor
+from agent.sql.response_generator import ResponseGenerator
+
+SQL_DIR = Path(__file__).resolve().parent
+STAGES = ["process", "query", "generate", "total"]
+PERCENTILES = [50, 95, 99]
+
+# 各类问题在语料中的占比
+CATEGORY_WEIGHTS = {
+    "spot_info": 0.35,
+    "city_spots": 0.15,
+    "compound": 0.2,
+    "nearby": 0.2,
+    "unknown": 0.1,
+}
+
+SPOT_INFO_TEMPLATES = [
+    "{spot}的地址在哪里", "{spot}的电话是多少", "{spot}的营业时间", "{spot}评分怎么样",
+    "{spot}门票价格多少", "介绍一下{spot}", "{spot}所在城市是哪里", "{spot}",
+]
+CITY_TEMPLATES = ["{city}有哪些景点", "{city}有什么景点", "{city}的旅游景点", "{city}景点有哪些"]
+COMPOUND_TEMPLATES = [
+    "{city}门票低于{price}元的景点", "{city}评分{rating}以上的景点", "{city}评分最高的{type}",
+    "{city}门票低于{price}元且评分不低于{rating}的景点", "{city}免费的{type}", "{city}有哪些{type}",
+]
+NEARBY_TEMPLATES = [
+    "{spot}附近有什么好玩的", "{spot}附近{radius}公里内的景点", "{spot}附近{count}个景点",
+    "{spot}附近{meters}米以内有什么",
+]
+UNKNOWN_QUESTIONS = [
+    "今天天气怎么样", "帮我规划一个三天的行程", "推荐一家好吃的餐厅", "怎么坐地铁去机场",
+    "酒店多少钱一晚", "你好", "有什么旅游攻略", "周末去哪玩比较好",
+]
+
+
+def load_spot_names(limit: int = 5000, seed: int = 0) -> List[str]:
+    """从 spot_dict.txt（jieba词典格式：名称 词频）和 scenic_dictionary.json 读取景点名"""
+    names = set()
+    with open(SQL_DIR / "spot_dict.txt", encoding="utf-8") as f:
+        for line in f:
+            parts = line.rsplit(maxsplit=1)
+            if parts:
+                names.add(parts[0].strip())
+    with open(SQL_DIR / "scenic_dictionary.json", encoding="utf-8") as f:
+        names.update(json.load(f))
+    names = sorted(n for n in names if n)
+    random.Random(seed).shuffle(names)
+    return names[:limit]
+
+
+def build_corpus(cities: List[str], spot_names: List[str], size: int = 2000, seed: int = 42) -> List[Tuple[str, str]]:
+    """生成 (类别, 问题) 语料，固定随机种子保证多次运行可比"""
+    rng = random.Random(seed)
+    short_cities = [c[:-1] if c.endswith("市") else c for c in cities]
+    spot_types = QuestionProcessor.SPOT_TYPES
+
+    def city():
+        return rng.choice(cities + short_cities)
+
+    corpus = []
+    categories = list(CATEGORY_WEIGHTS)
+    weights = [CATEGORY_WEIGHTS[c] for c in categories]
+    for category in rng.choices(categories, weights=weights, k=size):
+        if category == "spot_info":
+            question = rng.choice(SPOT_INFO_TEMPLATES).format(spot=rng.choice(spot_names))
+        elif category == "city_spots":
+            question = rng.choice(CITY_TEMPLATES).format(city=city())
+        elif category == "compound":
+            question = rng.choice(COMPOUND_TEMPLATES).format(
+                city=city(),
+                price=rng.choice([0, 20, 50, 100]),
+                rating=rng.choice([4, 4.5, 4.8]),
+                type=rng.choice(spot_types),
+            )
+        elif category == "nearby":
+            question = rng.choice(NEARBY_TEMPLATES).format(
+                spot=rng.choice(spot_names),
+                radius=rng.choice([1, 3, 5, 10]),
+                count=rng.choice([3, 5, 10]),
+                meters=rng.choice([500, 800]),
+            )
+        else:
+            question = rng.choice(UNKNOWN_QUESTIONS)
+        corpus.append((category, question))
+    return corpus
+
+
+def _summarize(samples_ms: List[float], wall_seconds: float = None) -> Dict:
+    values = np.asarray(samples_ms, dtype=np.float64)
+    summary = {"count": int(values.size)}
+    if values.size:
+        for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+            summary[f"p{p}_ms"] = round(float(v), 4)
+        summary["mean_ms"] = round(float(values.mean()), 4)
+        summary["max_ms"] = round(float(values.max()), 4)
+    if wall_seconds:
+        summary["throughput_qps"] = round(values.size / wall_seconds, 1)
+    return summary
+
+
+def run_benchmark(db_manager, corpus: List[Tuple[str, str]], warmup: int = 100, use_llm: bool = False) -> Dict:
+    """逐个问题执行完整流水线（不经过结果缓存），返回各阶段及各类问题的延迟统计"""
+    processor = QuestionProcessor(db_manager, use_llm=use_llm)
+    generator = ResponseGenerator()
+
+    def run_one(question):
+        t0 = time.perf_counter()
+        processed = processor.process(question)
+        t1 = time.perf_counter()
+        limit, order_by = generator.get_result_spec(processed)
+        results = db_manager.query(processed, limit=limit, order_by=order_by)
+        t2 = time.perf_counter()
+        response = generator.generate(processed, results)
+        t3 = time.perf_counter()
+        return (t1 - t0, t2 - t1, t3 - t2, t3 - t0), processed[0]["type"], bool(response)
+
+    # 预热：加载空间索引、快照等懒加载结构
+    for _, question in corpus[:warmup]:
+        run_one(question)
+
+    samples = {stage: [] for stage in STAGES}
+    by_category = {}
+    answered = 0
+    parsed_types = {}
+    started = time.perf_counter()
+    for category, question in corpus:
+        timings, parsed_type, has_answer = run_one(question)
+        for stage, seconds in zip(STAGES, timings):
+            samples[stage].append(seconds * 1000)
+        by_category.setdefault(category, []).append(timings[-1] * 1000)
+        parsed_types[parsed_type] = parsed_types.get(parsed_type, 0) + 1
+        answered += has_answer
+    wall_seconds = time.perf_counter() - started
+
+    return {
+        "questions": len(corpus),
+        "answered": answered,
+        "wall_seconds": round(wall_seconds, 3),
+        "parsed_types": parsed_types,
+        "stages": {
+            stage: _summarize(values, wall_seconds if stage == "total" else None)
+            for stage, values in samples.items()
+        },
+        "categories": {category: _summarize(values) for category, values in sorted(by_category.items())},
+    }
+
+
+def compare_with_baseline(report: Dict, baseline: Dict, metric: str = "p95_ms",
+                          threshold: float = 0.2, min_delta_ms: float = 0.05) -> List[str]:
+    """
+    与基线比较，返回退化说明列表（为空表示通过）
+
+    Args:
+        metric: 比较的统计量，如 p50_ms / p95_ms / p99_ms
+        threshold: 允许的相对退化比例，0.2 表示慢20%以内不算退化
+        min_delta_ms: 绝对差值低于该值时忽略（亚毫秒级阶段的计时噪声）
+    """
+    regressions = []
+    for stage in STAGES:
+        current = report["stages"].get(stage, {}).get(metric)
+        previous = baseline.get("stages", {}).get(stage, {}).get(metric)
+        if current is None or previous is None:
+            continue
+        if current > previous * (1 + threshold) and current - previous > min_delta_ms:
+            regressions.append(
+                f"{stage} {metric}: {previous:.4f}ms -> {current:.4f}ms (+{(current / previous - 1) * 100 if previous else float('inf'):.1f}%)"
+            )
+    return regressions
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="SQL问答流水线压测")
+    parser.add_argument("--backend", choices=["sqlite", "mysql"], default="sqlite", help="查询后端（默认本地SQLite镜像）")
+    parser.add_argument("--questions", type=int, default=2000, help="语料问题数")
+    parser.add_argument("--warmup", type=int, default=100, help="预热问题数")
+    parser.add_argument("--seed", type=int, default=42, help="语料随机种子")
+    parser.add_argument("--llm", action="store_true", help="无法解析的问题调用大模型规范化（默认关闭，避免网络开销干扰结果）")
+    parser.add_argument("--baseline", help="基线报告路径，退化超过阈值时以状态码1退出")
+    parser.add_argument("--save-baseline", help="把本次报告保存为基线")
+    parser.add_argument("--metric", default="p95_ms", help="与基线比较的统计量（默认 p95_ms）")
+    parser.add_argument("--threshold", type=float, default=0.2, help="允许的相对退化比例（默认0.2）")
+    args = parser.parse_args()
+
+    if args.backend == "sqlite":
+        from agent.sql.sqlite_backend import SQLiteDatabaseManager
+        db_manager = SQLiteDatabaseManager()
+    else:
+        from agent.sql.attraction_ezqa_service import DB_AUTH_PLUGIN, DB_DATABASE, DB_HOST, DB_PASSWORD, DB_USER
+        from agent.sql.database import DatabaseManager
+        db_manager = DatabaseManager(DB_HOST, DB_USER, DB_PASSWORD, DB_AUTH_PLUGIN, DB_DATABASE)
+
+    corpus = build_corpus(db_manager.get_all_cities(), load_spot_names(), size=args.questions, seed=args.seed)
+    report = run_benchmark(db_manager, corpus, warmup=args.warmup, use_llm=args.llm)
+    report["backend"] = args.backend
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✅ 基线已保存: {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report, baseline, metric=args.metric, threshold=args.threshold)
+        if regressions:
+            print("❌ 性能退化：")
+            for line in regressions:
+                print(f"   {line}")
+            sys.exit(1)
+        print(f"✅ 各阶段 {args.metric} 均未超过基线 {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+数据库连接池模块
+线程安全的有界连接池：取出前预检（pre-ping）、超龄回收（recycle）、失效连接自动丢弃，并记录等待时间等指标
+"""
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Optional
+
+
+class PoolTimeoutError(Exception):
+    """在超时时间内没有等到可用连接"""
+
+
+class _PooledConnection:
+    """连接及其创建时间"""
+
+    __slots__ = ("raw", "created_at")
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.created_at = time.monotonic()
+
+
+class ConnectionPool:
+    """线程安全的有界连接池（后进先出，优先复用最近用过的热连接）"""
+
+    def __init__(self, creator: Callable[[], Any], maxsize: int = 10, timeout: float = 5.0,
+                 recycle: Optional[float] = 3600, pre_ping: bool = True,
+                 ping: Optional[Callable[[Any], None]] = None, name: str = "db"):
+        """
+        Args:
+            creator: 创建新连接的函数
+            maxsize: 最大连接数（空闲 + 使用中）
+            timeout: 等待可用连接的最长时间（秒）
+            recycle: 连接最长存活时间（秒），超过后在下次取出时重建；None 表示不回收
+            pre_ping: 取出连接前是否先检查连接可用
+            ping: 检查连接的函数，失败时应抛出异常；默认调用 conn.ping()
+            name: 连接池名称（用于日志和统计）
+        """
+        self.creator = creator
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.ping = ping or (lambda conn: conn.ping())
+        self.name = name
+
+        self._idle = deque()
+        self._size = 0  # 已创建且未关闭的连接数
+        self._cond = threading.Condition()
+
+        # 指标
+        self.created = 0
+        self.closed = 0
+        self.in_use = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.ping_failures = 0
+        self.recycled = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def acquire(self) -> _PooledConnection:
+        """取出一个可用连接，池满时最多等待 timeout 秒"""
+        started = time.monotonic()
+        entry = None
+        with self._cond:
+            while True:
+                if self._idle:
+                    entry = self._idle.pop()
+                    break
+                if self._size < self.maxsize:
+                    self._size += 1  # 先占位，在锁外创建连接
+                    break
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolTimeoutError(f"[{self.name}] 等待数据库连接超时（{self.timeout}s，池大小 {self.maxsize}）")
+                self._cond.wait(remaining)
+
+        try:
+            if entry is None:
+                entry = self._create()
+            elif self.recycle is not None and time.monotonic() - entry.created_at > self.recycle:
+                self.recycled += 1
+                self._close(entry)
+                entry = self._create()
+            elif self.pre_ping:
+                try:
+                    self.ping(entry.raw)
+                except Exception:
+                    self.ping_failures += 1
+                    self._close(entry)
+                    entry = self._create()
+        except Exception:
+            # 创建失败，释放占位
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+
+        waited = time.monotonic() - started
+        with self._cond:
+            self.in_use += 1
+            self.checkouts += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+        return entry
+
+    def release(self, entry: _PooledConnection, discard: bool = False):
+        """归还连接；discard=True 时直接关闭（如查询中出现连接错误）"""
+        if discard:
+            self._close(entry)
+        with self._cond:
+            self.in_use -= 1
+            if discard:
+                self._size -= 1
+            else:
+                self._idle.append(entry)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """以上下文管理器方式借用连接，出现异常时丢弃该连接"""
+        entry = self.acquire()
+        try:
+            yield entry.raw
+        except BaseException:
+            self.release(entry, discard=True)
+            raise
+        else:
+            self.release(entry)
+
+    def close_all(self):
+        """关闭所有空闲连接"""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for entry in idle:
+            self._close(entry)
+
+    def _create(self) -> _PooledConnection:
+        entry = _PooledConnection(self.creator())
+        with self._cond:
+            self.created += 1
+        return entry
+
+    def _close(self, entry: _PooledConnection):
+        try:
+            entry.raw.close()
+        except Exception:
+            pass
+        with self._cond:
+            self.closed += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """连接池指标"""
+        with self._cond:
+            return {
+                "name": self.name,
+                "maxsize": self.maxsize,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self.in_use,
+                "created": self.created,
+                "closed": self.closed,
+                "recycled": self.recycled,
+                "ping_failures": self.ping_failures,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_time_avg_ms": round(self.wait_time_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_time_max_ms": round(self.wait_time_max * 1000, 3),
+            }
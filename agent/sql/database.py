@@ -1,45 +1,110 @@
+import os
+import threading
 import pymysql
 import math
+from agent.sql.spatial_index import SpotSpatialIndex
+from agent.sql.opening_hours import OpeningHoursIndex
+from agent.sql.snapshot import get_snapshot
+from agent.sql.rollups import get_rollups
+from agent.sql.connection_pool import ConnectionPool, PoolTimeoutError
+
+# 附近景点默认的起始搜索半径（公里）
+NEARBY_DISTANCE = float(os.getenv("NEARBY_DISTANCE", "5.0"))
+
+# 连接池配置
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "5"))
+DB_POOL_RECYCLE = float(os.getenv("DB_POOL_RECYCLE", "3600"))
+DB_QUERY_TIMEOUT = int(os.getenv("DB_QUERY_TIMEOUT", "10"))
+
+# 可下推到SQL的排序方式（同分按id排序保证结果稳定，与列式快照一致；同向排序可直接倒序扫描 (city_id, rating) 索引）
+ORDER_BY_CLAUSES = {
+    "rating_desc": "s.rating DESC, s.id DESC",
+}
+
+
+class DatabaseUnavailableError(Exception):
+    """数据库不可用（连接失败、重试后仍断开或等待连接超时）"""
+
 
 class DatabaseManager:
+    # 连接类错误：换一个新连接重试一次
+    RETRYABLE_ERRORS = (pymysql.err.OperationalError, pymysql.err.InterfaceError)
+
     def __init__(self, host, user, password, auth_plugin, database):
         self.host = host
         self.user = user
         self.password = password
         self.database = database
-        self.connection = None
-        self._connect()
+        self._init_pool("mysql")
+
+    def _init_pool(self, name):
+        """创建连接池并预热一个连接：数据库不可用时在初始化阶段就报错"""
+        self._spatial_index = None  # 附近查询用的经纬度网格索引（懒加载）
+        self._opening_index = None  # “现在开着的景点”查询用的营业区间索引（懒加载）
+        self._index_lock = threading.Lock()
+        self.pool = ConnectionPool(
+            self._connect,
+            maxsize=DB_POOL_SIZE,
+            timeout=DB_POOL_TIMEOUT,
+            recycle=DB_POOL_RECYCLE,
+            ping=self._ping,
+            name=name,
+        )
+        self.pool.release(self.pool.acquire())
 
     def _connect(self):
         """建立数据库连接"""
-        try:
-            self.connection = pymysql.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database,
-                cursorclass=pymysql.cursors.DictCursor
-            )
-        except Exception as e:
-            raise
+        return pymysql.connect(
+            host=self.host,
+            user=self.user,
+            password=self.password,
+            database=self.database,
+            cursorclass=pymysql.cursors.DictCursor,
+            # 长连接：每条查询都能看到最新数据，而不是停留在首个事务的快照
+            autocommit=True,
+            connect_timeout=DB_QUERY_TIMEOUT,
+            read_timeout=DB_QUERY_TIMEOUT,
+            write_timeout=DB_QUERY_TIMEOUT,
+        )
+
+    def _ping(self, connection):
+        """检查连接是否可用，失败时抛出异常"""
+        connection.ping(reconnect=False)
+
+    def _run(self, connection, query, params):
+        """在给定连接上执行查询"""
+        with connection.cursor() as cursor:
+            cursor.execute(query, params)
+            return cursor.fetchall()
 
     def _execute_query(self, query, params=None):
-        """执行SQL查询并返回结果"""
-        if not self.connection:
-            self._connect()
-            
-        try:
-            with self.connection.cursor() as cursor:
-                cursor.execute(query, params)
-                results = cursor.fetchall()
-                return results
-        except Exception:
-            return []
+        """执行SQL查询并返回结果；连接断开时换新连接重试一次，仍失败则抛出 DatabaseUnavailableError"""
+        for attempt in range(2):
+            try:
+                with self.pool.connection() as connection:
+                    return self._run(connection, query, params)
+            except PoolTimeoutError as e:
+                raise DatabaseUnavailableError(str(e)) from e
+            except self.RETRYABLE_ERRORS as e:
+                # 出错的连接已被连接池丢弃
+                if attempt == 0:
+                    print(f"⚠️ [SQL查询] 数据库连接异常，重连后重试: {e}")
+                    continue
+                raise DatabaseUnavailableError(f"数据库连接失败: {e}") from e
+            except Exception as e:
+                print(f"❌ [SQL查询] 查询执行失败: {e}")
+                raise
+
+    def get_pool_stats(self):
+        """获取连接池指标"""
+        return self.pool.stats()
 
     def _get_common_query(self):
         """返回通用的景点查询SQL语句"""
         return """
             SELECT
+                s.id AS id,
                 s.name AS name,
                 s.type AS type,
                 s.rating AS rating,
@@ -57,8 +122,24 @@ class DatabaseManager:
             JOIN provinces p ON c.province_id = p.id
         """
 
-    def query(self, processed_questions):
-        """执行查询并返回结果"""
+    def _get_order_limit_clause(self, limit=None, order_by=None):
+        """把回答需要的行数和排序方式转换为 ORDER BY / LIMIT 子句"""
+        clause = ""
+        if order_by:
+            clause += f" ORDER BY {ORDER_BY_CLAUSES[order_by]}"
+        if limit is not None:
+            clause += f" LIMIT {int(limit)}"
+        return clause
+
+    def query(self, processed_questions, limit=None, order_by=None):
+        """
+        执行查询并返回结果
+
+        Args:
+            processed_questions: 解析后的问题列表
+            limit: 城市/复合查询最多返回的行数，None 表示不限制
+            order_by: 城市/复合查询的排序方式（ORDER_BY_CLAUSES 的键）
+        """
         results = []
         
         for question in processed_questions:
@@ -66,14 +147,25 @@ class DatabaseManager:
             
             if query_type == "city_spots":
                 city_name = question.get("city_name")
+                province_name = question.get("province_name")
+                # 评分排行直接查预计算的汇总表
+                rollups = get_rollups()
+                if rollups is not None and order_by == "rating_desc":
+                    rollup_results = rollups.lookup(city_name=city_name, province_name=province_name, limit=limit)
+                    if rollup_results is not None:
+                        results.extend(rollup_results)
+                        continue
                 if city_name:
-                    query = self._get_common_query() + " WHERE c.name = %s"
+                    query = self._get_common_query() + " WHERE c.name = %s" + self._get_order_limit_clause(limit, order_by)
                     city_results = self._execute_query(query, (city_name,))
                     results.extend(city_results)
+                elif province_name:
+                    query = self._get_common_query() + " WHERE p.name = %s" + self._get_order_limit_clause(limit, order_by)
+                    results.extend(self._execute_query(query, (province_name,)))
                     
             elif query_type == "compound_filter":
                 keywords = question.get("keywords", [])
-                compound_results = self._execute_compound_filter(keywords)
+                compound_results = self._execute_compound_filter(keywords, limit=limit, order_by=order_by)
                 results.extend(compound_results)
                 
             elif query_type == "spot_info":
@@ -100,59 +192,119 @@ class DatabaseManager:
             
             elif query_type == "nearby_spots":
                 spot_name = question.get("spot_name")
-                nearby_results = self._execute_nearby_spots_query(spot_name)
+                nearby_results = self._execute_nearby_spots_query(
+                    spot_name,
+                    radius_km=question.get("radius_km"),
+                    top_k=question.get("top_k", 5),
+                )
                 results.extend(nearby_results)
+
+            elif query_type == "open_spots":
+                open_results = self._execute_open_spots_query(
+                    question.get("weekday"),
+                    question.get("minute"),
+                    question.get("day_of_year"),
+                    city_name=question.get("city_name"),
+                    limit=limit,
+                )
+                results.extend(open_results)
         
         return results
 
-    def _execute_nearby_spots_query(self, spot_name):
-        """执行附近景点查询，基于经纬度计算距离"""
-        # 首先查询目标景点的经纬度
-        query = "SELECT longitude, latitude FROM scenic_spots WHERE name = %s"
-        result = self._execute_query(query, (spot_name,))
-        
-        if not result:
+    def _get_spatial_index(self):
+        """获取经纬度网格索引，首次调用时从数据库加载坐标"""
+        if self._spatial_index is None:
+            with self._index_lock:
+                if self._spatial_index is None:
+                    rows = self._execute_query("SELECT id, name, latitude, longitude, rating FROM scenic_spots")
+                    if not rows:
+                        return None
+                    self._spatial_index = SpotSpatialIndex.from_rows(rows)
+        return self._spatial_index
+
+    def _execute_nearby_spots_query(self, spot_name, radius_km=None, top_k=5):
+        """执行附近景点查询：网格索引按包围盒裁剪候选，再按Haversine距离排序"""
+        spatial_index = self._get_spatial_index()
+        if spatial_index is None:
             return []
-            
-        target_longitude = result[0]['longitude']
-        target_latitude = result[0]['latitude']
-        
-        # 使用Haversine公式计算距离
-        # 注意：不同数据库系统对三角函数的支持可能不同，这里使用MySQL的函数
-        distance_query = f"""
-            SELECT
-                s.name AS name,
-                s.type AS type,
-                s.rating AS rating,
-                s.address AS address,
-                s.cost AS cost,
-                s.open_time_start AS open_time_start,
-                s.open_time_end AS open_time_end,
-                s.opentime_today AS opentime_today,
-                s.opentime_week AS opentime_week,
-                s.tel AS tel,
-                c.name AS city_name,
-                p.name AS province_name,
-                -- Haversine公式计算距离（单位：公里）
-                6371 * 2 * ASIN(SQRT(
-                    POWER(SIN((s.latitude - {target_latitude}) * PI()/180 / 2), 2) +
-                    COS(s.latitude * PI()/180) * COS({target_latitude} * PI()/180) *
-                    POWER(SIN((s.longitude - {target_longitude}) * PI()/180 / 2), 2)
-                )) AS distance
-            FROM scenic_spots s
-            JOIN cities c ON s.city_id = c.id
-            JOIN provinces p ON c.province_id = p.id
-            WHERE s.name != %s
-            ORDER BY distance ASC, s.rating DESC
-            LIMIT 5
-        """
-        
-        return self._execute_query(distance_query, (spot_name,))
 
-    def _execute_compound_filter(self, keywords):
+        # 目标景点的经纬度直接从索引中获取
+        location = spatial_index.locate(spot_name)
+        if location is None:
+            return []
+        target_latitude, target_longitude = location
+
+        neighbours = spatial_index.query(
+            target_latitude,
+            target_longitude,
+            radius_km=radius_km,
+            top_k=top_k,
+            exclude_name=spot_name,
+            initial_radius_km=NEARBY_DISTANCE,
+        )
+        if not neighbours:
+            return []
+
+        # 只为最终入选的景点取完整信息
+        placeholders = ", ".join(["%s"] * len(neighbours))
+        query = self._get_common_query() + f" WHERE s.id IN ({placeholders})"
+        rows = {row["id"]: row for row in self._execute_query(query, tuple(spot_id for spot_id, _ in neighbours))}
+
+        results = []
+        for spot_id, distance in neighbours:
+            row = rows.get(spot_id)
+            if row is not None:
+                row["distance"] = distance
+                results.append(row)
+        return results
+
+    def _get_opening_index(self):
+        """获取营业区间索引，首次调用时从数据库加载并解析营业时间"""
+        if self._opening_index is None:
+            with self._index_lock:
+                if self._opening_index is None:
+                    rows = self._execute_query("""
+                        SELECT s.id AS id, s.rating AS rating, c.name AS city_name,
+                               s.open_time_start AS open_time_start, s.open_time_end AS open_time_end,
+                               s.opentime_today AS opentime_today, s.opentime_week AS opentime_week
+                        FROM scenic_spots s
+                        JOIN cities c ON s.city_id = c.id
+                    """)
+                    if not rows:
+                        return None
+                    self._opening_index = OpeningHoursIndex.from_rows(rows)
+        return self._opening_index
+
+    def _execute_open_spots_query(self, weekday, minute, day_of_year, city_name=None, limit=None):
+        """执行营业中景点查询：区间索引筛出指定时刻营业的景点，再只为入选景点取完整信息"""
+        opening_index = self._get_opening_index()
+        if opening_index is None:
+            return []
+        spot_ids = opening_index.open_at(weekday, minute, day_of_year, city_name=city_name, top_k=limit)
+        if not spot_ids:
+            return []
+
+        placeholders = ", ".join(["%s"] * len(spot_ids))
+        query = self._get_common_query() + f" WHERE s.id IN ({placeholders})"
+        rows = {row["id"]: row for row in self._execute_query(query, tuple(spot_ids))}
+        return [rows[spot_id] for spot_id in spot_ids if spot_id in rows]
+
+    def _execute_compound_filter(self, keywords, limit=None, order_by=None):
         """执行复合条件查询，合并所有条件到一个SQL查询中"""
         if not keywords:
             return []
+
+        # 城市/省份 + 免费/收费/类型/评分下限的排行直接查汇总表
+        rollups = get_rollups()
+        if rollups is not None and order_by == "rating_desc":
+            rollup_results = rollups.compound_lookup(keywords, limit=limit)
+            if rollup_results is not None:
+                return rollup_results
+
+        # 配置了列式快照时，直接在进程内完成过滤，省去一次数据库往返（快照结果本身按评分降序）
+        snapshot = get_snapshot()
+        if snapshot is not None and order_by in (None, "rating_desc"):
+            return snapshot.compound_filter(keywords, top_k=limit)
             
         # 构建SQL查询条件和参数
         conditions = []
@@ -163,9 +315,13 @@ class DatabaseManager:
             
             if query_type == "city_spots":
                 city_name = keyword.get("city_name")
+                province_name = keyword.get("province_name")
                 if city_name:
                     conditions.append("c.name = %s")
                     params.append(city_name)
+                elif province_name:
+                    conditions.append("p.name = %s")
+                    params.append(province_name)
                     
             elif query_type == "ticket_price":
                 price_info = keyword.get("price")
@@ -182,6 +338,12 @@ class DatabaseManager:
                     value = rating_info.get("value")
                     conditions.append(f"s.rating {operator} %s")
                     params.append(value)
+
+            elif query_type == "spot_type":
+                spot_type = keyword.get("spot_type")
+                if spot_type:
+                    conditions.append("s.type LIKE %s")
+                    params.append(f"%{spot_type}%")
         
         # 构建完整SQL查询
         base_query = self._get_common_query()
@@ -191,6 +353,7 @@ class DatabaseManager:
             full_query = f"{base_query} WHERE {where_clause}"
         else:
             full_query = base_query
+        full_query += self._get_order_limit_clause(limit, order_by)
         
         # 执行单个查询
         return self._execute_query(full_query, tuple(params))
@@ -201,6 +364,12 @@ class DatabaseManager:
         results = self._execute_query(query)
         return [row["name"] for row in results]
 
+    def get_all_provinces(self):
+        """获取所有省份名称"""
+        query = "SELECT name FROM provinces"
+        results = self._execute_query(query)
+        return [row["name"] for row in results]
+
     def get_all_spots(self):
         """获取所有景点名称"""
         query = "SELECT name FROM scenic_spots"
@@ -0,0 +1,154 @@
+"""
+实体匹配模块
+基于Aho-Corasick自动机，一次线性扫描即可从问题中找出所有景点/城市名称
+"""
+
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class EntityMatcher:
+    """Aho-Corasick多模式匹配器，返回最长且互不重叠的实体"""
+
+    def __init__(self, entities: Optional[Iterable] = None):
+        """
+        初始化匹配器
+
+        Args:
+            entities: 实体名称集合，或 {匹配词: 返回值} 映射（如 简称 -> 全称）
+        """
+        self._goto: List[Dict[str, int]] = [{}]  # 状态转移表
+        self._fail: List[int] = [0]  # 失败指针
+        self._output: List[Optional[Tuple[int, str]]] = [None]  # 以该状态结尾的模式 (长度, 返回值)
+        self._dict_link: List[int] = [0]  # 沿失败链最近的输出状态
+        self._built = False
+        self.size = 0
+
+        if entities is not None:
+            items = entities.items() if isinstance(entities, dict) else ((e, e) for e in entities)
+            for word, value in items:
+                self.add(word, value)
+            self.build()
+
+    def add(self, word: str, value: Optional[str] = None):
+        """添加一个模式，build() 之前调用"""
+        if not word:
+            return
+        state = 0
+        for char in word:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+                self._dict_link.append(0)
+            state = next_state
+        if self._output[state] is None:
+            self.size += 1
+        self._output[state] = (len(word), word if value is None else value)
+        self._built = False
+
+    def build(self):
+        """按BFS顺序计算失败指针和输出链接"""
+        queue = deque()
+        for next_state in self._goto[0].values():
+            self._fail[next_state] = 0
+            self._dict_link[next_state] = 0
+            queue.append(next_state)
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._goto[fail].get(char, 0)
+                if fail == next_state:
+                    fail = 0
+                self._fail[next_state] = fail
+                self._dict_link[next_state] = fail if self._output[fail] is not None else self._dict_link[fail]
+        self._built = True
+
+    def iter_matches(self, text: str):
+        """逐个产出所有匹配 (start, end, value)，允许重叠"""
+        if not self._built:
+            self.build()
+        goto, fail, output, dict_link = self._goto, self._fail, self._output, self._dict_link
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            node = state if output[state] is not None else dict_link[state]
+            while node:
+                length, value = output[node]
+                yield i + 1 - length, i + 1, value
+                node = dict_link[node]
+
+    def find_all(self, text: str) -> List[Tuple[int, int, str]]:
+        """返回最左最长且互不重叠的匹配列表 [(start, end, value), ...]"""
+        matches = sorted(self.iter_matches(text), key=lambda m: (m[0], m[0] - m[1]))
+        selected = []
+        last_end = 0
+        for start, end, value in matches:
+            if start >= last_end:
+                selected.append((start, end, value))
+                last_end = end
+        return selected
+
+    def longest(self, text: str) -> Optional[str]:
+        """返回文本中最长的实体（长度相同取最靠前的），没有则返回None"""
+        best = None
+        for start, end, value in self.iter_matches(text):
+            if best is None or (end - start, -start) > (best[1] - best[0], -best[0]):
+                best = (start, end, value)
+        return best[2] if best else None
+
+    def __len__(self):
+        return self.size
+
+
+def _benchmark(repeat: int = 200):
+    """与原先逐个 `in` 判断的循环做对比"""
+    import json
+    import random
+    import time
+    from pathlib import Path
+
+    names = json.loads((Path(__file__).parent / "scenic_dictionary.json").read_text(encoding="utf-8"))
+    spot_dict = set(names)
+
+    start = time.perf_counter()
+    matcher = EntityMatcher(spot_dict)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    random.seed(0)
+    templates = ["{}的门票多少钱", "{}附近有什么好玩的", "请问{}的开放时间和电话", "北京有哪些景点", "今天天气怎么样"]
+    questions = [random.choice(templates).format(random.choice(names)) for _ in range(repeat)]
+
+    def loop_extract(question):
+        for spot in spot_dict:
+            if spot in question:
+                return spot
+        return None
+
+    start = time.perf_counter()
+    for question in questions:
+        loop_extract(question)
+    loop_ms = (time.perf_counter() - start) * 1000 / len(questions)
+
+    start = time.perf_counter()
+    for question in questions:
+        matcher.longest(question)
+    matcher_ms = (time.perf_counter() - start) * 1000 / len(questions)
+
+    print(f"📚 词典规模: {len(spot_dict)} 个景点，自动机状态数: {len(matcher._goto)}，构建耗时 {build_ms:.1f} ms")
+    print(f"🐢 逐个 in 判断: {loop_ms:.3f} ms/问题")
+    print(f"🚀 Aho-Corasick: {matcher_ms:.4f} ms/问题（约 {loop_ms / max(matcher_ms, 1e-9):.0f} 倍）")
+
+
+if __name__ == "__main__":
+    _benchmark()
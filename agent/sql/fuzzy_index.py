@@ -0,0 +1,141 @@
+"""
+景点名模糊索引
+基于字符二元组（bigram）倒排索引召回候选景点，再用近似子串编辑距离校验，
+在不调用大模型的情况下纠正问题中写错一两个字的景点名（如“天坛公圆”、“八达玲长城”、“故工博物院”）。
+"""
+
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+def _bigrams(text: str) -> List[str]:
+    return [text[i:i + 2] for i in range(len(text) - 1)]
+
+
+def substring_edit_distance(pattern: str, text: str) -> int:
+    """pattern 与 text 中任意子串之间的最小编辑距离（Sellers 算法）"""
+    previous = [0] * (len(text) + 1)  # 匹配可以从 text 的任意位置开始
+    for i, p_char in enumerate(pattern, 1):
+        current = [i] + [0] * len(text)
+        for j, t_char in enumerate(text, 1):
+            current[j] = min(
+                previous[j - 1] + (p_char != t_char),
+                previous[j] + 1,
+                current[j - 1] + 1,
+            )
+        previous = current
+    return min(previous)
+
+
+def window_hamming_distance(pattern: str, text: str) -> int:
+    """pattern 与 text 中等长子串之间的最小替换次数（只允许错字，不允许多字少字）"""
+    size = len(pattern)
+    if size > len(text):
+        return size
+    return min(
+        sum(a != b for a, b in zip(pattern, text[start:start + size]))
+        for start in range(len(text) - size + 1)
+    )
+
+
+class FuzzySpotIndex:
+    """景点名的 bigram 倒排索引"""
+
+    def __init__(self, names: Dict[str, str], min_length: int = 4, min_score: float = 0.75,
+                 max_candidates: int = 8, substitution_only_below: int = 6, generic_ratio: float = 0.003):
+        """
+        Args:
+            names: {用于匹配的名称(小写): 数据库中的原名}
+            min_length: 参与模糊匹配的最短景点名；太短的名字错一个字就面目全非，误匹配太多
+            min_score: 最低相似度（1 - 编辑距离 / 名称长度）
+            max_candidates: 按 bigram 覆盖率召回后做编辑距离校验的候选数
+            substitution_only_below: 短于该长度的名称只接受错字（输入法同音字），
+                多字少字往往是另一个景点（“大兴寺”与“大兴隆寺”）
+            generic_ratio: 出现在超过该比例景点名中的 bigram（“公园”、“广场”、“博物”）视为通用词，
+                候选至少要与问题共享一个非通用 bigram
+        """
+        self.min_length = min_length
+        self.min_score = min_score
+        self.max_candidates = max_candidates
+        self.substitution_only_below = substitution_only_below
+
+        self.keys = [key for key in names if len(key) >= min_length]
+        self.values = [names[key] for key in self.keys]
+        postings: Dict[str, List[int]] = {}
+        for i, key in enumerate(self.keys):
+            for gram in set(_bigrams(key)):
+                postings.setdefault(gram, []).append(i)
+        self.postings = {gram: np.asarray(ids, dtype=np.int32) for gram, ids in postings.items()}
+        generic_df = max(3, int(len(self.keys) * generic_ratio))
+        self.distinctive = {gram for gram, ids in self.postings.items() if len(ids) <= generic_df}
+        self.gram_counts = np.asarray([max(1, len(set(_bigrams(key)))) for key in self.keys], dtype=np.float64)
+
+    def search(self, text: str, top_k: int = 5) -> List[Tuple[str, float]]:
+        """
+        返回文本中可能提到的景点及相似度，按相似度降序
+
+        Returns:
+            [(数据库中的景点名, 相似度), ...]
+        """
+        if not self.keys:
+            return []
+        grams = [gram for gram in set(_bigrams(text)) if gram in self.postings]
+        distinctive = [self.postings[gram] for gram in grams if gram in self.distinctive]
+        if not distinctive:
+            return []
+
+        # 召回：景点名中有多少比例的 bigram 出现在问题里
+        shared = np.bincount(np.concatenate([self.postings[gram] for gram in grams]), minlength=len(self.keys))
+        coverage = shared / self.gram_counts
+        # 错一个字最多破坏两个 bigram，覆盖率太低的不可能达到 min_score；
+        # 只共享“森林公园”、“广场”这类通用 bigram 的，多半是另一个景点。错字在名称开头也能召回
+        has_distinctive = np.bincount(np.concatenate(distinctive), minlength=len(self.keys)) > 0
+        candidates = np.flatnonzero((coverage >= 0.3) & has_distinctive)
+        if candidates.size > self.max_candidates:
+            top = np.argpartition(-coverage[candidates], self.max_candidates - 1)[:self.max_candidates]
+            candidates = candidates[top]
+
+        # 校验：名称与问题中最接近的子串之间的编辑距离
+        results = []
+        for i in candidates:
+            key = self.keys[i]
+            if len(key) < self.substitution_only_below:
+                distance = window_hamming_distance(key, text)
+            else:
+                distance = substring_edit_distance(key, text)
+            score = 1 - distance / len(key)
+            if score >= self.min_score:
+                results.append((self.values[i], round(score, 4), len(key)))
+        # 相似度相同时优先更长（信息量更大）的名称
+        results.sort(key=lambda r: (-r[1], -r[2]))
+        return [(name, score) for name, score, _ in results[:top_k]]
+
+    def best(self, text: str) -> Optional[Tuple[str, float]]:
+        """相似度最高的景点，没有则返回None"""
+        results = self.search(text, top_k=1)
+        return results[0] if results else None
+
+    def __len__(self):
+        return len(self.keys)
+
+
+def _benchmark(names: Iterable[str], queries: List[str], repeat: int = 200):
+    index = FuzzySpotIndex({name.lower(): name for name in names})
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for query in queries:
+            index.search(query)
+    elapsed = (time.perf_counter() - started) / (repeat * len(queries))
+    for query in queries:
+        print(f"{query} -> {index.search(query)}")
+    print(f"⏱️ {len(index)} 个景点名，平均每次查询 {elapsed * 1000:.3f}ms")
+
+
+if __name__ == "__main__":
+    import json
+    from pathlib import Path
+
+    with open(Path(__file__).resolve().parent / "scenic_dictionary.json", encoding="utf-8") as f:
+        _benchmark(json.load(f), ["八达玲长城门票多少钱", "故工博物院在哪", "天坛公圆的开放时间", "今天天气怎么样"])
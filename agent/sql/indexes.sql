@@ -0,0 +1,5 @@
+-- 已导入的数据库补建索引（新导入 agent/sql/mysql/*.sql 时已包含，无需执行）
+-- mysql -u root -p scenic_spots_db < agent/sql/indexes.sql
+
+-- 城市景点查询：WHERE city_id = ? ORDER BY rating DESC LIMIT n 可直接倒序扫描索引，无需排序全城景点
+ALTER TABLE `scenic_spots` ADD INDEX `idx_city_rating` (`city_id`, `rating`);
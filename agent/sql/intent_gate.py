@@ -0,0 +1,132 @@
+"""
+SQL问答意图门控
+在进入规则解析和大模型规范化之前，用实体命中 + 意图关键词在微秒级判断问题是否与景点数据有关，
+闲聊等无关问题直接跳过SQL问答，不再为规范化多付一次大模型调用。
+景点名写错字（“八达玲长城怎么样”）时没有精确命中，再查一次模糊索引。
+
+用法：
+    python -m agent.sql.intent_gate eval [--labels 文件]   # 在标注集上评估准确率/召回率
+"""
+
+import json
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from agent.sql.entity_matcher import EntityMatcher
+
+LABELS_PATH = Path(__file__).resolve().parent / "intent_labels.json"
+
+# 单独出现即说明在问景点（景点简称、别名等需要大模型规范化的情况也靠它们放行）
+INTENT_KEYWORDS = [
+    "景点", "景区", "风景区", "名胜", "古迹", "门票", "票价", "评分", "附近", "周边",
+    "开放时间", "营业时间", "开门", "关门", "地址", "在哪", "电话", "好玩", "游玩", "参观", "打卡",
+]
+
+# 景点名至少这么长才单独算命中；更短的名字（如“河马”、“沙滩”）在闲聊中太常见，需要同时出现意图关键词
+MIN_SPOT_NAME_LENGTH = 3
+
+
+class IntentGate:
+    """景点意图门控：景点名命中、意图关键词命中、城市名 + 城市查询条件词/营业中查询，或模糊命中景点名"""
+
+    def __init__(self, question_processor):
+        """复用问题解析器的景点/城市自动机和关键词，保证能被规则解析的问题一定会放行"""
+        self.spot_matcher = question_processor.spot_matcher
+        self.city_matcher = question_processor.city_matcher
+        self.fuzzy_spot_index = question_processor.fuzzy_spot_index
+
+        question_types = question_processor.question_types
+        self.intent_matcher = EntityMatcher(set(INTENT_KEYWORDS) | set(question_types["spot_type"]))
+        # 城市问题在解析器中需要这些条件词之一才会被识别
+        city_keywords = set(INTENT_KEYWORDS)
+        for key in ("city_spots", "ticket_price", "rating_spots", "spot_type"):
+            city_keywords.update(question_types[key])
+        self.city_keyword_matcher = EntityMatcher(city_keywords)
+        # 营业中查询（“北京晚上8点后还开放的”）没有上述条件词
+        self.open_pattern = question_processor.OPEN_PATTERN
+
+        self.checked = 0
+        self.passed = 0
+
+    def is_scenic(self, question: str) -> bool:
+        """判断问题是否值得走SQL问答"""
+        question = question.strip().lower()
+        self.checked += 1
+        scenic = self._classify(question)
+        self.passed += scenic
+        return scenic
+
+    def _classify(self, question: str) -> bool:
+        spot_name = self.spot_matcher.longest(question)
+        if spot_name is not None and len(spot_name) >= MIN_SPOT_NAME_LENGTH:
+            return True
+        if self.intent_matcher.longest(question) is not None:
+            return True
+        if self.city_matcher.longest(question) is not None and (
+                self.city_keyword_matcher.longest(question) is not None or self.open_pattern.search(question)):
+            return True
+        # 只在上面都没命中时才走模糊索引，闲聊问题多花约0.1ms
+        return self.fuzzy_spot_index.best(question) is not None
+
+    def stats(self) -> Dict:
+        """门控统计信息"""
+        return {
+            "checked": self.checked,
+            "passed": self.passed,
+            "skipped": self.checked - self.passed,
+        }
+
+
+def evaluate(gate: IntentGate, labelled: List[Dict]) -> Dict:
+    """在标注集（[{"question": ..., "scenic": bool}]）上计算准确率、召回率和单次耗时"""
+    tp = fp = fn = tn = 0
+    errors = []
+    started = time.perf_counter()
+    for item in labelled:
+        predicted = gate._classify(item["question"].strip().lower())
+        expected = bool(item["scenic"])
+        if predicted and expected:
+            tp += 1
+        elif predicted:
+            fp += 1
+            errors.append({"question": item["question"], "expected": expected})
+        elif expected:
+            fn += 1
+            errors.append({"question": item["question"], "expected": expected})
+        else:
+            tn += 1
+    elapsed = time.perf_counter() - started
+
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        "samples": len(labelled),
+        "precision": round(precision, 4),
+        "recall": round(recall, 4),
+        "f1": round(2 * precision * recall / (precision + recall), 4) if precision + recall else 0.0,
+        "accuracy": round((tp + tn) / len(labelled), 4) if labelled else 0.0,
+        "confusion": {"tp": tp, "fp": fp, "fn": fn, "tn": tn},
+        "avg_us": round(elapsed / len(labelled) * 1e6, 2) if labelled else 0.0,
+        "errors": errors,
+    }
+
+
+def main():
+    import argparse
+    from agent.sql.attraction_ezqa_service import create_database_manager
+    from agent.sql.question_processor import QuestionProcessor
+
+    parser = argparse.ArgumentParser(description="SQL问答意图门控工具")
+    parser.add_argument("command", choices=["eval"])
+    parser.add_argument("--labels", default=str(LABELS_PATH), help="标注集路径")
+    args = parser.parse_args()
+
+    with open(args.labels, encoding="utf-8") as f:
+        labelled = json.load(f)
+    gate = IntentGate(QuestionProcessor(create_database_manager(), use_llm=False))
+    print(json.dumps(evaluate(gate, labelled), ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -46,6 +46,7 @@ CREATE TABLE `scenic_spots` (
   KEY `idx_city` (`city_id`) COMMENT '城市索引',
   KEY `idx_province` (`province_id`) COMMENT '省份索引',
   KEY `idx_rating` (`rating`) COMMENT '评分索引',
+  KEY `idx_city_rating` (`city_id`,`rating`) COMMENT '城市内按评分排序索引',
   CONSTRAINT `scenic_spots_ibfk_1` FOREIGN KEY (`city_id`) REFERENCES `cities` (`id`),
   CONSTRAINT `scenic_spots_ibfk_2` FOREIGN KEY (`province_id`) REFERENCES `provinces` (`id`)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,227 @@
+"""
+营业时间区间索引
+把 opentime_week / opentime_today / open_time_start / open_time_end 一次性解析为
+(星期, 开始分钟, 结束分钟, 适用季节) 区间，存成 NumPy 数组；
+“现在还开着的景点”、“晚上8点后开放的景点”等查询直接在进程内用向量化比较完成。
+"""
+
+import re
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+FULL_DAY = 24 * 60
+ALL_WEEKDAYS = list(range(7))
+ALL_YEAR = (1, 366)
+
+_WEEKDAY_CHARS = {"一": 0, "二": 1, "三": 2, "四": 3, "五": 4, "六": 5, "日": 6, "天": 6}
+_TIME_RANGE = re.compile(r"(\d{1,2}):(\d{2})\s*[-~至到]\s*(\d{1,2}):(\d{2})")
+_DAY_RANGE = re.compile(r"(?:周|星期)([一二三四五六日天])\s*[-~至到]\s*(?:周|星期)?([一二三四五六日天])")
+_DAY_SINGLE = re.compile(r"(?:周|星期)([一二三四五六日天])")
+_MONTH_RANGE = re.compile(r"(\d{1,2})月\s*[-~至到]\s*(\d{1,2})月(?!\d)")
+_MONTH_DAY_RANGE = re.compile(r"(\d{1,2})月(\d{1,2})日\s*[-~至到]\s*(?:次年)?(\d{1,2})月(\d{1,2})日")
+_NUMERIC_DATE_RANGE = re.compile(r"(?<![\d:])(\d{1,2})[/-](\d{1,2})\s*[-~至到]\s*(\d{1,2})[/-](\d{1,2})(?![\d:])")
+_CLOSED = re.compile(r"闭馆|关闭|不开放|休息|休馆|闭园")
+_ALL_DAY = re.compile(r"24小时|全天开放")
+
+Interval = Tuple[int, int, int, int, int]  # (星期, 开始分钟, 结束分钟, 季节开始日序, 季节结束日序)
+
+
+def _day_of_year(month: int, day: int) -> int:
+    try:
+        return date(2001, month, day).timetuple().tm_yday  # 取非闰年作为参照
+    except ValueError:
+        return 1
+
+
+def day_of_year(day: date) -> int:
+    """日期在非闰年中的日序，与解析出的季节区间可直接比较"""
+    return _day_of_year(day.month, day.day)
+
+
+def _month_end(month: int) -> int:
+    return _day_of_year(month % 12 + 1, 1) - 1 if month < 12 else 365
+
+
+def _parse_seasons(text: str) -> List[Tuple[int, int]]:
+    seasons = []
+    for m in _MONTH_DAY_RANGE.finditer(text):
+        seasons.append((_day_of_year(int(m.group(1)), int(m.group(2))), _day_of_year(int(m.group(3)), int(m.group(4)))))
+    for m in _NUMERIC_DATE_RANGE.finditer(text):
+        seasons.append((_day_of_year(int(m.group(1)), int(m.group(2))), _day_of_year(int(m.group(3)), int(m.group(4)))))
+    for m in _MONTH_RANGE.finditer(text):
+        seasons.append((_day_of_year(int(m.group(1)), 1), _month_end(int(m.group(2)))))
+    return seasons
+
+
+def _parse_days(text: str) -> List[int]:
+    days = []
+    for m in _DAY_RANGE.finditer(text):
+        first, last = _WEEKDAY_CHARS[m.group(1)], _WEEKDAY_CHARS[m.group(2)]
+        span = (last - first) % 7
+        days.extend((first + i) % 7 for i in range(span + 1))
+    for m in _DAY_SINGLE.finditer(_DAY_RANGE.sub("", text)):
+        days.append(_WEEKDAY_CHARS[m.group(1)])
+    return days
+
+
+def _parse_times(text: str) -> List[Tuple[int, int]]:
+    times = []
+    for m in _TIME_RANGE.finditer(text):
+        start = int(m.group(1)) * 60 + int(m.group(2))
+        end = int(m.group(3)) * 60 + int(m.group(4))
+        if start <= FULL_DAY and end <= FULL_DAY and start != end:
+            times.append((start, end))
+    return times
+
+
+def _expand(days, times, seasons) -> List[Interval]:
+    """展开为区间；跨午夜的时段拆成当天和次日两段"""
+    intervals = []
+    for season_start, season_end in seasons or [ALL_YEAR]:
+        for weekday in days or ALL_WEEKDAYS:
+            for start, end in times:
+                if end > start:
+                    intervals.append((weekday, start, end, season_start, season_end))
+                else:
+                    intervals.append((weekday, start, FULL_DAY, season_start, season_end))
+                    if end > 0:
+                        intervals.append(((weekday + 1) % 7, 0, end, season_start, season_end))
+    return intervals
+
+
+def parse_week_schedule(text: str) -> List[Interval]:
+    """
+    解析 opentime_week 文本，如：
+        周一至周日 09:00-17:00
+        周二至周五 09:00-11:30,13:30-17:00；周一 全天关闭
+        6月至9月07:00-17:00；1月至5月,10月至12月08:00-16:00
+    """
+    intervals = []
+    closed_days = set()
+    for segment in re.split(r"[；;]", text or ""):
+        days, seasons = [], []
+        emitted = False
+        # 逗号、顿号、括号分隔的片段依次累积星期和季节，遇到时间段时展开
+        for piece in re.split(r"[，,、（）()]", segment):
+            piece_days = _parse_days(piece)
+            piece_seasons = _parse_seasons(piece)
+            times = _parse_times(piece)
+            if not times and _CLOSED.search(piece):
+                closed_days.update(piece_days)
+                continue
+            if emitted and (piece_days or piece_seasons):
+                days, seasons, emitted = [], [], False
+            days.extend(piece_days)
+            seasons.extend(piece_seasons)
+            if times:
+                intervals.extend(_expand(days, times, seasons))
+                emitted = True
+            elif _ALL_DAY.search(piece):
+                intervals.extend(_expand(days, [(0, FULL_DAY)], seasons))
+                emitted = True
+    return [interval for interval in intervals if interval[0] not in closed_days]
+
+
+def _seconds(value) -> Optional[int]:
+    if value is None:
+        return None
+    if isinstance(value, timedelta):
+        return int(value.total_seconds())
+    return int(value)
+
+
+def parse_opening_hours(open_time_start=None, open_time_end=None, opentime_today=None,
+                        opentime_week=None) -> List[Interval]:
+    """按 opentime_week -> opentime_today -> open_time_start/end 的优先级解析营业区间，无法解析时返回空列表"""
+    intervals = parse_week_schedule(opentime_week)
+    if intervals:
+        return intervals
+    if opentime_today:
+        if _ALL_DAY.search(opentime_today):
+            return _expand([], [(0, FULL_DAY)], [])
+        intervals = _expand([], _parse_times(opentime_today), [])
+        if intervals:
+            return intervals
+    start, end = _seconds(open_time_start), _seconds(open_time_end)
+    if start is not None and end is not None and start != end:
+        return _expand([], [(start // 60, end // 60)], [])
+    return []
+
+
+class OpeningHoursIndex:
+    """所有景点营业区间的列式数组"""
+
+    def __init__(self, ids: List[str], ratings: List[Optional[float]], cities: List[Optional[str]],
+                 intervals: List[List[Interval]]):
+        self.ids = np.asarray(ids, dtype=object)
+        self.cities = np.asarray(cities, dtype=object)
+        rating = np.asarray([np.nan if r is None else float(r) for r in ratings], dtype=np.float64)
+        # 评分降序（空评分最后）、同分按id降序，与 ORDER BY s.rating DESC, s.id DESC 一致
+        id_rank = np.argsort(np.argsort(self.ids))
+        order = np.lexsort((-id_rank, -np.nan_to_num(rating, nan=-np.inf)))
+        self.rank = np.empty(len(order), dtype=np.int64)
+        self.rank[order] = np.arange(len(order))
+
+        spots, weekdays, starts, ends, season_starts, season_ends = [], [], [], [], [], []
+        for spot, spot_intervals in enumerate(intervals):
+            for weekday, start, end, season_start, season_end in spot_intervals:
+                spots.append(spot)
+                weekdays.append(weekday)
+                starts.append(start)
+                ends.append(end)
+                season_starts.append(season_start)
+                season_ends.append(season_end)
+        self.spot = np.asarray(spots, dtype=np.int32)
+        self.weekday = np.asarray(weekdays, dtype=np.int8)
+        self.start = np.asarray(starts, dtype=np.int16)
+        self.end = np.asarray(ends, dtype=np.int16)
+        self.season_start = np.asarray(season_starts, dtype=np.int16)
+        self.season_end = np.asarray(season_ends, dtype=np.int16)
+        self.known = np.zeros(len(ids), dtype=bool)
+        self.known[self.spot] = True
+
+    @classmethod
+    def from_rows(cls, rows: List[Dict]) -> "OpeningHoursIndex":
+        """rows 需包含 id, rating, city_name, open_time_start, open_time_end, opentime_today, opentime_week"""
+        return cls(
+            [row["id"] for row in rows],
+            [row["rating"] for row in rows],
+            [row.get("city_name") for row in rows],
+            [
+                parse_opening_hours(row["open_time_start"], row["open_time_end"],
+                                    row["opentime_today"], row["opentime_week"])
+                for row in rows
+            ],
+        )
+
+    def open_at(self, weekday: int, minute: int, day_of_year: int, city_name: Optional[str] = None,
+                top_k: Optional[int] = None) -> List[str]:
+        """
+        返回在指定时刻营业的景点id，按评分降序
+
+        Args:
+            weekday: 星期（0=周一）
+            minute: 当天第几分钟
+            day_of_year: 日序，用于匹配季节性营业时间
+            city_name: 只返回该城市的景点
+            top_k: 最多返回的数量
+        """
+        in_season = np.where(
+            self.season_start <= self.season_end,
+            (self.season_start <= day_of_year) & (day_of_year <= self.season_end),
+            (day_of_year >= self.season_start) | (day_of_year <= self.season_end),
+        )
+        hit = (self.weekday == weekday) & (self.start <= minute) & (minute < self.end) & in_season
+        spots = np.unique(self.spot[hit])
+        if city_name is not None:
+            spots = spots[self.cities[spots] == city_name]
+        ranks = self.rank[spots]
+        if top_k is not None and len(spots) > top_k:
+            keep = np.argpartition(ranks, top_k - 1)[:top_k]
+            spots, ranks = spots[keep], ranks[keep]
+        return [str(self.ids[i]) for i in spots[np.argsort(ranks)]]
+
+    def stats(self) -> Dict:
+        return {"spots": len(self.ids), "parsed_spots": int(self.known.sum()), "intervals": len(self.spot)}
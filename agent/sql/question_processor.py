@@ -1,35 +1,93 @@
 
-import logging
-import jieba
 import re
+import hashlib
+import threading
+import httpx
 from dotenv import load_dotenv
 from openai import OpenAI
 import os
 import openai
-
-jieba.setLogLevel(logging.ERROR)
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from agent.sql.entity_matcher import EntityMatcher
+from agent.sql.fuzzy_index import FuzzySpotIndex
+from agent.sql.opening_hours import day_of_year
+from agent.sql.result_cache import create_normalization_caches
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 OPENAI_API_BASE = os.getenv('OPENAI_API_BASE')
 
+# 营业时间按北京时间解释，与服务器所在时区无关；没有时区数据库（如未装 tzdata 的 Windows）时用固定的 UTC+8，中国不实行夏令时
+try:
+    CHINA_TZ = ZoneInfo("Asia/Shanghai")
+except ZoneInfoNotFoundError:
+    CHINA_TZ = timezone(timedelta(hours=8), "Asia/Shanghai")
+
+# 进程内共享的OpenAI客户端（复用HTTP连接池），fork 后重新创建
+_openai_client = None
+_openai_client_pid = None
+_openai_client_lock = threading.Lock()
+
+def get_openai_client():
+    """获取进程内共享的OpenAI客户端"""
+    global _openai_client, _openai_client_pid
+    pid = os.getpid()
+    if _openai_client is None or _openai_client_pid != pid:
+        with _openai_client_lock:
+            if _openai_client is None or _openai_client_pid != pid:
+                _openai_client = OpenAI(
+                    base_url=OPENAI_API_BASE,
+                    api_key=OPENAI_API_KEY,
+                    timeout=10.0,
+                    max_retries=1,
+                    http_client=httpx.Client(
+                        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+                    ),
+                )
+                _openai_client_pid = pid
+    return _openai_client
+
 class QuestionProcessor:
-    def __init__(self, db_manager):
+    # 景点类型关键词，按 scenic_spots.type 子串匹配
+    SPOT_TYPES = ["博物馆", "纪念馆", "美术馆", "展览馆", "科技馆", "图书馆", "植物园", "动物园",
+                  "水族馆", "公园", "广场", "寺庙", "道观", "教堂", "海滩", "红色景区", "世界遗产"]
+
+    # “现在还开着”、“晚上8点后开放”、“周日晚上还营业”等营业中查询
+    OPEN_PATTERN = re.compile(
+        r"还开|开着|营业中|在营业|正在开放|开门的|(?:还|仍|仍然|依然)(?:在)?(?:营业|开放)"
+        r"|(?:\d点|\d时|:\d{2})(?:半|\d{1,2}分)?(?:以后|之后|后)?还?(?:开放|营业|开门)"
+        r"|现在(?:开放|营业|开门)|(?:夜间|晚上|夜里|深夜)(?:也|还|仍)?(?:开放|营业|开门)"
+    )
+    # 时段词对应的默认时刻（小时），以及需要换算成24小时制的时段
+    PERIOD_HOURS = {"凌晨": 5, "早上": 8, "上午": 10, "中午": 12, "下午": 15, "傍晚": 18, "晚上": 20, "夜里": 21, "夜间": 20}
+    AFTERNOON_PERIODS = ("下午", "傍晚", "晚上", "夜里", "夜间")
+    NIGHT_PERIODS = ("晚上", "夜里", "夜间")  # “晚上12点”是当天24:00（次日0点），不是中午
+    WEEKDAY_NAMES = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+
+    def __init__(self, db_manager, use_llm=True):
         self.db_manager = db_manager
+        self.use_llm = use_llm  # 关闭后无法解析的问题不再调用大模型规范化（压测等离线场景）
         self.city_dict = set()  # 城市词典
         self.short_to_full = {}  # 简称到全称的映射
         self.spot_dict = set()  # 景点词典
+        self.province_patterns = {}  # 省份名/简称到全称的映射
         self._load_city_dict()
+        self._load_province_dict()
         self._load_spot_dict()
+        self._build_matchers()
+        # 大模型规范化结果缓存；negative 缓存记录"规范化后与原问题相同"的问题
+        self.normalization_cache, self.negative_normalization_cache = create_normalization_caches()
         
         # 问题类型映射
         self.question_types = {
             "city_spots": ["有哪些景点", "有什么景点", "推荐景点", "景点有哪些", "旅游景点"],
             "compound_filter": ["和", "且", "同时", "既", "又", "还"],
-            "ticket_price": ["价格", "门票", "多少钱", "费用"],
+            "ticket_price": ["价格", "门票", "多少钱", "费用", "免费", "收费"],
             "rating_spots": ["评分", "高", "最好", "推荐", "口碑"],
             "spot_info": ["位置", "地址", "电话", "开放时间", "营业时间", "所在城市", "门票价格", "评分", "介绍", "信息"],
-            "nearby_spots": ["附近"]  # 新增附近景点推荐问题类型
+            "nearby_spots": ["附近"],  # 新增附近景点推荐问题类型
+            "spot_type": self.SPOT_TYPES,
         }
 
     def _load_city_dict(self):
@@ -48,6 +106,19 @@ class QuestionProcessor:
             self.city_dict = {"北京市", "上海市", "广州市"}
             self.short_to_full = {"北京": "北京市", "上海": "上海市", "广州": "广州市"}
 
+    def _load_province_dict(self):
+        """加载省份词典；与城市同名的直辖市（北京市、上海市）按城市处理"""
+        try:
+            provinces = self.db_manager.get_all_provinces()
+        except Exception:
+            provinces = []
+        for province in provinces:
+            if province in self.city_dict:
+                continue
+            self.province_patterns[province] = province
+            if province.endswith("省"):
+                self.province_patterns[province[:-1]] = province
+
     def _load_spot_dict(self):
         """加载景点词典"""
         try:
@@ -57,43 +128,29 @@ class QuestionProcessor:
             # 备选方案
             self.spot_dict = {"法海寺", "红螺寺", "明十三陵", "颐和园", "故宫博物院", "天坛公园"}
 
+    def _build_matchers(self):
+        """基于词典构建Aho-Corasick自动机，每个进程只构建一次"""
+        # 简称映射到全称；全称优先，最长匹配会自然选中"北京市"而不是"北京"
+        city_patterns = dict(self.short_to_full)
+        city_patterns.update({city: city for city in self.city_dict})
+        self.city_matcher = EntityMatcher(city_patterns)
+        self.province_matcher = EntityMatcher(self.province_patterns)
+        # 问题在 process() 中会被转成小写，模式也按小写匹配，返回数据库中的原名
+        self.spot_matcher = EntityMatcher({spot.lower(): spot for spot in self.spot_dict})
+        # 写错字的景点名先用模糊索引纠正，纠正不了再交给大模型
+        self.fuzzy_spot_index = FuzzySpotIndex({spot.lower(): spot for spot in self.spot_dict})
+
     def _extract_city_name(self, question):
         """提取城市名称并转换为数据库存储的格式"""
-        # 1. 尝试完整匹配
-        for city in self.city_dict:
-            if city in question:
-                return city
-        
-        # 2. 尝试匹配简称并转换为全称
-        for short_name, full_name in self.short_to_full.items():
-            if short_name in question:
-                return full_name
-        
-        # 3. 使用jieba分词辅助
-        words = jieba.cut(question)
-        for word in words:
-            if word in self.city_dict:
-                return word
-            elif word in self.short_to_full:
-                full_name = self.short_to_full[word]
-                return full_name
-        
-        return None
+        return self.city_matcher.longest(question)
+
+    def _extract_province_name(self, question):
+        """提取省份名称（全称）"""
+        return self.province_matcher.longest(question)
 
     def _extract_spot_name(self, question):
-        """提取景点名称"""
-        # 1. 尝试完整匹配
-        for spot in self.spot_dict:
-            if spot in question:
-                return spot
-        
-        # 2. 使用jieba分词辅助
-        words = jieba.cut(question)
-        for word in words:
-            if word in self.spot_dict:
-                return word
-        
-        return None
+        """提取景点名称（取问题中最长的景点名）"""
+        return self.spot_matcher.longest(question)
 
     def _extract_spot_attributes(self, question):
         """提取用户想要查询的景点属性"""
@@ -105,9 +162,20 @@ class QuestionProcessor:
                         attributes.append(keyword)
         return attributes
 
+    def _extract_spot_type(self, question):
+        """提取景点类型关键词（取最长的一个），如“公园”、“博物馆”"""
+        matched = [t for t in self.question_types["spot_type"] if t in question]
+        return max(matched, key=len) if matched else None
+
     def _extract_price(self, question):
         """从问题中提取价格信息及比较条件"""
         try:
+            # 免费/收费
+            if "免费" in question:
+                return {"value": 0, "operator": "<="}
+            if "收费" in question:
+                return {"value": 0, "operator": ">"}
+
             # 提取价格数字
             price_match = re.search(r'(\d+(?:\.\d+)?)', question)
             if not price_match:
@@ -162,42 +230,114 @@ class QuestionProcessor:
         except Exception:
             return None    
 
-    def _use_llm_for_normalization(self, question):
-        """使用大模型对用户问题进行规范化处理"""
+    def _extract_radius(self, question):
+        """从问题中提取搜索半径（单位：公里），如“3公里内”、“500米以内”"""
+        radius_match = re.search(r'(\d+(?:\.\d+)?)\s*(公里|千米|km|米)', question)
+        if not radius_match:
+            return None
+        radius = float(radius_match.group(1))
+        if radius_match.group(2) == "米":
+            radius /= 1000
+        return radius if radius > 0 else None
 
-        client = OpenAI(
-            base_url=OPENAI_API_BASE,
-            api_key=OPENAI_API_KEY,
-        )
+    def _extract_top_k(self, question, default=5):
+        """从问题中提取需要返回的景点数量，如“附近10个景点”"""
+        count_match = re.search(r'(\d+)\s*个', question)
+        if not count_match:
+            return default
+        return min(max(int(count_match.group(1)), 1), 20)
+
+    def _extract_open_time(self, question, now=None):
+        """
+        提取营业中查询的目标时刻，不是营业中查询时返回None
+
+        Returns:
+            (目标日期时间, 是否为“现在”)
+        """
+        if not self.OPEN_PATTERN.search(question):
+            return None
+        now = now or datetime.now(CHINA_TZ)
+
+        # 日期：今天/明天/后天/周X（取今天起最近的那一天）
+        target = now
+        day_match = re.search(r"(明天|后天|(?:周|星期)([一二三四五六日天]))", question)
+        if day_match:
+            if day_match.group(1) == "明天":
+                target = now + timedelta(days=1)
+            elif day_match.group(1) == "后天":
+                target = now + timedelta(days=2)
+            else:
+                weekday = "一二三四五六日".find(day_match.group(2).replace("天", "日"))
+                target = now + timedelta(days=(weekday - now.weekday()) % 7)
 
-        if not OPENAI_API_KEY:
+        # 时刻：晚上8点、20:30、下午3点半；只有时段词时取默认时刻
+        time_match = re.search(r"(凌晨|早上|上午|中午|下午|傍晚|晚上|夜里|夜间)?(\d{1,2})(?:点|时|:)(半|(\d{1,2})分?)?", question)
+        period_match = re.search("|".join(self.PERIOD_HOURS), question)
+        if time_match:
+            hour = int(time_match.group(2))
+            minute = 30 if time_match.group(3) == "半" else int(time_match.group(4) or 0)
+            period = time_match.group(1)
+            if period in self.AFTERNOON_PERIODS and hour < 12 or period == "中午" and hour < 11:
+                hour += 12
+            elif period in self.NIGHT_PERIODS and hour == 12:
+                hour = 24
+        elif period_match:
+            hour, minute = self.PERIOD_HOURS[period_match.group(0)], 0
+        else:
+            return target, not day_match
+        if hour > 24 or minute > 59:
+            return None
+        target = target.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(hours=hour, minutes=minute)
+        return target, False
+
+    def _use_llm_for_normalization(self, question):
+        """使用大模型对用户问题进行规范化处理（结果按问题缓存）"""
+        if not self.use_llm or not OPENAI_API_KEY:
             return question
-            
-        try:
-            # 构建提示词，引导模型进行规范化
-            prompt = f"""
-            你是一个智能旅游助手，擅长理解用户关于旅游景点的问题。
-            请对以下问题进行规范化处理，包括将景点名称简写转换为全称，确保城市名称使用全称：
-            对于问题中的如下关键词，无需改动：位置，评分，联系方式，时间，价格，门票，开放时间，电话，地址，网址，评分。
 
-            原始问题: "{question}"
-            
-            规范化后的问题: 
-            """
-            
-            response = client.chat.completions.create(
-                    messages=[
-                    {"role": "system", "content": "你是一个智能旅游助手，擅长规范化用户关于旅游景点的问题。"},
-                    {"role": "user", "content": prompt}
-                ],
-                    model="gpt-4.1-nano",  # 使用常用模型
-                )
+        cache_key = hashlib.sha1(question.encode("utf-8")).hexdigest()
+        if self.negative_normalization_cache.get(cache_key):
+            return question
+        cached = self.normalization_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
-            
-            normalized_question = response.choices[0].message.content.strip()
-            return normalized_question
-        except Exception:
+        try:
+            normalized_question = self._request_llm_normalization(question)
+        except Exception as e:
+            # 调用失败不缓存，下次仍会重试
+            print(f"⚠️ [SQL查询] 大模型规范化失败: {e}")
+            return question
+
+        if not normalized_question or normalized_question == question:
+            self.negative_normalization_cache.set(cache_key, True)
             return question
+        self.normalization_cache.set(cache_key, normalized_question)
+        return normalized_question
+
+    def _request_llm_normalization(self, question):
+        """调用大模型规范化问题，返回小写的规范化结果"""
+        # 构建提示词，引导模型进行规范化
+        prompt = f"""
+        你是一个智能旅游助手，擅长理解用户关于旅游景点的问题。
+        请对以下问题进行规范化处理，包括将景点名称简写转换为全称，确保城市名称使用全称：
+        对于问题中的如下关键词，无需改动：位置，评分，联系方式，时间，价格，门票，开放时间，电话，地址，网址，评分。
+
+        原始问题: "{question}"
+        
+        规范化后的问题: 
+        """
+
+        response = get_openai_client().chat.completions.create(
+            messages=[
+                {"role": "system", "content": "你是一个智能旅游助手，擅长规范化用户关于旅游景点的问题。"},
+                {"role": "user", "content": prompt}
+            ],
+            model="gpt-4.1-nano",  # 使用常用模型
+        )
+
+        # 与 process() 一致转成小写，实体词典按小写匹配
+        return response.choices[0].message.content.strip().strip('"').lower()
 
     def process(self, user_question):
         """处理用户问题，识别问题类型"""
@@ -205,9 +345,18 @@ class QuestionProcessor:
         
         # 首次尝试解析问题
         processed_questions = self._try_process_question(user_question)
+
+        # 如果解析结果为unknown，先尝试模糊匹配景点名（无需调用大模型）
+        if self._is_unknown(processed_questions):
+            fuzzy_match = self.fuzzy_spot_index.best(user_question)
+            if fuzzy_match is not None:
+                spot_name, score = fuzzy_match
+                processed_questions = self._try_process_question(user_question, spot_name=spot_name)
+                for q in processed_questions:
+                    q["fuzzy_score"] = score
         
-        # 如果解析结果为unknown，尝试使用大模型进行规范化
-        if len(processed_questions) == 1 and processed_questions[0]["type"] == "unknown":
+        # 仍为unknown时，尝试使用大模型进行规范化
+        if self._is_unknown(processed_questions):
             normalized_question = self._use_llm_for_normalization(user_question)
             
             if normalized_question != user_question:
@@ -218,16 +367,26 @@ class QuestionProcessor:
         
         return processed_questions
 
-    def _try_process_question(self, question):
-        """尝试处理问题，返回处理结果"""
+    @staticmethod
+    def _is_unknown(processed_questions):
+        return len(processed_questions) == 1 and processed_questions[0]["type"] == "unknown"
+
+    def _try_process_question(self, question, spot_name=None):
+        """尝试处理问题，返回处理结果；spot_name 为已确定的景点名（如模糊匹配结果）"""
         # 先尝试提取景点名称
-        spot_name = self._extract_spot_name(question)
+        spot_name = spot_name or self._extract_spot_name(question)
         
         if spot_name:
             # 判断是否存在附近等关键词
             has_nearby_keyword = any(keyword in question for keyword in self.question_types["nearby_spots"])
             if has_nearby_keyword:
-                return [{"type": "nearby_spots", "spot_name": spot_name, "message": question}]
+                return [{
+                    "type": "nearby_spots",
+                    "spot_name": spot_name,
+                    "radius_km": self._extract_radius(question),
+                    "top_k": self._extract_top_k(question),
+                    "message": question,
+                }]
             else:
                 attributes = self._extract_spot_attributes(question)
                 if attributes:
@@ -238,22 +397,41 @@ class QuestionProcessor:
         
         # 若不包含景点名称，尝试提取城市名称
         city_name = self._extract_city_name(question)
+
+        # 营业中查询：没有城市名时需要明确在问景点（“现在还开着的景点”），避免误伤“空调开着吗”这类问题
+        # 目标时刻解析为星期、当天分钟和日序
+        open_time = self._extract_open_time(question)
+        if open_time is not None and (city_name or "景点" in question or "景区" in question):
+            target, is_now = open_time
+            return [{
+                "type": "open_spots",
+                "city_name": city_name,
+                "weekday": target.weekday(),
+                "minute": target.hour * 60 + target.minute,
+                "day_of_year": day_of_year(target.date()),
+                "time_label": "现在" if is_now else f"{self.WEEKDAY_NAMES[target.weekday()]} {target:%H:%M}",
+                "message": question,
+            }]
+        
+        # 没有城市时尝试省份（如“广东有哪些景点”），按省份汇总
+        province_name = None if city_name else self._extract_province_name(question)
         
-        if city_name:
+        if city_name or province_name:
             # 检查是否为简单城市景点查询
             is_simple_query = any(keyword in question for keyword in self.question_types["city_spots"])
             
             # 提取其他条件
             has_price_condition = any(keyword in question for keyword in self.question_types["ticket_price"])
             has_rating_condition = any(keyword in question for keyword in self.question_types["rating_spots"])
+            spot_type = self._extract_spot_type(question)
             
             # 判断是否为复合查询
             is_compound_query = False
             keywords = []
             
-            if has_price_condition or has_rating_condition:
+            if has_price_condition or has_rating_condition or spot_type:
                 is_compound_query = True
-                keywords.append({"type": "city_spots", "city_name": city_name})
+                keywords.append({"type": "city_spots", "city_name": city_name, "province_name": province_name})
                 
                 if has_price_condition:
                     price_info = self._extract_price(question)
@@ -264,12 +442,15 @@ class QuestionProcessor:
                     rating_info = self._extract_rating(question)
                     if rating_info:
                         keywords.append({"type": "rating_spots", "rating": rating_info})
+
+                if spot_type:
+                    keywords.append({"type": "spot_type", "spot_type": spot_type})
             
             if is_compound_query and keywords:
                 return [{"type": "compound_filter", "keywords": keywords, "message": question}]
             
             if is_simple_query and not is_compound_query:
-                return [{"type": "city_spots", "city_name": city_name, "message": question}]
+                return [{"type": "city_spots", "city_name": city_name, "province_name": province_name, "message": question}]
             
             return [{"type": "unknown", "message": f"无法识别的城市相关查询: {question}"}]
         
@@ -1,7 +1,24 @@
 class ResponseGenerator:
+    # 列表类回答最多展示的景点数
+    MAX_LISTED_SPOTS = 10
+
     def __init__(self):
         pass
 
+    def get_result_spec(self, processed_questions):
+        """
+        声明生成回答实际需要的结果行数和排序方式，由查询层下推为 ORDER BY + LIMIT
+
+        Returns:
+            (limit, order_by)，不需要限制时为 (None, None)
+        """
+        question_types = [q["type"] for q in processed_questions]
+        if "spot_info" in question_types:
+            return None, None
+        if "city_spots" in question_types or "compound_filter" in question_types or "open_spots" in question_types:
+            return self.MAX_LISTED_SPOTS, "rating_desc"
+        return None, None
+
     def generate(self, processed_questions, db_results):
         """生成用户问题的回答"""
         if not db_results:
@@ -22,28 +39,32 @@ class ResponseGenerator:
         elif "nearby_spots" in question_types:
             return self._generate_nearby_spots_response(processed_questions, db_results)
         
+        # 处理营业中景点查询
+        elif "open_spots" in question_types:
+            return self._generate_open_spots_response(processed_questions, db_results)
+        
         # 通用响应
         return self._generate_generic_response(processed_questions, db_results)
 
     def _generate_city_spots_response(self, processed_questions, db_results):
         """生成城市景点查询的响应，包含营业时间和电话信息"""
-        # 尝试提取城市名称
+        # 尝试提取城市（或省份）名称
         city_name = None
         for question in processed_questions:
             if question["type"] == "city_spots":
-                city_name = question.get("city_name")
+                city_name = question.get("city_name") or question.get("province_name")
                 break
             elif question["type"] == "compound_filter":
                 for keyword in question.get("keywords", []):
                     if keyword["type"] == "city_spots":
-                        city_name = keyword.get("city_name")
+                        city_name = keyword.get("city_name") or keyword.get("province_name")
                         break
                 if city_name:
                     break
         
         # 构建响应
         response = f"{city_name} 的推荐景点有：\n"
-        for i, spot in enumerate(db_results[:10], 1):  # 只显示前10个景点
+        for i, spot in enumerate(db_results[:self.MAX_LISTED_SPOTS], 1):  # 只显示前10个景点
             # 处理价格信息，直接显示"缺失"
             cost = spot['cost']
             price = "缺失"
@@ -104,13 +125,20 @@ class ResponseGenerator:
     def _generate_nearby_spots_response(self, processed_questions, db_results):
         """生成附近景点推荐查询的响应，包含距离信息"""
         spot_name = None
+        radius_km = None
+        top_k = 5
         for question in processed_questions:
             if question["type"] == "nearby_spots":
                 spot_name = question.get("spot_name")
+                radius_km = question.get("radius_km")
+                top_k = question.get("top_k", 5)
                 break
 
-        response = f"{spot_name} 附近评分最高的5个景点有：\n"
-        for i, spot in enumerate(db_results[:5], 1):  # 只显示前5个景点
+        if radius_km:
+            response = f"{spot_name} 周边{radius_km:g}公里内距离最近的景点有：\n"
+        else:
+            response = f"{spot_name} 附近距离最近的{min(top_k, len(db_results))}个景点有：\n"
+        for i, spot in enumerate(db_results[:top_k], 1):  # 只显示前top_k个景点
             # 处理价格信息，直接显示"缺失"
             cost = spot['cost']
             price = "缺失"
@@ -147,6 +175,42 @@ class ResponseGenerator:
         
         return response
 
+    def _generate_open_spots_response(self, processed_questions, db_results):
+        """生成营业中景点查询的响应，营业时间优先展示完整的每周安排"""
+        city_name = None
+        time_label = "现在"
+        for question in processed_questions:
+            if question["type"] == "open_spots":
+                city_name = question.get("city_name")
+                time_label = question.get("time_label", "现在")
+                break
+
+        response = f"{city_name + ' ' if city_name else ''}{time_label}营业中的景点有：\n"
+        for i, spot in enumerate(db_results[:self.MAX_LISTED_SPOTS], 1):  # 只显示前10个景点
+            cost = spot['cost']
+            price = "缺失"
+            if cost is not None:
+                price = f"{cost}元" if cost > 0 else "免费"
+
+            response += f"{i}. {spot['name']}（评分：{spot['rating']}，价格：{price}）\n"
+            response += f"   类型：{spot['type']}\n"
+            response += f"   地址：{spot['address']}\n"
+
+            if spot['opentime_week']:
+                response += f"   营业时间：{spot['opentime_week']}\n"
+            elif spot['opentime_today']:
+                response += f"   营业时间：{spot['opentime_today']}\n"
+            elif spot['open_time_start'] and spot['open_time_end']:
+                start_time = self._format_time(spot['open_time_start'])
+                end_time = self._format_time(spot['open_time_end'])
+                response += f"   营业时间：{start_time}-{end_time}\n"
+
+            if spot['tel']:
+                tel = self._format_phone(spot['tel'])
+                response += f"   电话：{tel}\n"
+
+        return response
+
     def _format_time(self, timedelta_obj):
         """将timedelta对象格式化为HH:MM字符串"""
         if not timedelta_obj:
@@ -175,7 +239,7 @@ class ResponseGenerator:
     def _generate_generic_response(self, processed_questions, db_results):
         """生成通用响应"""
         response = "查询结果如下：\n"
-        for i, result in enumerate(db_results[:10], 1):  # 只显示前10个结果
+        for i, result in enumerate(db_results[:self.MAX_LISTED_SPOTS], 1):  # 只显示前10个结果
             # 处理价格信息，直接显示"缺失"
             cost = result['cost']
             price = "缺失"
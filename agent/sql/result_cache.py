@@ -0,0 +1,78 @@
+"""
+SQL问答缓存
+- 结果缓存：按解析后的问题结构（processed_questions）而不是原始文本缓存最终回答，
+  "北京有哪些景点"和"北京市有什么景点"会命中同一条缓存。
+- 规范化缓存：缓存大模型对问题的规范化结果，避免相同问题重复调用大模型。
+"""
+
+import hashlib
+import json
+import os
+
+from dotenv import load_dotenv
+
+from agent.shared_cache import LRUTTLCache, get_shared_redis
+
+load_dotenv()
+SQL_QA_CACHE_SIZE = int(os.getenv("SQL_QA_CACHE_SIZE", "2048"))
+SQL_QA_CACHE_TTL = float(os.getenv("SQL_QA_CACHE_TTL", "600"))
+SQL_QA_CACHE_REDIS = os.getenv("SQL_QA_CACHE_REDIS", "false").lower() in ("1", "true", "yes")
+# 大模型规范化结果很稳定，缓存时间可以更长
+SQL_QA_NORMALIZE_CACHE_SIZE = int(os.getenv("SQL_QA_NORMALIZE_CACHE_SIZE", "4096"))
+SQL_QA_NORMALIZE_CACHE_TTL = float(os.getenv("SQL_QA_NORMALIZE_CACHE_TTL", "86400"))
+
+# 这些字段只记录原始措辞，不影响查询结果，不参与缓存键
+_VOLATILE_FIELDS = {"message", "original_question", "normalized_question", "fuzzy_score"}
+
+
+def _strip_volatile(value):
+    if isinstance(value, dict):
+        return {k: _strip_volatile(v) for k, v in value.items() if k not in _VOLATILE_FIELDS}
+    if isinstance(value, list):
+        return [_strip_volatile(v) for v in value]
+    return value
+
+
+def make_cache_key(processed_questions) -> str:
+    """把解析结果规范化为稳定的缓存键"""
+    canonical = json.dumps(_strip_volatile(processed_questions), ensure_ascii=False,
+                           sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def create_result_cache() -> LRUTTLCache:
+    """按环境变量创建结果缓存；SQL_QA_CACHE_REDIS=true 时所有工作进程共享Redis中的结果"""
+    redis_client = get_shared_redis() if SQL_QA_CACHE_REDIS else None
+    return LRUTTLCache(
+        "sql_qa_result",
+        maxsize=SQL_QA_CACHE_SIZE,
+        ttl=SQL_QA_CACHE_TTL,
+        redis_client=redis_client,
+        key_prefix="sql_qa:result:",
+    )
+
+
+def create_normalization_caches():
+    """
+    创建大模型规范化缓存
+
+    Returns:
+        (normalization_cache, negative_cache)：前者缓存规范化结果，
+        后者记录规范化后与原问题相同的问题，命中时直接跳过大模型调用
+    """
+    redis_client = get_shared_redis() if SQL_QA_CACHE_REDIS else None
+    normalization_cache = LRUTTLCache(
+        "sql_qa_normalization",
+        maxsize=SQL_QA_NORMALIZE_CACHE_SIZE,
+        ttl=SQL_QA_NORMALIZE_CACHE_TTL,
+        redis_client=redis_client,
+        key_prefix="sql_qa:norm:",
+    )
+    negative_cache = LRUTTLCache(
+        "sql_qa_normalization_negative",
+        maxsize=SQL_QA_NORMALIZE_CACHE_SIZE,
+        ttl=SQL_QA_NORMALIZE_CACHE_TTL,
+        redis_client=redis_client,
+        key_prefix="sql_qa:norm_neg:",
+    )
+    return normalization_cache, negative_cache
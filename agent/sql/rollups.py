@@ -0,0 +1,330 @@
+"""
+景点排行汇总表
+预先按 城市、省份、(城市, 类型) 以及 全部/免费/收费 计算评分前N的景点列表，连同展示所需字段一起写入
+一个紧凑的JSON文件；“北京评分最高的景点”、“广州免费的公园”等最常见的问题直接按键查表，
+不再对三张表做连接和排序。
+
+刷新是增量的：每个城市记录一份数据指纹，每个省份记录下辖城市，景点数据重新导入后只重算
+指纹变化的城市，以及包含变化城市或下辖城市有增减（城市删除、改属其他省份）的省份。
+
+用法：
+    python -m agent.sql.rollups refresh [--out 文件] [--full]   # 增量刷新（--full 全量重建）
+    python -m agent.sql.rollups info    [--out 文件]
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+SQL_DIR = Path(__file__).resolve().parent
+SQL_ROLLUP_PATH = os.getenv("SQL_ROLLUP_PATH", str(SQL_DIR / "rollups.json"))
+SQL_ROLLUP_TOP_N = int(os.getenv("SQL_ROLLUP_TOP_N", "20"))
+
+# 价格档：与 SQL 的 NULL 语义一致，价格缺失的景点既不算免费也不算收费
+BANDS = {
+    "all": lambda cost: True,
+    "free": lambda cost: cost is not None and cost <= 0,
+    "paid": lambda cost: cost is not None and cost > 0,
+}
+
+DECIMAL_COLUMNS = ("rating", "cost")
+TIME_COLUMNS = ("open_time_start", "open_time_end")
+
+
+def _key(*parts) -> str:
+    return "|".join(parts)
+
+
+def _encode_row(row: Dict) -> Dict:
+    encoded = dict(row)
+    for column in DECIMAL_COLUMNS:
+        if encoded.get(column) is not None:
+            encoded[column] = str(encoded[column])
+    for column in TIME_COLUMNS:
+        if encoded.get(column) is not None:
+            encoded[column] = int(encoded[column].total_seconds())
+    return encoded
+
+
+def _decode_row(row: Dict) -> Dict:
+    """还原为与通用景点查询相同类型的字典（Decimal、timedelta）"""
+    decoded = dict(row)
+    for column in DECIMAL_COLUMNS:
+        if decoded.get(column) is not None:
+            decoded[column] = Decimal(decoded[column])
+    for column in TIME_COLUMNS:
+        if decoded.get(column) is not None:
+            decoded[column] = timedelta(seconds=decoded[column])
+    return decoded
+
+
+def _fingerprint(rows: List[Dict]) -> str:
+    digest = hashlib.sha1()
+    for row in sorted(rows, key=lambda r: r["id"]):
+        digest.update(repr(sorted(_encode_row(row).items())).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _rank(rows: List[Dict]) -> List[Dict]:
+    """评分降序（空评分最后）、同分按id降序，与 ORDER BY s.rating DESC, s.id DESC 一致"""
+    rows = sorted(rows, key=lambda r: r["id"], reverse=True)
+    return sorted(rows, key=lambda r: (r["rating"] is None, -(r["rating"] or 0)))
+
+
+def _top_lists(prefix: str, ranked: List[Dict], top_n: int, lists: Dict, complete: Dict):
+    for band, accept in BANDS.items():
+        matched = [row for row in ranked if accept(row["cost"])]
+        key = _key(prefix, band)
+        lists[key] = [row["id"] for row in matched[:top_n]]
+        complete[key] = len(matched) <= top_n
+
+
+def build_rollups(db_manager, path=SQL_ROLLUP_PATH, top_n: int = SQL_ROLLUP_TOP_N,
+                  spot_types: Optional[List[str]] = None, full: bool = False) -> Dict:
+    """
+    刷新汇总表文件，返回刷新统计
+
+    Args:
+        db_manager: DatabaseManager 实例
+        path: 汇总表文件路径
+        top_n: 每个列表保留的景点数
+        spot_types: 按 (城市, 类型) 汇总的类型关键词，默认与问题解析器一致
+        full: 忽略已有文件，全量重建
+    """
+    if spot_types is None:
+        from agent.sql.question_processor import QuestionProcessor
+        spot_types = QuestionProcessor.SPOT_TYPES
+    started = time.perf_counter()
+    path = Path(path)
+
+    previous = None
+    if not full and path.exists():
+        previous = json.loads(path.read_text(encoding="utf-8"))
+        # 参数变化后旧列表不可复用
+        if previous.get("top_n") != top_n or previous.get("spot_types") != list(spot_types):
+            previous = None
+
+    rows = db_manager._execute_query(db_manager._get_common_query())
+    by_city: Dict[str, List[Dict]] = {}
+    province_cities: Dict[str, set] = {}
+    for row in rows:
+        by_city.setdefault(row["city_name"], []).append(row)
+        province_cities.setdefault(row["province_name"], set()).add(row["city_name"])
+
+    fingerprints = {city: _fingerprint(city_rows) for city, city_rows in by_city.items()}
+    old_fingerprints = previous["fingerprints"] if previous else {}
+    changed = {city for city in by_city if fingerprints[city] != old_fingerprints.get(city)}
+
+    lists: Dict[str, List[str]] = {}
+    complete: Dict[str, bool] = {}
+    if previous:
+        # 未变化城市的列表原样保留；已删除城市的列表随之丢弃
+        for key, ids in previous["lists"].items():
+            scope, name = key.split("|")[:2]
+            if scope != "province" and name in by_city and name not in changed:
+                lists[key] = ids
+                complete[key] = previous["complete"][key]
+
+    for city in changed:
+        ranked = _rank(by_city[city])
+        _top_lists(_key("city", city), ranked, top_n, lists, complete)
+        for spot_type in spot_types:
+            typed = [row for row in ranked if spot_type in (row["type"] or "")]
+            _top_lists(_key("city_type", city, spot_type), typed, top_n, lists, complete)
+
+    # 下辖城市有增减、或任一下辖城市有变化的省份重算
+    old_provinces = previous["provinces"] if previous else {}
+    changed_provinces = [
+        p for p, cities in province_cities.items()
+        if set(old_provinces.get(p, ())) != cities or cities & changed
+    ]
+    for province, cities in province_cities.items():
+        if province in changed_provinces:
+            ranked = _rank([row for city in cities for row in by_city[city]])
+            _top_lists(_key("province", province), ranked, top_n, lists, complete)
+        else:
+            for band in BANDS:
+                key = _key("province", province, band)
+                lists[key] = previous["lists"][key]
+                complete[key] = previous["complete"][key]
+
+    # 只保存列表中出现的景点
+    row_by_id = {row["id"]: row for row in rows}
+    referenced = {spot_id for ids in lists.values() for spot_id in ids}
+    data = {
+        "version": time.strftime("%Y%m%d%H%M%S") + f"-{os.getpid()}",
+        "top_n": top_n,
+        "spot_types": list(spot_types),
+        "fingerprints": fingerprints,
+        "provinces": {province: sorted(cities) for province, cities in province_cities.items()},
+        "lists": lists,
+        "complete": complete,
+        "spots": {spot_id: _encode_row(row_by_id[spot_id]) for spot_id in sorted(referenced)},
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(json.dumps(data, ensure_ascii=False, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp_path, path)
+
+    stats = {
+        "cities": len(by_city),
+        "changed_cities": sorted(changed),
+        "changed_provinces": sorted(changed_provinces),
+        "lists": len(lists),
+        "spots": len(referenced),
+        "seconds": round(time.perf_counter() - started, 3),
+    }
+    print(f"✔ 排行汇总表已刷新: {path}（{len(changed)}/{len(by_city)} 个城市有变化，"
+          f"{len(lists)} 个列表，耗时 {stats['seconds']}s）")
+    return stats
+
+
+class RollupTable:
+    """加载到内存的排行汇总表"""
+
+    def __init__(self, path=SQL_ROLLUP_PATH):
+        self.path = Path(path)
+        self.mtime = os.stat(self.path).st_mtime_ns
+        data = json.loads(self.path.read_text(encoding="utf-8"))
+        self.version = data["version"]
+        self.top_n = data["top_n"]
+        self.lists = data["lists"]
+        self.complete = data["complete"]
+        self.spots = {spot_id: _decode_row(row) for spot_id, row in data["spots"].items()}
+
+    def __len__(self):
+        return len(self.lists)
+
+    @staticmethod
+    def _band(price: Optional[Dict]) -> Optional[str]:
+        """价格条件对应的价格档，无法用价格档表示时返回None"""
+        if not price:
+            return "all"
+        operator, value = price.get("operator", "<="), float(price.get("value", -1))
+        if value == 0 and operator in ("<=", "="):
+            return "free"
+        if value == 0 and operator == ">":
+            return "paid"
+        return None
+
+    def lookup(self, city_name: Optional[str] = None, province_name: Optional[str] = None,
+               spot_type: Optional[str] = None, price: Optional[Dict] = None,
+               rating: Optional[Dict] = None, limit: Optional[int] = None) -> Optional[List[Dict]]:
+        """
+        按评分降序返回前 limit 个景点；汇总表无法精确回答时返回None（由调用方回退到快照或SQL）
+
+        Args:
+            city_name / province_name: 二选一
+            spot_type: 景点类型关键词（只支持按城市汇总）
+            price: 只支持免费（<= 0）和收费（> 0）
+            rating: 只支持 >= / > 下限；列表按评分降序，满足条件的景点正好是列表前缀
+        """
+        band = self._band(price)
+        if band is None or (city_name is None) == (province_name is None):
+            return None
+        if rating and rating.get("operator", ">=") not in (">=", ">"):
+            return None
+        if spot_type:
+            if city_name is None:
+                return None
+            key = _key("city_type", city_name, spot_type, band)
+        elif city_name is not None:
+            key = _key("city", city_name, band)
+        else:
+            key = _key("province", province_name, band)
+
+        ids = self.lists.get(key)
+        if ids is None:
+            return None
+        # 列表只保留了前N个，超过N的请求只有在列表本身完整时才能回答
+        if not self.complete[key] and (limit is None or limit > self.top_n):
+            return None
+
+        rows = [self.spots[spot_id] for spot_id in ids]
+        if rating:
+            threshold = Decimal(str(rating["value"]))
+            strict = rating.get("operator") == ">"
+            rows = [r for r in rows if r["rating"] is not None and (r["rating"] > threshold if strict else r["rating"] >= threshold)]
+        return [dict(row) for row in rows[:limit]]
+
+    def compound_lookup(self, keywords: List[Dict], limit: Optional[int] = None) -> Optional[List[Dict]]:
+        """与 DatabaseManager._execute_compound_filter 相同的关键词语义"""
+        conditions = {}
+        for keyword in keywords:
+            query_type = keyword.get("type")
+            if query_type == "city_spots":
+                conditions["city_name"] = keyword.get("city_name")
+                conditions["province_name"] = keyword.get("province_name")
+            elif query_type == "ticket_price" and keyword.get("price"):
+                conditions["price"] = keyword["price"]
+            elif query_type == "rating_spots" and keyword.get("rating"):
+                conditions["rating"] = keyword["rating"]
+            elif query_type == "spot_type" and keyword.get("spot_type"):
+                conditions["spot_type"] = keyword["spot_type"]
+        return self.lookup(limit=limit, **conditions)
+
+
+# 每个进程缓存一份汇总表，文件被刷新（修改时间变化）后自动重新加载
+_rollups: Optional[RollupTable] = None
+_rollups_lock = threading.Lock()
+
+
+def get_rollups(path=None) -> Optional[RollupTable]:
+    """获取当前进程的排行汇总表（文件不存在时返回None）"""
+    global _rollups
+    path = path or SQL_ROLLUP_PATH
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+    if _rollups is None or _rollups.mtime != mtime:
+        with _rollups_lock:
+            if _rollups is None or _rollups.mtime != mtime:
+                try:
+                    _rollups = RollupTable(path)
+                    print(f"✔ 已加载排行汇总表 {_rollups.version}（{len(_rollups)} 个列表）")
+                except Exception as e:
+                    print(f"❌ 排行汇总表加载失败: {e}")
+                    return _rollups
+    return _rollups
+
+
+def main():
+    import argparse
+    from agent.sql.attraction_ezqa_service import create_database_manager
+
+    parser = argparse.ArgumentParser(description="景点排行汇总表工具")
+    parser.add_argument("command", choices=["refresh", "info"])
+    parser.add_argument("--out", default=SQL_ROLLUP_PATH, help="汇总表文件（默认 SQL_ROLLUP_PATH）")
+    parser.add_argument("--top-n", type=int, default=SQL_ROLLUP_TOP_N, help="每个列表保留的景点数")
+    parser.add_argument("--full", action="store_true", help="全量重建")
+    args = parser.parse_args()
+
+    if args.command == "refresh":
+        stats = build_rollups(create_database_manager(), args.out, top_n=args.top_n, full=args.full)
+        print(json.dumps(stats, ensure_ascii=False, indent=2))
+    else:
+        rollups = get_rollups(args.out)
+        if rollups is None:
+            print("❌ 汇总表不存在")
+            return
+        print(json.dumps({
+            "version": rollups.version,
+            "top_n": rollups.top_n,
+            "lists": len(rollups.lists),
+            "spots": len(rollups.spots),
+        }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,489 @@
+"""
+行程路线预计算
+从规划请求中找出目的地城市、天数和用户提到的景点，基于 scenic_spots 的经纬度计算距离矩阵，
+按天聚类后用最近邻 + 2-opt 排出每天的游览顺序，结果注入行程规划提示词，模型不必自己推算路线。
+目的地和天数优先取表单；表单请求按目的地评分和旅行偏好挑选候选景点（用户点名的景点优先），
+自由文本只对用户点名的景点排线。挑选的候选景点、或没有覆盖全部景点和天数的路线，只作为建议注入。
+
+用法：
+    python -m agent.sql.route_planner "北京三天游，想去故宫、颐和园和八达岭长城"
+"""
+
+import math
+import os
+import re
+import threading
+import time
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+
+from agent.sql.spatial_index import KM_PER_DEGREE, haversine_km
+
+load_dotenv()
+ROUTE_SPOTS_PER_DAY = int(os.getenv("ROUTE_SPOTS_PER_DAY", "4"))
+ROUTE_MAX_DAYS = 10
+MIN_SPOT_NAME_LENGTH = 3  # 与意图门控一致，太短的景点名在长文本中误匹配太多
+ROUTE_CANDIDATE_POOL = 200  # 按评分取目的地前N个景点，再按类型和偏好挑选
+
+# 表单“旅行偏好”对应的景点小类（scenic_spots.type 中“大类;中类;小类”的最后一级）；美食体验等没有对应的景点
+PREFERENCE_TYPES = {
+    "文化历史": {"博物馆", "纪念馆", "寺庙道观", "回教寺", "教堂", "世界遗产", "红色景区", "国家级景点", "展览馆"},
+    "自然风光": {"风景名胜", "植物园", "海滩", "观景点", "世界遗产", "国家级景点", "省级景点"},
+    "休闲放松": {"公园", "植物园", "海滩", "动物园", "水族馆"},
+    "摄影艺术": {"美术馆", "观景点", "展览馆"},
+    "购物娱乐": {"城市广场", "动物园", "水族馆", "科技馆"},
+    "冒险运动": {"风景名胜", "观景点"},
+    "夜生活": {"城市广场", "观景点"},
+}
+# 风景名胜之外可作为游览点的小类；会展中心、图书馆、公园内部设施等不作为候选
+VISIT_TYPES = {"博物馆", "美术馆", "展览馆", "科技馆", "天文馆"}
+
+_CHINESE_NUMBERS = {"一": 1, "两": 2, "二": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9, "十": 10}
+# “10月20日”中的“20日”是日期，不是天数
+_DAYS = re.compile(r"(?<![第月\d])(\d{1,2}|[一两二三四五六七八九十])\s*(?:天|日游|日)")
+# 2026-10-20 至 2026-10-22、2026年10月20日到10月22日；第二个日期可省略年份
+_DATE_RANGE = re.compile(
+    r"(\d{4})[-/.年](\d{1,2})[-/.月](\d{1,2})日?\s*(?:至|到|~|～|—|-)\s*"
+    r"(?:(\d{4})[-/.年])?(\d{1,2})[-/.月](\d{1,2})日?"
+)
+
+
+def distance_matrix(latitudes, longitudes) -> np.ndarray:
+    """两两之间的Haversine距离矩阵（公里）"""
+    lat = np.asarray(latitudes, dtype=np.float64)
+    lon = np.asarray(longitudes, dtype=np.float64)
+    return haversine_km(lat[:, None], lon[:, None], lat[None, :], lon[None, :])
+
+
+def route_length(route: List[int], dist: np.ndarray) -> float:
+    return float(sum(dist[a, b] for a, b in zip(route, route[1:])))
+
+
+def nearest_neighbour_route(dist: np.ndarray, start: int = 0, nodes: Optional[List[int]] = None) -> List[int]:
+    """从 start 出发，每次走到最近的未访问点（开放路径，不回到起点）"""
+    remaining = set(range(len(dist)) if nodes is None else nodes)
+    remaining.discard(start)
+    route = [start]
+    while remaining:
+        candidates = np.fromiter(remaining, dtype=np.int64)
+        nearest = int(candidates[np.argmin(dist[route[-1], candidates])])
+        route.append(nearest)
+        remaining.discard(nearest)
+    return route
+
+
+def two_opt(route: List[int], dist: np.ndarray, max_passes: int = 50, fixed_start: bool = False) -> List[int]:
+    """
+    开放路径的 2-opt：反转 route[i:j+1] 能缩短总距离就反转，直到没有改进
+
+    每个 i 对所有 j 的收益一次性向量化计算；fixed_start 时不改变起点。
+    """
+    route = np.asarray(route, dtype=np.int64)
+    n = len(route)
+    if n < 3:
+        return route.tolist()
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1 if fixed_start else 0, n - 1):
+            j = np.arange(i + 1, n)
+            b, c = route[i], route[j]
+            # 反转前后变化的只有 (i-1, i) 和 (j, j+1) 两条边；路径两端没有对应的边
+            gain = np.zeros(len(j))
+            if i > 0:
+                a = route[i - 1]
+                gain += dist[a, b] - dist[a, c]
+            has_next = j < n - 1
+            e = route[np.minimum(j + 1, n - 1)]
+            gain += np.where(has_next, dist[c, e] - dist[b, e], 0.0)
+            best = int(np.argmax(gain))
+            if gain[best] > 1e-9:
+                route[i:j[best] + 1] = route[i:j[best] + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return route.tolist()
+
+
+def best_route(dist: np.ndarray, nodes: List[int], start: Optional[int] = None) -> List[int]:
+    """在 nodes 上求短的开放路径：指定起点时从起点出发，否则尝试每个起点取最短"""
+    if len(nodes) <= 1:
+        return list(nodes)
+    starts = [start] if start is not None else nodes
+    best = None
+    for s in starts:
+        route = two_opt(nearest_neighbour_route(dist, s, nodes), dist, fixed_start=start is not None)
+        length = route_length(route, dist)
+        if best is None or length < best[0]:
+            best = (length, route)
+    return best[1]
+
+
+def _project(latitudes, longitudes) -> np.ndarray:
+    """投影为以公里为单位的平面坐标（城市尺度下等距圆柱投影足够准确）"""
+    lat = np.asarray(latitudes, dtype=np.float64)
+    lon = np.asarray(longitudes, dtype=np.float64)
+    cos_lat = math.cos(math.radians(float(lat.mean())))
+    return np.column_stack([lat * KM_PER_DEGREE, lon * KM_PER_DEGREE * cos_lat])
+
+
+def cluster_days(latitudes, longitudes, n_days: int, seed: int = 0, iterations: int = 50) -> np.ndarray:
+    """
+    把景点分成 n_days 组，返回每个景点的组号
+
+    先用 k-means（k-means++ 初始化）找出每天的中心，再按距离贪心分配、每组不超过 ceil(n / n_days) 个，
+    避免某一天景点扎堆。
+    """
+    points = _project(latitudes, longitudes)
+    n = len(points)
+    n_days = max(1, min(n_days, n))
+    rng = np.random.default_rng(seed)
+
+    centers = [points[rng.integers(n)]]
+    for _ in range(1, n_days):
+        d2 = np.min(((points[:, None, :] - np.asarray(centers)[None, :, :]) ** 2).sum(-1), axis=1)
+        probabilities = d2 / d2.sum() if d2.sum() > 0 else np.full(n, 1 / n)
+        centers.append(points[rng.choice(n, p=probabilities)])
+    centers = np.asarray(centers)
+
+    for _ in range(iterations):
+        labels = np.argmin(((points[:, None, :] - centers[None, :, :]) ** 2).sum(-1), axis=1)
+        updated = np.asarray([
+            points[labels == k].mean(axis=0) if np.any(labels == k) else centers[k] for k in range(n_days)
+        ])
+        if np.allclose(updated, centers):
+            break
+        centers = updated
+
+    # 容量受限的贪心分配：距离最近的 (景点, 中心) 对优先
+    capacity = math.ceil(n / n_days)
+    d2 = ((points[:, None, :] - centers[None, :, :]) ** 2).sum(-1)
+    labels = np.full(n, -1, dtype=np.int64)
+    counts = np.zeros(n_days, dtype=np.int64)
+    for flat in np.argsort(d2, axis=None):
+        spot, day = divmod(int(flat), n_days)
+        if labels[spot] < 0 and counts[day] < capacity:
+            labels[spot] = day
+            counts[day] += 1
+    return labels
+
+
+def spot_categories(spot_type: Optional[str]) -> List[Tuple[str, str]]:
+    """scenic_spots.type（多个分类以“|”分隔）中每个分类的 (大类, 小类)"""
+    categories = []
+    for part in (spot_type or "").split("|"):
+        levels = part.split(";")
+        if levels[0]:
+            categories.append((levels[0], levels[-1]))
+    return categories
+
+
+def is_visitable(row: Dict) -> bool:
+    """适合作为游览点的景点：风景名胜类（公园内部设施除外）或场馆类，且没有暂停开放"""
+    if "暂停开放" in row["name"] or "停业" in row["name"]:
+        return False
+    return any(
+        major == "风景名胜" and minor != "公园内部设施" or minor in VISIT_TYPES
+        for major, minor in spot_categories(row.get("type"))
+    )
+
+
+def plan_itinerary(spots: List[Dict], n_days: int) -> List[Dict]:
+    """
+    为带坐标的景点排出每日路线
+
+    Args:
+        spots: [{"name", "latitude", "longitude", ...}]
+        n_days: 天数
+
+    Returns:
+        [{"day": 1, "spots": [...], "legs_km": [...], "total_km": ...}, ...]
+    """
+    if not spots:
+        return []
+    latitudes = [float(s["latitude"]) for s in spots]
+    longitudes = [float(s["longitude"]) for s in spots]
+    dist = distance_matrix(latitudes, longitudes)
+    labels = cluster_days(latitudes, longitudes, n_days)
+    groups = [np.flatnonzero(labels == k).tolist() for k in range(labels.max() + 1)]
+    groups = [g for g in groups if g]
+
+    # 各天之间的先后也按中心距离排成一条短路径，相邻两天的区域挨着
+    centroids = np.asarray([[np.mean([latitudes[i] for i in g]), np.mean([longitudes[i] for i in g])] for g in groups])
+    day_order = best_route(distance_matrix(centroids[:, 0], centroids[:, 1]), list(range(len(groups))))
+
+    days = []
+    previous_end = None
+    for day_number, group_index in enumerate(day_order, 1):
+        group = groups[group_index]
+        # 从离前一天终点最近的景点开始
+        start = None
+        if previous_end is not None:
+            start = group[int(np.argmin(dist[previous_end, group]))]
+        route = best_route(dist, group, start=start)
+        legs = [float(dist[a, b]) for a, b in zip(route, route[1:])]
+        days.append({
+            "day": day_number,
+            "spots": [spots[i] for i in route],
+            "legs_km": [round(leg, 1) for leg in legs],
+            "total_km": round(sum(legs), 1),
+        })
+        previous_end = route[-1]
+    return days
+
+
+class RoutePlanner:
+    """从规划请求中提取景点并预计算路线"""
+
+    def __init__(self, question_processor, db_manager, spots_per_day: int = ROUTE_SPOTS_PER_DAY):
+        self.question_processor = question_processor
+        self.db_manager = db_manager
+        self.spots_per_day = spots_per_day
+
+    @staticmethod
+    def _clamp_days(days: int) -> int:
+        return max(1, min(days, ROUTE_MAX_DAYS))
+
+    @staticmethod
+    def trip_days(start_date, end_date) -> Optional[int]:
+        """表单起止日期（含首尾两天）对应的天数；无法解析时返回None"""
+        try:
+            days = (date.fromisoformat(str(end_date)) - date.fromisoformat(str(start_date))).days + 1
+        except (TypeError, ValueError):
+            return None
+        return RoutePlanner._clamp_days(days) if days > 0 else None
+
+    @staticmethod
+    def extract_days(text: str) -> Optional[int]:
+        """从文本中读取天数：日期范围优先，其次是“三天”“5日游”"""
+        match = _DATE_RANGE.search(text)
+        if match:
+            year, month, day, end_year, end_month, end_day = match.groups()
+            try:
+                start = date(int(year), int(month), int(day))
+                end = date(int(end_year or year), int(end_month), int(end_day))
+            except ValueError:
+                start = end = None
+            if start and end and end >= start:
+                return RoutePlanner._clamp_days((end - start).days + 1)
+        match = _DAYS.search(text)
+        if not match:
+            return None
+        value = match.group(1)
+        days = int(value) if value.isdigit() else _CHINESE_NUMBERS[value]
+        return RoutePlanner._clamp_days(days)
+
+    def recommend_spots(self, city_name: str, preferences: Optional[List[str]], count: int,
+                        exclude: Iterable[str] = ()) -> List[Dict]:
+        """
+        目的地评分最高的可游览景点，符合旅行偏好的优先；同一景点的分区（“北京动物园-北区”）只取一个
+
+        Args:
+            city_name: 目的地城市（全称）
+            preferences: 表单的旅行偏好
+            count: 需要的景点数
+            exclude: 已选的景点名
+        """
+        if count <= 0:
+            return []
+        rows = self.db_manager._execute_query("""
+            SELECT s.name AS name, s.type AS type, s.latitude AS latitude, s.longitude AS longitude,
+                   s.rating AS rating, c.name AS city_name
+            FROM scenic_spots s
+            JOIN cities c ON s.city_id = c.id
+            WHERE c.name = %s AND s.latitude IS NOT NULL AND s.longitude IS NOT NULL
+            ORDER BY s.rating DESC, s.id DESC
+            LIMIT %s
+        """, (city_name, ROUTE_CANDIDATE_POOL))
+        wanted = set()
+        for preference in preferences or []:
+            wanted |= PREFERENCE_TYPES.get(preference, set())
+
+        taken = {name.split("-")[0] for name in exclude}
+        preferred, others = [], []
+        for row in rows:
+            base = row["name"].split("-")[0]
+            if base in taken or not is_visitable(row):
+                continue
+            taken.add(base)
+            minors = {minor for _, minor in spot_categories(row.get("type"))}
+            (preferred if minors & wanted else others).append(row)
+        return (preferred + others)[:count]
+
+    def _spot_rows(self, names: List[str]) -> List[Dict]:
+        placeholders = ", ".join(["%s"] * len(names))
+        return self.db_manager._execute_query(f"""
+            SELECT s.name AS name, s.latitude AS latitude, s.longitude AS longitude,
+                   s.rating AS rating, c.name AS city_name
+            FROM scenic_spots s
+            JOIN cities c ON s.city_id = c.id
+            WHERE s.name IN ({placeholders})
+        """, tuple(names))
+
+    def select_spots(self, message: str, context: str = "",
+                     form_data: Optional[Dict] = None) -> Tuple[Optional[str], Optional[int], List[Dict], List[str]]:
+        """
+        选出用户自己点名的景点，不从收集到的资料中取；表单请求的候选景点由 plan() 另行补足
+
+        表单请求的目的地和日期取自表单（提示词里还有出发地，不能从全文匹配城市）；
+        自由文本以所提景点最集中的城市为目的地，天数取原话，其次是收集到的资料。
+
+        Returns:
+            (城市, 天数, 景点行, 未排入路线的景点名)；天数无法确定时为None
+        """
+        processor = self.question_processor
+        form_data = form_data or {}
+        destination = str(form_data.get("destination") or "")
+        # 表单的其他字段都是固定选项，用户只可能在目的地一栏写景点
+        spot_text = (destination if form_data else message).lower()
+
+        names = []
+        for _, _, name in processor.spot_matcher.find_all(spot_text):
+            if len(name) >= MIN_SPOT_NAME_LENGTH and name not in names:
+                names.append(name)
+
+        city_name = processor.city_matcher.longest(destination) if destination else None
+        rows = []
+        if names:
+            rows = [row for row in self._spot_rows(names)
+                    if row["latitude"] is not None and row["longitude"] is not None]
+        if city_name is None and rows:
+            # 提到景点最多的城市；并列时取原话中出现过的城市
+            mentioned = {name for _, _, name in processor.city_matcher.find_all(message)}
+            spots_in_city: Dict[str, set] = {}
+            for row in rows:
+                spots_in_city.setdefault(row["city_name"], set()).add(row["name"])
+            city_name = max(spots_in_city, key=lambda city: (len(spots_in_city[city]), city in mentioned))
+
+        # 重名景点只取目的地城市里的那个
+        rows_by_name = {}
+        for row in rows:
+            if row["city_name"] == city_name:
+                rows_by_name.setdefault(row["name"], row)
+        selected = [rows_by_name[name] for name in names if name in rows_by_name]
+
+        n_days = self.trip_days(form_data.get("start_date"), form_data.get("end_date")) if form_data else None
+        if n_days is None:
+            n_days = self.extract_days(message) or (self.extract_days(context) if context else None)
+        if n_days is not None:
+            selected = selected[:n_days * self.spots_per_day]
+        chosen = {row["name"] for row in selected}
+        skipped = [name for name in names if name not in chosen]
+        return city_name, n_days, selected, skipped
+
+    def plan(self, message: str, context: str = "", form_data: Optional[Dict] = None) -> Optional[Dict]:
+        """
+        预计算路线；没有目的地城市或可排线的景点不足两个时返回None
+
+        表单请求在用户点名的景点之外，按目的地评分和旅行偏好补足每天 spots_per_day 个候选景点（recommended）。
+        complete 表示路线只含用户点名的景点，且覆盖了全部景点和全部天数，此时才要求模型照此安排。
+        """
+        city_name, n_days, spots, skipped = self.select_spots(message, context, form_data)
+        recommended = []
+        if form_data and city_name is not None:
+            target = (n_days or max(1, math.ceil(len(spots) / self.spots_per_day))) * self.spots_per_day
+            picks = self.recommend_spots(city_name, form_data.get("preferences"), target - len(spots),
+                                         exclude=[row["name"] for row in spots])
+            spots = spots + picks
+            recommended = [row["name"] for row in picks]
+        if city_name is None or len(spots) < 2:
+            return None
+        if n_days is None:
+            n_days = self._clamp_days(math.ceil(len(spots) / self.spots_per_day))
+        days = plan_itinerary(spots, n_days)
+        return {
+            "city_name": city_name,
+            "n_days": n_days,
+            "days": days,
+            "skipped": skipped,
+            "recommended": recommended,
+            "complete": not skipped and not recommended and len(days) == n_days,
+        }
+
+    @staticmethod
+    def format_prompt(plan: Dict) -> str:
+        """把路线格式化为规划提示词中的一节；含推荐景点或未覆盖全部景点、天数时只作为参考"""
+        complete = plan.get("complete", True)
+        recommended = plan.get("recommended") or []
+        if complete:
+            title = "预计算的游览路线"
+        else:
+            title = "建议游览路线" if recommended else "可参考的部分游览路线"
+        lines = [f"\n\n=== {title}（{plan['city_name']}，按景点坐标优化） ==="]
+        for day in plan["days"]:
+            route = day["spots"][0]["name"]
+            for spot, leg in zip(day["spots"][1:], day["legs_km"]):
+                route += f" →（{leg}公里）→ {spot['name']}"
+            distance = f"（景点间合计约{day['total_km']}公里）" if len(day["spots"]) > 1 else ""
+            lines.append(f"第{day['day']}天{distance}：{route}")
+        if complete:
+            lines.append(
+                "**请采用上述每日分组和游览顺序；用户提到但未列出的景点，请插入到距离最近的一天。"
+                "你只需补充交通方式、用餐、时间安排和景点介绍等叙述。**\n"
+            )
+            return "\n".join(lines)
+
+        notes = []
+        if recommended:
+            routed = sum(len(day["spots"]) for day in plan["days"])
+            picked = "上述景点" if len(recommended) == routed else "、".join(recommended)
+            notes.append(f"{picked}是按目的地评分和旅行偏好挑选的候选景点，可按用户需求替换")
+        if len(plan["days"]) < plan["n_days"]:
+            notes.append(f"上述路线只覆盖{len(plan['days'])}天，行程共{plan['n_days']}天")
+        if plan.get("skipped"):
+            notes.append(f"未排入：{'、'.join(plan['skipped'])}")
+        notes.append("用户提到但未列出的景点同样需要安排")
+        lines.append(
+            f"以上仅是按坐标排出的建议顺序（{'；'.join(notes)}）。"
+            "请以用户的完整需求为准，自行安排全部景点和天数，可调整上述分组和顺序。\n"
+        )
+        return "\n".join(lines)
+
+
+# 每个进程一个实例，复用SQL问答引擎的实体匹配器和数据库连接池
+_route_planner = None
+_route_planner_pid = None
+_route_planner_lock = threading.Lock()
+
+
+def get_route_planner() -> RoutePlanner:
+    """获取当前进程的路线规划器（懒加载，fork后自动重建）"""
+    global _route_planner, _route_planner_pid
+    pid = os.getpid()
+    if _route_planner is None or _route_planner_pid != pid:
+        with _route_planner_lock:
+            if _route_planner is None or _route_planner_pid != pid:
+                from agent.sql.attraction_ezqa_service import get_sql_qa_engine
+                engine = get_sql_qa_engine()
+                _route_planner = RoutePlanner(engine.question_processor, engine.db_manager)
+                _route_planner_pid = pid
+    return _route_planner
+
+
+def build_route_context(message: str, context: str = "", form_data: Optional[Dict] = None) -> str:
+    """为行程规划提示词生成预计算路线一节；无法规划或出错时返回空字符串，不影响规划本身"""
+    if form_data is not None and not str(form_data.get("destination") or "").strip():
+        # 表单没填目的地时不加载SQL问答引擎（词典、数据库连接）
+        return ""
+    started = time.perf_counter()
+    try:
+        plan = get_route_planner().plan(message, context, form_data)
+    except Exception as e:
+        print(f"⚠️  [路线规划] 预计算失败，交由模型自行安排: {e}")
+        return ""
+    elapsed = (time.perf_counter() - started) * 1000
+    if plan is None:
+        print(f"ℹ️  [路线规划] 未识别到目的地景点，跳过（{elapsed:.1f}ms）")
+        return ""
+    spot_count = sum(len(day["spots"]) for day in plan["days"])
+    coverage = "" if plan["complete"] else "（含推荐景点或未完全覆盖，作为参考）"
+    print(f"🗺️  [路线规划] {plan['city_name']} {spot_count} 个景点 / {plan['n_days']} 天{coverage}，耗时 {elapsed:.1f}ms")
+    return RoutePlanner.format_prompt(plan)
+
+
+if __name__ == "__main__":
+    import sys
+
+    print(build_route_context(" ".join(sys.argv[1:]) or "北京三天游，想去故宫、颐和园和八达岭长城"))
@@ -0,0 +1,354 @@
+"""
+景点列式快照模块
+把 scenic_spots / cities / provinces 导出为内存映射的列式快照（NumPy数组 + 字符串表），
+所有gunicorn工作进程以只读方式映射同一份文件，复合条件查询直接用向量化掩码在进程内完成。
+
+用法：
+    python -m agent.sql.snapshot build [--out 目录]     # 重建快照
+    python -m agent.sql.snapshot info  [--out 目录]     # 查看当前快照
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+SNAPSHOT_DIR = os.getenv("SQL_SNAPSHOT_DIR")  # 未配置时不启用快照
+CURRENT_FILE = "CURRENT"  # 指向当前版本子目录
+KEEP_VERSIONS = 2  # 保留的历史版本数（旧进程可能仍在映射）
+
+STRING_COLUMNS = ["id", "name", "address", "opentime_today", "opentime_week", "tel"]
+
+_OPERATORS = {
+    "<=": np.less_equal,
+    "<": np.less,
+    ">=": np.greater_equal,
+    ">": np.greater,
+    "=": np.equal,
+}
+
+
+def _encode_strings(values: List[Optional[str]]):
+    """把字符串列编码为 UTF-8 字节块 + 偏移量 + 空值掩码"""
+    encoded = [b"" if v is None else str(v).encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(b) for b in encoded])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8) if offsets[-1] else np.zeros(0, dtype=np.uint8)
+    valid = np.array([v is not None for v in values], dtype=bool)
+    return blob, offsets, valid
+
+
+def _time_to_seconds(value) -> int:
+    """TIME列（timedelta或HH:MM:SS字符串）转为秒，空值为-1"""
+    if value is None:
+        return -1
+    if isinstance(value, timedelta):
+        return int(value.total_seconds())
+    hours, minutes, *rest = str(value).split(":")
+    return int(hours) * 3600 + int(minutes) * 60 + (int(float(rest[0])) if rest else 0)
+
+
+class StringColumn:
+    """只读字符串列"""
+
+    def __init__(self, blob, offsets, valid):
+        self.blob = blob
+        self.offsets = offsets
+        self.valid = valid
+
+    def __getitem__(self, i: int) -> Optional[str]:
+        if not self.valid[i]:
+            return None
+        return bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8")
+
+
+def build_snapshot(db_manager, out_dir) -> Path:
+    """
+    从数据库导出快照到 out_dir/<版本>/，完成后原子地切换 CURRENT 指针
+
+    Args:
+        db_manager: DatabaseManager 实例
+        out_dir: 快照根目录
+
+    Returns:
+        新版本目录
+    """
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+
+    provinces = db_manager._execute_query("SELECT id, name FROM provinces ORDER BY id")
+    cities = db_manager._execute_query("SELECT id, name, province_id FROM cities ORDER BY id")
+    spots = db_manager._execute_query("""
+        SELECT
+            s.id AS id, s.name AS name, s.type AS type, s.rating AS rating,
+            s.address AS address, s.cost AS cost,
+            s.open_time_start AS open_time_start, s.open_time_end AS open_time_end,
+            s.opentime_today AS opentime_today, s.opentime_week AS opentime_week,
+            s.tel AS tel, s.city_id AS city_id, s.latitude AS latitude, s.longitude AS longitude
+        FROM scenic_spots s
+        JOIN cities c ON s.city_id = c.id
+        JOIN provinces p ON c.province_id = p.id
+        ORDER BY s.id
+    """)
+    if not spots:
+        raise RuntimeError("数据库中没有可导出的景点数据")
+
+    province_pos = {row["id"]: i for i, row in enumerate(provinces)}
+    city_pos = {row["id"]: i for i, row in enumerate(cities)}
+    types = sorted({row["type"] or "" for row in spots})
+    type_pos = {t: i for i, t in enumerate(types)}
+
+    columns = {
+        "rating": np.array([np.nan if r["rating"] is None else float(r["rating"]) for r in spots], dtype=np.float64),
+        "cost": np.array([np.nan if r["cost"] is None else float(r["cost"]) for r in spots], dtype=np.float64),
+        "open_time_start": np.array([_time_to_seconds(r["open_time_start"]) for r in spots], dtype=np.int32),
+        "open_time_end": np.array([_time_to_seconds(r["open_time_end"]) for r in spots], dtype=np.int32),
+        "city": np.array([city_pos[r["city_id"]] for r in spots], dtype=np.int32),
+        "type": np.array([type_pos[r["type"] or ""] for r in spots], dtype=np.int32),
+        "latitude": np.array([float(r["latitude"]) for r in spots], dtype=np.float64),
+        "longitude": np.array([float(r["longitude"]) for r in spots], dtype=np.float64),
+    }
+    for name in STRING_COLUMNS:
+        blob, offsets, valid = _encode_strings([r[name] for r in spots])
+        columns[f"{name}.blob"] = blob
+        columns[f"{name}.offsets"] = offsets
+        columns[f"{name}.valid"] = valid
+
+    version = time.strftime("%Y%m%d%H%M%S") + f"-{os.getpid()}"
+    version_dir = out_dir / version
+    version_dir.mkdir()
+    for name, array in columns.items():
+        np.save(version_dir / f"{name}.npy", array)
+
+    meta = {
+        "version": version,
+        "rows": len(spots),
+        "provinces": [row["name"] for row in provinces],
+        "cities": [row["name"] for row in cities],
+        "city_province": [province_pos.get(row["province_id"], -1) for row in cities],
+        "types": types,
+        "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    (version_dir / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    # 原子切换：先写临时文件再替换，读者不会看到半成品
+    tmp_pointer = out_dir / f"{CURRENT_FILE}.{os.getpid()}.tmp"
+    tmp_pointer.write_text(version, encoding="utf-8")
+    os.replace(tmp_pointer, out_dir / CURRENT_FILE)
+
+    _cleanup_old_versions(out_dir, keep=version)
+    print(f"✔ 快照构建完成: {version_dir}（{len(spots)} 个景点，耗时 {time.perf_counter() - started:.2f}s）")
+    return version_dir
+
+
+def _cleanup_old_versions(out_dir: Path, keep: str):
+    """删除多余的旧版本（保留最近 KEEP_VERSIONS 个）"""
+    versions = sorted(p for p in out_dir.iterdir() if p.is_dir())
+    for old in versions[:-KEEP_VERSIONS]:
+        if old.name == keep:
+            continue
+        try:
+            shutil.rmtree(old)
+        except OSError:
+            # Windows下仍被其它进程映射的文件无法删除，下次再清理
+            pass
+
+
+class ScenicSnapshot:
+    """只读的列式景点快照"""
+
+    def __init__(self, version_dir):
+        self.path = Path(version_dir)
+        self.meta = json.loads((self.path / "meta.json").read_text(encoding="utf-8"))
+        self.version = self.meta["version"]
+
+        def load(name):
+            return np.load(self.path / f"{name}.npy", mmap_mode="r")
+
+        self.rating = load("rating")
+        self.cost = load("cost")
+        self.open_time_start = load("open_time_start")
+        self.open_time_end = load("open_time_end")
+        self.city = load("city")
+        self.type = load("type")
+        self.latitude = load("latitude")
+        self.longitude = load("longitude")
+        self.strings = {
+            name: StringColumn(load(f"{name}.blob"), load(f"{name}.offsets"), load(f"{name}.valid"))
+            for name in STRING_COLUMNS
+        }
+
+        self.cities: List[str] = self.meta["cities"]
+        self.provinces: List[str] = self.meta["provinces"]
+        self.city_province: List[int] = self.meta["city_province"]
+        self.types: List[str] = self.meta["types"]
+        self._city_index = {name: i for i, name in enumerate(self.cities)}
+        self._province_index = {name: i for i, name in enumerate(self.provinces)}
+        # 评分降序的全局排名（空评分排最后，同分按id降序；行本身按id升序存放），
+        # 与SQL的 ORDER BY s.rating DESC, s.id DESC 一致
+        rating_key = np.nan_to_num(np.asarray(self.rating, dtype=np.float64), nan=-np.inf)
+        self._rating_order = np.lexsort((-np.arange(len(rating_key)), -rating_key))
+        self._rating_rank = np.empty_like(self._rating_order)
+        self._rating_rank[self._rating_order] = np.arange(len(self._rating_order))
+
+    def __len__(self):
+        return int(self.meta["rows"])
+
+    def filter(self, city_name: Optional[str] = None, province_name: Optional[str] = None,
+               price: Optional[Dict] = None, rating: Optional[Dict] = None,
+               type_keyword: Optional[str] = None, top_k: Optional[int] = None) -> np.ndarray:
+        """
+        向量化过滤，返回按评分降序排列的行号
+
+        Args:
+            city_name: 城市全称
+            province_name: 省份全称
+            price: {"operator": "<=", "value": 100}
+            rating: {"operator": ">=", "value": 4.5}
+            type_keyword: 景点类型关键词（子串匹配，如"公园"）
+            top_k: 只返回评分最高的前k个
+        """
+        mask = np.ones(len(self), dtype=bool)
+
+        if city_name is not None:
+            city = self._city_index.get(city_name)
+            if city is None:
+                return np.empty(0, dtype=np.int64)
+            mask &= self.city == city
+
+        if province_name is not None:
+            province = self._province_index.get(province_name)
+            cities = [i for i, p in enumerate(self.city_province) if p == province]
+            if province is None or not cities:
+                return np.empty(0, dtype=np.int64)
+            mask &= np.isin(self.city, cities)
+
+        if price:
+            op = _OPERATORS.get(price.get("operator", "<="))
+            if op is None:
+                raise ValueError(f"不支持的比较运算符: {price.get('operator')}")
+            # 空值与任何数比较都为False，与SQL的NULL语义一致
+            mask &= op(self.cost, float(price["value"]))
+
+        if rating:
+            op = _OPERATORS.get(rating.get("operator", ">="))
+            if op is None:
+                raise ValueError(f"不支持的比较运算符: {rating.get('operator')}")
+            mask &= op(self.rating, float(rating["value"]))
+
+        if type_keyword:
+            type_codes = [i for i, t in enumerate(self.types) if type_keyword in t]
+            mask &= np.isin(self.type, type_codes)
+
+        rows = np.flatnonzero(mask)
+        ranks = self._rating_rank[rows]
+        if top_k is not None and len(rows) > top_k:
+            keep = np.argpartition(ranks, top_k - 1)[:top_k]
+            rows, ranks = rows[keep], ranks[keep]
+        return rows[np.argsort(ranks, kind="stable")]
+
+    def compound_filter(self, keywords: List[Dict], top_k: Optional[int] = None) -> List[Dict]:
+        """与 DatabaseManager._execute_compound_filter 相同的关键词语义"""
+        conditions = {}
+        for keyword in keywords:
+            query_type = keyword.get("type")
+            if query_type == "city_spots" and keyword.get("city_name"):
+                conditions["city_name"] = keyword["city_name"]
+            elif query_type == "city_spots" and keyword.get("province_name"):
+                conditions["province_name"] = keyword["province_name"]
+            elif query_type == "ticket_price" and keyword.get("price"):
+                conditions["price"] = keyword["price"]
+            elif query_type == "rating_spots" and keyword.get("rating"):
+                conditions["rating"] = keyword["rating"]
+            elif query_type == "spot_type" and keyword.get("spot_type"):
+                conditions["type_keyword"] = keyword["spot_type"]
+        return self.rows(self.filter(top_k=top_k, **conditions))
+
+    def rows(self, indices) -> List[Dict]:
+        """把行号还原为与通用景点查询相同字段、相同类型的字典"""
+        results = []
+        for i in indices:
+            i = int(i)
+            rating = self.rating[i]
+            cost = self.cost[i]
+            start = int(self.open_time_start[i])
+            end = int(self.open_time_end[i])
+            city = int(self.city[i])
+            province = self.city_province[city]
+            row = {name: column[i] for name, column in self.strings.items()}
+            row.update({
+                "type": self.types[int(self.type[i])] or None,
+                "rating": None if np.isnan(rating) else Decimal(f"{float(rating):.1f}"),
+                "cost": None if np.isnan(cost) else Decimal(f"{float(cost):.2f}"),
+                "open_time_start": None if start < 0 else timedelta(seconds=start),
+                "open_time_end": None if end < 0 else timedelta(seconds=end),
+                "city_name": self.cities[city],
+                "province_name": self.provinces[province] if province >= 0 else None,
+            })
+            results.append(row)
+        return results
+
+
+# 每个进程缓存一个快照实例，CURRENT 指针变化时自动切换到新版本
+_snapshot: Optional[ScenicSnapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot(snapshot_dir=None) -> Optional[ScenicSnapshot]:
+    """获取当前进程的快照（未配置或不存在时返回None）"""
+    global _snapshot
+    snapshot_dir = snapshot_dir or SNAPSHOT_DIR
+    if not snapshot_dir:
+        return None
+    pointer = Path(snapshot_dir) / CURRENT_FILE
+    try:
+        version = pointer.read_text(encoding="utf-8").strip()
+    except OSError:
+        return None
+
+    if _snapshot is None or _snapshot.version != version:
+        with _snapshot_lock:
+            if _snapshot is None or _snapshot.version != version:
+                try:
+                    _snapshot = ScenicSnapshot(Path(snapshot_dir) / version)
+                    print(f"✔ 已加载景点快照 {version}（{len(_snapshot)} 个景点）")
+                except Exception as e:
+                    print(f"❌ 景点快照加载失败: {e}")
+                    return _snapshot
+    return _snapshot
+
+
+def main():
+    import argparse
+    from agent.sql.attraction_ezqa_service import create_database_manager
+
+    parser = argparse.ArgumentParser(description="景点列式快照工具")
+    parser.add_argument("command", choices=["build", "info"])
+    parser.add_argument("--out", default=SNAPSHOT_DIR, help="快照根目录（默认 SQL_SNAPSHOT_DIR）")
+    args = parser.parse_args()
+
+    if not args.out:
+        parser.error("请通过 --out 或环境变量 SQL_SNAPSHOT_DIR 指定快照目录")
+
+    if args.command == "build":
+        build_snapshot(create_database_manager(), args.out)
+    else:
+        snapshot = get_snapshot(args.out)
+        if snapshot is None:
+            print("❌ 快照不存在")
+            return
+        print(json.dumps({k: v for k, v in snapshot.meta.items() if k != "types"}, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
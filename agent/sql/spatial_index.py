@@ -0,0 +1,159 @@
+"""
+景点空间索引模块
+在进程内按经纬度网格组织景点，附近查询先用包围盒裁剪候选，再精确计算Haversine距离
+"""
+
+import math
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180  # 纬度方向每度约111公里
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM  # 地球表面两点的最大距离
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Haversine公式计算距离（单位：公里），支持numpy数组"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class SpotSpatialIndex:
+    """经纬度网格索引：点按 (行, 列) 网格键排序，同一行的相邻格子在数组中连续"""
+
+    def __init__(self, ids, names, latitudes, longitudes, ratings=None, cell_deg: float = 0.05):
+        """
+        Args:
+            ids: 景点ID
+            names: 景点名称
+            latitudes / longitudes: 纬度 / 经度
+            ratings: 评分（距离相同时按评分降序），可为None
+            cell_deg: 网格边长（度）
+        """
+        self.cell_deg = cell_deg
+        self._ncols = int(math.ceil(360 / cell_deg)) + 1
+        self._nrows = int(math.ceil(180 / cell_deg)) + 1
+
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        if ratings is None:
+            ratings = np.full(len(latitudes), np.nan)
+        ratings = np.array([np.nan if r is None else float(r) for r in ratings], dtype=np.float64)
+
+        keys = self._cell_rows(latitudes) * self._ncols + self._cell_cols(longitudes)
+        order = np.argsort(keys, kind="stable")
+
+        self.keys = keys[order]
+        self.latitudes = latitudes[order]
+        self.longitudes = longitudes[order]
+        self.ratings = ratings[order]
+        self.ids = [ids[i] for i in order]
+        self.names = [names[i] for i in order]
+
+        # 名称 -> 第一个位置，查目标景点坐标时不必再访问数据库
+        self._name_to_pos: Dict[str, int] = {}
+        for pos, name in enumerate(self.names):
+            self._name_to_pos.setdefault(name, pos)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict], **kwargs) -> "SpotSpatialIndex":
+        """由 {id, name, latitude, longitude, rating} 行构建索引"""
+        rows = list(rows)
+        return cls(
+            ids=[row["id"] for row in rows],
+            names=[row["name"] for row in rows],
+            latitudes=[float(row["latitude"]) for row in rows],
+            longitudes=[float(row["longitude"]) for row in rows],
+            ratings=[row.get("rating") for row in rows],
+            **kwargs,
+        )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cell_rows(self, latitudes):
+        return np.floor((np.asarray(latitudes) + 90) / self.cell_deg).astype(np.int64)
+
+    def _cell_cols(self, longitudes):
+        return np.floor((np.asarray(longitudes) + 180) / self.cell_deg).astype(np.int64)
+
+    def locate(self, name: str) -> Optional[Tuple[float, float]]:
+        """返回景点的 (纬度, 经度)，不存在返回None"""
+        pos = self._name_to_pos.get(name)
+        if pos is None:
+            return None
+        return float(self.latitudes[pos]), float(self.longitudes[pos])
+
+    def _bbox_candidates(self, latitude: float, longitude: float, radius_km: float) -> np.ndarray:
+        """包围盒内所有网格中的点的位置"""
+        dlat = radius_km / KM_PER_DEGREE
+        lat_min, lat_max = max(latitude - dlat, -90.0), min(latitude + dlat, 90.0)
+        # 包围盒内纬度绝对值最大处，经度跨度最大
+        max_abs_lat = max(abs(lat_min), abs(lat_max))
+        cos_lat = math.cos(math.radians(max_abs_lat))
+        if cos_lat < 1e-6 or radius_km / (KM_PER_DEGREE * cos_lat) >= 180:
+            lon_min, lon_max = -180.0, 180.0
+        else:
+            dlon = radius_km / (KM_PER_DEGREE * cos_lat)
+            lon_min, lon_max = max(longitude - dlon, -180.0), min(longitude + dlon, 180.0)
+
+        row_min, row_max = int(self._cell_rows(lat_min)), int(self._cell_rows(lat_max))
+        col_min, col_max = int(self._cell_cols(lon_min)), int(self._cell_cols(lon_max))
+
+        rows = np.arange(row_min, row_max + 1, dtype=np.int64)
+        starts = np.searchsorted(self.keys, rows * self._ncols + col_min, side="left")
+        ends = np.searchsorted(self.keys, rows * self._ncols + col_max, side="right")
+        spans = [(s, e) for s, e in zip(starts, ends) if e > s]
+        if not spans:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate([np.arange(s, e) for s, e in spans])
+
+    def _query_radius(self, latitude, longitude, radius_km, exclude_name=None):
+        """返回半径内的 (位置, 距离)，按距离升序、评分降序排列"""
+        candidates = self._bbox_candidates(latitude, longitude, radius_km)
+        if not len(candidates):
+            return candidates, np.empty(0)
+
+        distances = haversine_km(latitude, longitude, self.latitudes[candidates], self.longitudes[candidates])
+        mask = distances <= radius_km
+        if exclude_name is not None:
+            mask &= np.array([self.names[pos] != exclude_name for pos in candidates], dtype=bool)
+        candidates, distances = candidates[mask], distances[mask]
+
+        ratings = np.nan_to_num(self.ratings[candidates], nan=-np.inf)
+        order = np.lexsort((-ratings, distances))
+        return candidates[order], distances[order]
+
+    def query(self, latitude: float, longitude: float, radius_km: Optional[float] = None,
+              top_k: int = 5, exclude_name: Optional[str] = None,
+              initial_radius_km: float = 5.0) -> List[Tuple[str, float]]:
+        """
+        查询附近景点
+
+        Args:
+            latitude / longitude: 中心点坐标
+            radius_km: 搜索半径；为None时不限距离，逐步扩大半径直到凑够 top_k 个
+            top_k: 返回数量
+            exclude_name: 需要排除的景点名称（通常是中心景点自身）
+            initial_radius_km: 不限距离时的起始半径
+
+        Returns:
+            [(景点ID, 距离公里数), ...]，按距离升序、评分降序
+        """
+        if top_k <= 0 or not len(self):
+            return []
+
+        if radius_km is not None:
+            positions, distances = self._query_radius(latitude, longitude, radius_km, exclude_name)
+        else:
+            radius = max(initial_radius_km, self.cell_deg * KM_PER_DEGREE)
+            while True:
+                positions, distances = self._query_radius(latitude, longitude, radius, exclude_name)
+                # 半径内已有 top_k 个，则它们一定是全局最近的 top_k 个
+                if len(positions) >= top_k or radius >= MAX_DISTANCE_KM:
+                    break
+                radius = min(radius * 4, MAX_DISTANCE_KM)
+
+        return [(self.ids[pos], float(dist)) for pos, dist in zip(positions[:top_k], distances[:top_k])]
@@ -0,0 +1,287 @@
+"""
+SQLite 本地镜像模块
+把 agent/sql/mysql/*.sql 中的 MySQL 导出文件批量导入为带索引的本地 SQLite 文件，
+并提供与 DatabaseManager 接口一致的 SQLiteDatabaseManager：每个工作进程直接读本地文件，
+SQL问答无需任何网络往返，也可以在没有 MySQL 的环境下运行压测。
+
+用法：
+    python -m agent.sql.sqlite_backend build [--dump-dir 目录] [--out 文件]   # 从导出文件重建镜像
+    python -m agent.sql.sqlite_backend info  [--out 文件]                     # 查看镜像内容
+"""
+
+import os
+import re
+import sqlite3
+import time
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from agent.sql.database import DatabaseManager
+
+load_dotenv()
+DUMP_DIR = Path(__file__).resolve().parent / "mysql"
+SQLITE_DB_PATH = os.getenv("SQLITE_DB_PATH", str(Path(__file__).resolve().parent / "scenic_spots.sqlite3"))
+
+# 导入顺序（被引用的表在前）
+TABLES = ["provinces", "cities", "scenic_spots"]
+
+# MySQL导出中没有、但本地查询需要的索引
+EXTRA_INDEXES = [
+    ("idx_scenic_spots_name", "scenic_spots", ["name"]),
+    ("idx_cities_name", "cities", ["name"]),
+]
+
+_MYSQL_ESCAPES = {"0": "\0", "b": "\b", "n": "\n", "r": "\r", "t": "\t", "Z": "\x1a"}
+
+# INSERT ... VALUES 中的单个记号：括号、逗号、字符串、NULL 或数字
+_VALUE_TOKEN = re.compile(r"\s*(?:(\()|(\))|(,)|'((?:[^'\\]|\\.|'')*)'|(NULL)|([^,()'\s]+))", re.S)
+_ESCAPE = re.compile(r"\\(.)|''", re.S)
+_COLUMN_DEF = re.compile(r"^\s*`(\w+)`\s+(\w+)(?:\((\d+)(?:,(\d+))?\))?")
+_KEY_DEF = re.compile(r"^\s*(PRIMARY KEY|UNIQUE KEY|KEY)\s*(?:`(\w+)`)?\s*\(([^)]*)\)")
+
+
+# ---------------- 类型转换 ----------------
+
+def _convert_time(value: bytes) -> timedelta:
+    """MySQL TIME（'HH:MM:SS'，可为负或超过24小时）转为 timedelta，与 pymysql 返回值一致"""
+    text = value.decode()
+    sign = -1 if text.startswith("-") else 1
+    hours, minutes, seconds = text.lstrip("-").split(":")
+    return sign * timedelta(hours=int(hours), minutes=int(minutes), seconds=float(seconds))
+
+
+def _decimal_converter(scale: int):
+    quantum = Decimal(1).scaleb(-scale)
+    return lambda value: Decimal(value.decode()).quantize(quantum)
+
+
+# 声明类型 DECIMAL_<小数位> / MYSQL_TIME 在读取时还原为 Decimal / timedelta
+for _scale in range(11):
+    sqlite3.register_converter(f"DECIMAL_{_scale}", _decimal_converter(_scale))
+sqlite3.register_converter("MYSQL_TIME", _convert_time)
+
+
+def _sqlite_type(mysql_type: str, scale: Optional[str]) -> str:
+    mysql_type = mysql_type.lower()
+    if mysql_type in ("int", "integer", "bigint", "smallint", "tinyint", "mediumint"):
+        return "INTEGER"
+    if mysql_type in ("decimal", "numeric"):
+        return f"DECIMAL_{int(scale or 0)}"
+    if mysql_type in ("float", "double", "real"):
+        return "REAL"
+    if mysql_type == "time":
+        return "MYSQL_TIME"
+    return "TEXT"
+
+
+# ---------------- 导出文件解析 ----------------
+
+def _unescape(text: str) -> str:
+    return _ESCAPE.sub(lambda m: "'" if m.group(1) is None else _MYSQL_ESCAPES.get(m.group(1), m.group(1)), text)
+
+
+def _parse_number(text: str):
+    try:
+        return int(text)
+    except ValueError:
+        return float(text)
+
+
+def _iter_values(values_sql: str) -> Iterator[tuple]:
+    """解析 VALUES 之后的 (..),(..) 列表"""
+    row = None
+    pos = 0
+    end = len(values_sql)
+    while pos < end:
+        match = _VALUE_TOKEN.match(values_sql, pos)
+        if match is None:
+            break
+        pos = match.end()
+        open_paren, close_paren, comma, string, null, number = match.groups()
+        if open_paren:
+            row = []
+        elif close_paren:
+            yield tuple(row)
+            row = None
+        elif comma:
+            continue
+        elif string is not None:
+            row.append(_unescape(string))
+        elif null:
+            row.append(None)
+        elif number is not None:
+            if number == ";":
+                break
+            row.append(_parse_number(number))
+
+
+def parse_dump(path) -> Tuple[str, List[Tuple[str, str]], Optional[List[str]], List[Tuple[str, bool, List[str]]], List[tuple]]:
+    """
+    解析单表的 mysqldump 导出文件
+
+    Returns:
+        (表名, [(列名, SQLite类型)], 主键列, [(索引名, 是否唯一, 列)], 数据行)
+    """
+    table = None
+    columns = []
+    primary_key = None
+    indexes = []
+    rows = []
+    in_create = False
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("CREATE TABLE"):
+                table = re.search(r"`(\w+)`", line).group(1)
+                in_create = True
+            elif in_create:
+                if line.startswith(")"):
+                    in_create = False
+                    continue
+                column = _COLUMN_DEF.match(line)
+                if column:
+                    name, mysql_type, _, scale = column.groups()
+                    columns.append((name, _sqlite_type(mysql_type, scale)))
+                    continue
+                key = _KEY_DEF.match(line)
+                if key:
+                    kind, key_name, key_columns = key.groups()
+                    key_columns = re.findall(r"`(\w+)`", key_columns)
+                    if kind == "PRIMARY KEY":
+                        primary_key = key_columns
+                    else:
+                        indexes.append((key_name, kind == "UNIQUE KEY", key_columns))
+            elif line.startswith("INSERT INTO"):
+                values_sql = line[line.index(" VALUES ") + len(" VALUES "):]
+                rows.extend(_iter_values(values_sql))
+
+    if table is None:
+        raise ValueError(f"{path} 中没有找到 CREATE TABLE 语句")
+    return table, columns, primary_key, indexes, rows
+
+
+# ---------------- 构建 ----------------
+
+def build_sqlite(dump_dir=DUMP_DIR, db_path=SQLITE_DB_PATH) -> str:
+    """从 MySQL 导出文件构建 SQLite 镜像，写入临时文件后原子替换，正在读取旧文件的进程不受影响"""
+    started = time.time()
+    dumps = {}
+    for path in sorted(Path(dump_dir).glob("*.sql")):
+        table, columns, primary_key, indexes, rows = parse_dump(path)
+        dumps[table] = (columns, primary_key, indexes, rows)
+
+    missing = [t for t in TABLES if t not in dumps]
+    if missing:
+        raise FileNotFoundError(f"{dump_dir} 中缺少数据表: {', '.join(missing)}")
+
+    db_path = Path(db_path)
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = db_path.with_name(f"{db_path.name}.tmp-{os.getpid()}")
+    if tmp_path.exists():
+        tmp_path.unlink()
+
+    conn = sqlite3.connect(str(tmp_path))
+    try:
+        conn.execute("PRAGMA journal_mode = OFF")
+        conn.execute("PRAGMA synchronous = OFF")
+        with conn:
+            for table in TABLES:
+                columns, primary_key, indexes, rows = dumps[table]
+                column_defs = [f'"{name}" {sqlite_type}' for name, sqlite_type in columns]
+                if primary_key:
+                    column_defs.append(f"PRIMARY KEY ({', '.join(primary_key)})")
+                # 有主键的表按主键聚簇（与InnoDB一致），二级索引隐含主键列，ORDER BY ..., id 可直接走索引
+                without_rowid = " WITHOUT ROWID" if primary_key else ""
+                conn.execute(f'CREATE TABLE "{table}" ({", ".join(column_defs)}){without_rowid}')
+                placeholders = ", ".join(["?"] * len(columns))
+                conn.executemany(f'INSERT INTO "{table}" VALUES ({placeholders})', rows)
+                # 先导入数据再建索引，比逐行维护索引快得多
+                for key_name, unique, key_columns in indexes:
+                    conn.execute(
+                        f'CREATE {"UNIQUE " if unique else ""}INDEX "idx_{table}_{key_name}" '
+                        f'ON "{table}" ({", ".join(key_columns)})'
+                    )
+                print(f"✅ [SQLite镜像] {table}: {len(rows)} 行")
+            for index_name, table, key_columns in EXTRA_INDEXES:
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table}" ({", ".join(key_columns)})')
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+
+    os.replace(tmp_path, db_path)
+    print(f"✅ [SQLite镜像] 已写入 {db_path}，耗时 {time.time() - started:.2f}s")
+    return str(db_path)
+
+
+# ---------------- 查询后端 ----------------
+
+def _dict_factory(cursor, row) -> Dict:
+    # 与 pymysql DictCursor 一致：重名列保留第一个
+    result = {}
+    for column, value in zip(cursor.description, row):
+        result.setdefault(column[0], value)
+    return result
+
+
+class SQLiteDatabaseManager(DatabaseManager):
+    """读取本地 SQLite 镜像的数据库管理器，查询语句与 MySQL 版完全相同"""
+
+    RETRYABLE_ERRORS = (sqlite3.OperationalError, sqlite3.InterfaceError)
+
+    def __init__(self, db_path: str = SQLITE_DB_PATH, dump_dir=DUMP_DIR):
+        self.db_path = str(db_path)
+        if not os.path.exists(self.db_path):
+            print(f"⚠️ [SQLite镜像] {self.db_path} 不存在，从导出文件构建...")
+            build_sqlite(dump_dir, self.db_path)
+        self._init_pool("sqlite")
+
+    def _connect(self):
+        """以只读方式打开镜像文件"""
+        connection = sqlite3.connect(
+            f"{Path(self.db_path).resolve().as_uri()}?mode=ro",
+            uri=True,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+            check_same_thread=False,  # 连接由连接池在线程间借还，同一时刻只有一个线程使用
+        )
+        connection.row_factory = _dict_factory
+        return connection
+
+    def _ping(self, connection):
+        connection.execute("SELECT 1").fetchone()
+
+    def _run(self, connection, query, params):
+        # 语句沿用 pymysql 的 %s 占位符
+        return connection.execute(query.replace("%s", "?"), tuple(params or ())).fetchall()
+
+
+def main():
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="景点数据 SQLite 镜像工具")
+    parser.add_argument("command", choices=["build", "info"])
+    parser.add_argument("--dump-dir", default=str(DUMP_DIR), help="MySQL导出文件目录")
+    parser.add_argument("--out", default=SQLITE_DB_PATH, help="SQLite文件路径（默认 SQLITE_DB_PATH）")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_sqlite(args.dump_dir, args.out)
+    else:
+        if not os.path.exists(args.out):
+            print("❌ 镜像不存在")
+            return
+        manager = SQLiteDatabaseManager(args.out)
+        info = {
+            table: manager._execute_query(f'SELECT COUNT(*) AS n FROM "{table}"')[0]["n"]
+            for table in TABLES
+        }
+        info["size_mb"] = round(os.path.getsize(args.out) / 1024 / 1024, 2)
+        print(json.dumps(info, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
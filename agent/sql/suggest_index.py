@@ -0,0 +1,252 @@
+"""
+景点名自动补全索引
+把 scenic_dictionary.json 中的景点名、数据库中的景点（带评分）和城市导出为按 UTF-8 字节序排列的
+有序数组，查询时二分查找前缀区间，再按“城市优先、评分降序”取前k个。
+索引文件以内存映射方式加载，工作进程启动时不做任何构建；重建后各进程按 meta.json 的修改时间自动重新加载。
+
+用法：
+    python -m agent.sql.suggest_index build [--out 目录]   # 重建索引
+    python -m agent.sql.suggest_index query 北京 [--out 目录]
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+SQL_DIR = Path(__file__).resolve().parent
+SUGGEST_INDEX_DIR = os.getenv("SUGGEST_INDEX_DIR", str(SQL_DIR / "suggest_data"))
+
+KIND_SPOT = 0
+KIND_CITY = 1
+KIND_NAMES = {KIND_SPOT: "spot", KIND_CITY: "city"}
+
+# 前缀区间超过该大小时，构建阶段预先算好前 HOT_TOP_K 个结果（如“北”、“北京”），查询时直接返回
+HOT_PREFIX_THRESHOLD = 256
+HOT_TOP_K = 20
+
+
+def _pack_strings(values: List[bytes]):
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(v) for v in values])
+    return np.frombuffer(b"".join(values), dtype=np.uint8), offsets
+
+
+def _rank_key(score: np.ndarray, kind: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """排序键（越小越靠前）：城市优先，其次评分降序，再次名称更短"""
+    order = np.lexsort((lengths, -score, -kind))
+    rank = np.empty(len(order), dtype=np.int32)
+    rank[order] = np.arange(len(order), dtype=np.int32)
+    return rank
+
+
+def build_suggest_index(db_manager, out_dir=SUGGEST_INDEX_DIR) -> str:
+    """从数据库（景点评分、城市）和 scenic_dictionary.json 构建补全索引，写入临时目录后整体替换"""
+    started = time.time()
+    entries: Dict[str, tuple] = {}  # 小写键 -> (显示名, 评分, 类型)
+
+    def add(name, rating, kind):
+        if not name:
+            return
+        key = name.strip().lower()
+        current = entries.get(key)
+        candidate = (name.strip(), rating, kind)
+        if current is None or (candidate[2], candidate[1]) > (current[2], current[1]):
+            entries[key] = candidate
+
+    with open(SQL_DIR / "scenic_dictionary.json", encoding="utf-8") as f:
+        for name in json.load(f):
+            add(name, -1.0, KIND_SPOT)  # 数据库中没有的景点排在有评分的之后
+    for row in db_manager._execute_query("SELECT name, rating FROM scenic_spots"):
+        add(row["name"], float(row["rating"]) if row["rating"] is not None else -1.0, KIND_SPOT)
+    for city in db_manager.get_all_cities():
+        add(city, 10.0, KIND_CITY)
+        if city.endswith("市"):
+            add(city[:-1], 10.0, KIND_CITY)
+
+    keys = sorted(entries, key=lambda k: k.encode("utf-8"))
+    key_bytes = [k.encode("utf-8") for k in keys]
+    score = np.asarray([entries[k][1] for k in keys], dtype=np.float32)
+    kind = np.asarray([entries[k][2] for k in keys], dtype=np.int8)
+    lengths = np.asarray([len(k) for k in keys], dtype=np.int32)
+    rank = _rank_key(score, kind, lengths)
+
+    # 热门短前缀：区间太大时预先算好前 HOT_TOP_K
+    hot = {}
+    for depth in range(1, 6):
+        groups: Dict[str, List[int]] = {}
+        for i, k in enumerate(keys):
+            if len(k) >= depth:
+                groups.setdefault(k[:depth], []).append(i)
+        found = False
+        for prefix, ids in groups.items():
+            if len(ids) > HOT_PREFIX_THRESHOLD:
+                ids = np.asarray(ids)
+                hot[prefix] = ids[np.argsort(rank[ids])[:HOT_TOP_K]].tolist()
+                found = True
+        if not found:
+            break
+
+    out_dir = Path(out_dir)
+    tmp_dir = out_dir.with_name(f"{out_dir.name}.tmp-{os.getpid()}")
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    key_blob, key_offsets = _pack_strings(key_bytes)
+    display_blob, display_offsets = _pack_strings([entries[k][0].encode("utf-8") for k in keys])
+    np.save(tmp_dir / "keys.npy", key_blob)
+    np.save(tmp_dir / "key_offsets.npy", key_offsets)
+    np.save(tmp_dir / "display.npy", display_blob)
+    np.save(tmp_dir / "display_offsets.npy", display_offsets)
+    np.save(tmp_dir / "score.npy", score)
+    np.save(tmp_dir / "kind.npy", kind)
+    np.save(tmp_dir / "rank.npy", rank)
+    with open(tmp_dir / "hot_prefixes.json", "w", encoding="utf-8") as f:
+        json.dump(hot, f, ensure_ascii=False)
+    with open(tmp_dir / "meta.json", "w", encoding="utf-8") as f:
+        json.dump({"entries": len(keys), "hot_prefixes": len(hot), "built_at": time.time()}, f)
+
+    # 旧进程已映射的文件在替换后仍然有效
+    old_dir = out_dir.with_name(f"{out_dir.name}.old-{os.getpid()}")
+    if out_dir.exists():
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    print(f"✔ 补全索引构建完成: {out_dir}（{len(keys)} 个名称，{len(hot)} 个热门前缀，耗时 {time.time() - started:.2f}s）")
+    return str(out_dir)
+
+
+class SuggestIndex:
+    """内存映射的有序名称数组，按前缀二分查找"""
+
+    def __init__(self, index_dir=SUGGEST_INDEX_DIR):
+        index_dir = Path(index_dir)
+        # 先记录版本再读文件：读取期间被替换时，下次查询会再加载一次
+        self.mtime = os.stat(index_dir / "meta.json").st_mtime_ns
+        load = lambda name: np.load(index_dir / name, mmap_mode="r")
+        self.keys = load("keys.npy")
+        self.key_offsets = load("key_offsets.npy")
+        self.display = load("display.npy")
+        self.display_offsets = load("display_offsets.npy")
+        self.score = load("score.npy")
+        self.kind = load("kind.npy")
+        self.rank = load("rank.npy")
+        with open(index_dir / "hot_prefixes.json", encoding="utf-8") as f:
+            self.hot = json.load(f)
+        with open(index_dir / "meta.json", encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self._size = len(self.key_offsets) - 1
+        self._key_buffer = memoryview(self.keys)
+
+    def __len__(self):
+        return self._size
+
+    def _key(self, i: int) -> bytes:
+        return bytes(self._key_buffer[self.key_offsets[i]:self.key_offsets[i + 1]])
+
+    def _lower_bound(self, target: bytes) -> int:
+        lo, hi = 0, self._size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _entry(self, i: int) -> Dict:
+        start, end = self.display_offsets[i], self.display_offsets[i + 1]
+        score = float(self.score[i])
+        return {
+            "name": bytes(self.display[start:end]).decode("utf-8"),
+            "type": KIND_NAMES[int(self.kind[i])],
+            "rating": round(score, 1) if score >= 0 and self.kind[i] == KIND_SPOT else None,
+        }
+
+    def suggest(self, prefix: str, top_k: int = 10) -> List[Dict]:
+        """返回以 prefix 开头的名称：与输入完全相同的名称排第一，其余城市优先、评分降序"""
+        prefix = prefix.strip().lower()
+        if not prefix or top_k <= 0:
+            return []
+        target = prefix.encode("utf-8")
+        start = self._lower_bound(target)
+        # 完全匹配的键一定位于区间开头
+        exact = start if start < self._size and self._key(start) == target else None
+
+        if top_k <= HOT_TOP_K and prefix in self.hot:
+            ids = list(self.hot[prefix][:top_k])
+        else:
+            # UTF-8 中任何后续字节都小于 0xFF，前缀 + 0xFF 即为区间上界
+            end = self._lower_bound(target + b"\xff")
+            if start >= end:
+                return []
+            ranks = np.asarray(self.rank[start:end])
+            if len(ranks) > top_k:
+                best = np.argpartition(ranks, top_k - 1)[:top_k]
+            else:
+                best = np.arange(len(ranks))
+            ids = [start + int(i) for i in best[np.argsort(ranks[best])]]
+
+        if exact is not None and (not ids or ids[0] != exact):
+            ids = [exact] + [i for i in ids if i != exact][:top_k - 1]
+        return [self._entry(i) for i in ids]
+
+
+# 每个进程首次调用时映射索引文件，build 替换目录后（meta.json 修改时间变化）重新映射
+_suggest_index = None
+_suggest_index_lock = threading.Lock()
+
+def get_suggest_index(index_dir=None) -> Optional[SuggestIndex]:
+    """获取补全索引，索引文件不存在时返回None"""
+    global _suggest_index
+    index_dir = index_dir or SUGGEST_INDEX_DIR
+    try:
+        mtime = os.stat(Path(index_dir) / "meta.json").st_mtime_ns
+    except OSError:
+        # build 替换目录的瞬间文件不存在，继续使用已映射的旧索引
+        return _suggest_index
+
+    if _suggest_index is None or _suggest_index.mtime != mtime:
+        with _suggest_index_lock:
+            if _suggest_index is None or _suggest_index.mtime != mtime:
+                try:
+                    _suggest_index = SuggestIndex(index_dir)
+                    print(f"✔ 已加载补全索引（{len(_suggest_index)} 个名称）")
+                except Exception as e:
+                    print(f"❌ 补全索引加载失败: {e}")
+    return _suggest_index
+
+
+def main():
+    import argparse
+    from agent.sql.attraction_ezqa_service import create_database_manager
+
+    parser = argparse.ArgumentParser(description="景点名自动补全索引工具")
+    parser.add_argument("command", choices=["build", "query"])
+    parser.add_argument("prefix", nargs="?", default="")
+    parser.add_argument("--out", default=SUGGEST_INDEX_DIR, help="索引目录（默认 SUGGEST_INDEX_DIR）")
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == "build":
+        build_suggest_index(create_database_manager(), args.out)
+    else:
+        index = SuggestIndex(args.out)
+        started = time.perf_counter()
+        results = index.suggest(args.prefix, args.k)
+        elapsed = (time.perf_counter() - started) * 1000
+        print(json.dumps(results, ensure_ascii=False, indent=2))
+        print(f"⏱️ {elapsed:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,6 +2,7 @@
 from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response
 from agent.ai_agent import get_agent_service, clear_user_agent_sessions, get_agent_memory_stats
 from agent.attraction_guide import get_attraction_guide_response_stream, clear_tour_guide_agents
+from agent.sql.suggest_index import get_suggest_index
 from database_self import db
 import os
 import json
@@ -232,7 +233,7 @@ def plan_travel():
 
     try:
         agent_service = get_agent_service()
-        generator = agent_service.get_response_stream(travel_message, email, "travel", conv_id)
+        generator = agent_service.get_response_stream(travel_message, email, "travel", conv_id, form_data=data)
         return stream_response(generator, travel_message, email, conv_id, "travel")
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -309,6 +310,20 @@ def memory_stats():
             'status': 'error',
             'message': str(e)
         }), 500
+
+
+@app.route('/suggest', methods=['GET'])
+def suggest():
+    """景点/城市名自动补全：/suggest?q=前缀&k=10"""
+    if 'email' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    prefix = request.args.get('q', '').strip()
+    top_k = min(max(request.args.get('k', 10, type=int), 1), 20)
+    index = get_suggest_index()
+    if not prefix or index is None:
+        return jsonify({'suggestions': []})
+    return jsonify({'suggestions': index.suggest(prefix, top_k)})
         
         
 # 新路由：发送验证码
@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# 测试从仓库根目录导入 agent 包
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# agent.RAG.knowledge_base 导入时读取这些配置；没有 .env 时指向临时目录，测试不会写入真实向量库
+_scratch = Path(tempfile.mkdtemp(prefix="agent-tests-"))
+os.environ.setdefault("DOC_DIR", str(_scratch / "docs"))
+os.environ.setdefault("VECTOR_DIR", str(_scratch / "vectors"))
+os.environ.setdefault("COLLECTION_NAME", "test")
+os.environ.setdefault("EMBED_MODEL", "test-embedding")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("EMBED_CACHE_PATH", str(_scratch / "embedding_cache.sqlite3"))
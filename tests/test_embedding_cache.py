@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from agent.RAG.embedding_cache import CachedEmbeddings, EmbeddingCache, make_embedding_key  # noqa: E402
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.query_calls = 0
+        self.document_texts = 0
+
+    def embed_query(self, text):
+        self.query_calls += 1
+        return [float(len(text)), 1.0]
+
+    def embed_documents(self, texts):
+        self.document_texts += len(texts)
+        return [[float(len(text)), 0.0] for text in texts]
+
+
+def make(tmp_path, **kwargs):
+    remote = CountingEmbeddings()
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), **kwargs)
+    return remote, CachedEmbeddings(remote, model="m", cache=cache)
+
+
+def test_query_embeddings_are_cached_after_normalisation(tmp_path):
+    remote, embeddings = make(tmp_path)
+    first = embeddings.embed_query("北京 三天  游")
+    assert embeddings.embed_query("北京 三天 游") == first
+    assert embeddings.embed_query("ＡＢＣ") == embeddings.embed_query("abc")
+    assert remote.query_calls == 2
+    # 重启后从磁盘命中
+    _, reopened = make(tmp_path)
+    assert reopened.embed_query("北京 三天 游") == pytest.approx(first)
+    assert reopened.stats()["disk_hits"] == 1
+
+
+def test_document_embeddings_bypass_the_cache(tmp_path):
+    remote, embeddings = make(tmp_path)
+    embeddings.embed_documents(["块一", "块二", "块一"])
+    embeddings.embed_documents(["块一"])
+    assert remote.document_texts == 4
+    assert embeddings.cache.disk_size() == 0
+    assert embeddings.cache.memory.stats()["size"] == 0
+    assert embeddings.stats()["requests"] == 0
+
+
+def test_disk_tier_keeps_only_the_newest_vectors(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"))
+    for i in range(10):
+        cache.set_many("m", {make_embedding_key("m", f"q{i}"): [float(i)]})
+    bounded = EmbeddingCache(str(tmp_path / "cache.sqlite3"), maxsize=1, max_disk=4)
+    assert bounded.disk_size() == 4
+    assert bounded.disk_evictions == 6
+    kept = bounded.get_many([make_embedding_key("m", f"q{i}") for i in range(10)])
+    assert sorted(vector[0] for vector in kept.values()) == [6.0, 7.0, 8.0, 9.0]
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("langchain_community")
+
+from agent.RAG.flat_index import BLOCK_ROWS, FlatIndex, export_flat_index, quantize  # noqa: E402
+from agent.RAG.locations import LOCATION_PREFIX  # noqa: E402
+
+ROWS, DIM = BLOCK_ROWS * 4 + 17, 64
+
+
+class FakeCollection:
+    def __init__(self, vectors):
+        self.vectors = vectors
+        self.ids = [f"chunk-{i}" for i in range(len(vectors))]
+
+    def get(self, include, limit, offset):
+        rows = range(offset, min(offset + limit, len(self.ids)))
+        return {
+            "ids": [self.ids[i] for i in rows],
+            "embeddings": self.vectors[offset:offset + limit],
+            "documents": [f"第{i}块" for i in rows],
+            "metadatas": [{LOCATION_PREFIX + ("北京市" if i % 2 else "上海市"): True} for i in rows],
+        }
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    return np.random.default_rng(0).normal(size=(ROWS, DIM)).astype(np.float32)
+
+
+def _exact_top(vectors, query, top_k):
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return set(np.argsort(-(normed @ (query / np.linalg.norm(query))))[:top_k])
+
+
+@pytest.mark.parametrize("dtype, tolerance", [("int8", 0.02), ("float16", 1e-3)])
+def test_quantize_preserves_cosine(vectors, dtype, tolerance):
+    matrix, scale = quantize(vectors, dtype)
+    assert matrix.dtype == np.dtype(dtype)
+    restored = matrix.astype(np.float32) * scale[:, None]
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    assert np.abs((restored * normed).sum(axis=1) - 1).max() < tolerance
+
+
+def test_quantize_zero_vector_and_bad_dtype():
+    matrix, scale = quantize(np.zeros((1, 4)), "int8")
+    assert not matrix.any() and scale[0] == 1.0
+    with pytest.raises(ValueError):
+        quantize(np.ones((1, 4)), "int4")
+
+
+@pytest.mark.parametrize("dtype", ["int8", "float16"])
+def test_search_recall_against_exact(tmp_path, vectors, dtype):
+    index = FlatIndex(export_flat_index(FakeCollection(vectors), tmp_path / "flat", dtype=dtype, page_size=100))
+    assert len(index) == ROWS
+    queries = np.random.default_rng(1).normal(size=(50, DIM)).astype(np.float32)
+    hits = 0
+    for query in queries:
+        results = index.search(query, top_k=10)
+        scores = [score for _, score in results]
+        assert scores == sorted(scores, reverse=True)
+        hits += len({int(chunk_id.split("-")[1]) for chunk_id, _ in results} & _exact_top(vectors, query, 10))
+    assert hits / (len(queries) * 10) >= 0.95
+
+
+def test_search_location_filter_and_get(tmp_path, vectors):
+    index = FlatIndex(export_flat_index(FakeCollection(vectors), tmp_path / "flat", dtype="int8"))
+    # 与第3块完全相同的查询向量：不过滤时排第一，过滤掉它所在的城市后不再出现
+    assert index.search(vectors[3], top_k=1)[0][0] == "chunk-3"
+    filtered = index.search(vectors[3], top_k=5, locations=["上海市"])
+    assert filtered and all(int(chunk_id.split("-")[1]) % 2 == 0 for chunk_id, _ in filtered)
+    assert index.get(["chunk-3", "missing"]) == {"chunk-3": ("第3块", {LOCATION_PREFIX + "北京市": True})}
+
+
+def test_empty_collection(tmp_path):
+    index = FlatIndex(export_flat_index(FakeCollection(np.zeros((0, DIM), dtype=np.float32)), tmp_path / "flat"))
+    assert len(index) == 0 and index.search(np.ones(DIM)) == []
@@ -0,0 +1,29 @@
+from agent.sql.fuzzy_index import FuzzySpotIndex
+
+NAMES = ["故宫博物院", "天坛公园", "东湖公园", "八达岭长城", "颐和园"] + [
+    f"{prefix}森林公园" for prefix in "甲乙丙丁戊己庚辛"
+] + [f"{prefix}博物馆" for prefix in "甲乙丙丁戊己庚辛"]
+
+
+def _index():
+    return FuzzySpotIndex({name.lower(): name for name in NAMES})
+
+
+def test_typo_in_first_characters_is_corrected():
+    assert _index().best("故工博物院在哪") == ("故宫博物院", 0.8)
+
+
+def test_typo_later_in_name_is_corrected():
+    index = _index()
+    assert index.best("八达玲长城门票多少钱")[0] == "八达岭长城"
+    assert index.best("天坛公圆的开放时间")[0] == "天坛公园"
+
+
+def test_sharing_only_generic_bigrams_is_rejected():
+    index = _index()
+    assert index.search("壬森林公园怎么走") == []
+    assert index.search("壬博物馆几点开门") == []
+
+
+def test_unrelated_question_has_no_match():
+    assert _index().search("今天天气怎么样") == []
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("langchain_community")
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from agent.RAG import ingest, knowledge_base  # noqa: E402
+from agent.RAG.ingest import _chunk_ids, _file_hash, load_manifest, plan_sync, save_manifest  # noqa: E402
+
+
+def _doc(text):
+    return SimpleNamespace(page_content=text, metadata={})
+
+
+def _entry(path):
+    stat = path.stat()
+    return {"source": str(path), "sha256": _file_hash(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+            "chunks": []}
+
+
+def test_chunk_ids_are_stable_and_distinguish_repeated_chunks():
+    ids = _chunk_ids("a.txt", [_doc("甲"), _doc("乙"), _doc("甲")])
+    assert ids == _chunk_ids("a.txt", [_doc("甲"), _doc("乙"), _doc("甲")])
+    assert len(set(ids)) == 3
+    assert ids[2] == ids[0] + "-1"
+    # 同样的内容在另一个文件里是不同的块
+    assert _chunk_ids("b.txt", [_doc("甲")])[0] != ids[0]
+
+
+def test_plan_sync_classifies_files(tmp_path):
+    files = {}
+    for name in ["same.txt", "touched.txt", "edited.txt", "new.txt"]:
+        files[name] = tmp_path / name
+        files[name].write_text(name, encoding="utf-8")
+    manifest = {"config": None, "files": {name: _entry(files[name]) for name in ["same.txt", "touched.txt", "edited.txt"]}}
+    manifest["files"]["gone.txt"] = {"source": "gone.txt", "sha256": "x", "size": 1, "mtime_ns": 1, "chunks": ["x"]}
+
+    stat = files["touched.txt"].stat()
+    os.utime(files["touched.txt"], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    files["edited.txt"].write_text("改过的内容", encoding="utf-8")
+
+    plan = plan_sync(manifest, files)
+    assert plan == {
+        "unchanged": ["same.txt"],
+        "touched": ["touched.txt"],
+        "changed": ["edited.txt", "new.txt"],
+        "deleted": ["gone.txt"],
+    }
+    assert plan_sync(manifest, files, full=True)["changed"] == list(files)
+
+
+def test_manifest_round_trip_and_missing_file(tmp_path):
+    path = tmp_path / "sub" / "manifest.json"
+    assert load_manifest(path) == {"config": None, "files": {}}
+    manifest = {"config": {"embed_model": "m"}, "files": {"北京.txt": {"chunks": ["a-b"]}}}
+    save_manifest(manifest, path)
+    assert load_manifest(path) == manifest
+    assert list(path.parent.iterdir()) == [path]
+
+
+def test_corrupt_manifest_is_treated_as_empty(tmp_path):
+    path = tmp_path / "manifest.json"
+    path.write_text("{半个清单", encoding="utf-8")
+    assert load_manifest(path) == {"config": None, "files": {}}
+
+
+class FakeEmbeddings(Embeddings):
+    """记录被嵌入的文本，向量由文本哈希确定"""
+
+    def __init__(self):
+        self.embedded = []
+
+    def _vector(self, text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return [b / 255.0 for b in digest[:8]]
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+# 每段约1000字，按切块参数（1200字）每段正好一个块
+PARAGRAPHS = ["故宫" * 500, "天坛" * 500, "长城" * 500]
+
+
+@pytest.fixture
+def knowledge_dirs(monkeypatch):
+    """conftest 把 DOC_DIR / VECTOR_DIR 指向临时目录；指向别处（如 .env 中的真实配置）时不运行，避免清空真实向量库"""
+    doc_dir, vector_dir = knowledge_base.DOC_DIR, knowledge_base.VECTOR_DIR
+    scratch = Path(tempfile.gettempdir()).resolve()
+    if not all(path.resolve().is_relative_to(scratch) for path in (doc_dir, vector_dir)):
+        pytest.skip("DOC_DIR / VECTOR_DIR 不是测试用的临时目录")
+    shutil.rmtree(doc_dir, ignore_errors=True)
+    shutil.rmtree(vector_dir, ignore_errors=True)
+    doc_dir.mkdir(parents=True)
+    fake = FakeEmbeddings()
+    monkeypatch.setattr(ingest, "embeddings", fake)
+    monkeypatch.setattr(ingest, "load_gazetteer", lambda: {"北京": "北京市", "北京市": "北京市"})
+    return doc_dir, fake
+
+
+def _stored_ids():
+    return set(ingest.open_collection().get(include=[])["ids"])
+
+
+def _manifest_chunks():
+    return {rel_path: entry["chunks"] for rel_path, entry in load_manifest(ingest.MANIFEST_PATH)["files"].items()}
+
+
+def test_sync_embeds_only_new_chunks_and_removes_deleted_files(knowledge_dirs):
+    doc_dir, fake = knowledge_dirs
+    (doc_dir / "a.txt").write_text("\n\n".join(PARAGRAPHS), encoding="utf-8")
+    (doc_dir / "b.txt").write_text("颐和园" * 300, encoding="utf-8")
+
+    report = ingest.sync_knowledge_base()
+    assert report["chunks_added"] == len(fake.embedded) == 4
+    chunks = _manifest_chunks()
+    assert len(chunks["a.txt"]) == 3 and len(chunks["b.txt"]) == 1
+    assert _stored_ids() == set(chunks["a.txt"]) | set(chunks["b.txt"])
+
+    # 文件没变：不读文件，不嵌入
+    fake.embedded.clear()
+    report = ingest.sync_knowledge_base()
+    assert fake.embedded == []
+    assert (report["unchanged"], report["chunks_added"], report["chunks_deleted"]) == (2, 0, 0)
+
+    # 改动一段：只嵌入新段落，旧段落的块被删除，其余块复用
+    edited = PARAGRAPHS[:1] + ["天坛公园" * 240] + PARAGRAPHS[2:]
+    (doc_dir / "a.txt").write_text("\n\n".join(edited), encoding="utf-8")
+    report = ingest.sync_knowledge_base()
+    assert fake.embedded == [edited[1]]
+    assert (report["chunks_added"], report["chunks_deleted"], report["chunks_kept"]) == (1, 1, 2)
+    new_chunks = _manifest_chunks()
+    assert new_chunks["a.txt"][0] == chunks["a.txt"][0] and new_chunks["a.txt"][2] == chunks["a.txt"][2]
+    assert _stored_ids() == set(new_chunks["a.txt"]) | set(chunks["b.txt"])
+
+    # 删除文件：删除它的所有块，不嵌入
+    fake.embedded.clear()
+    (doc_dir / "b.txt").unlink()
+    report = ingest.sync_knowledge_base()
+    assert fake.embedded == []
+    assert (report["deleted"], report["chunks_deleted"]) == (1, 1)
+    assert "b.txt" not in _manifest_chunks()
+    assert _stored_ids() == set(new_chunks["a.txt"])
@@ -0,0 +1,38 @@
+from agent.sql.attraction_ezqa_service import SQLQAEngine
+from agent.sql.intent_gate import IntentGate
+from agent.sql.question_processor import QuestionProcessor
+
+
+class FakeDB:
+    def __init__(self):
+        self.queries = []
+
+    def get_all_cities(self):
+        return ["北京市"]
+
+    def get_all_provinces(self):
+        return ["北京市"]
+
+    def get_all_spots(self):
+        return ["八达岭长城", "故宫博物院", "天坛公园"]
+
+    def query(self, processed_questions, limit=None, order_by=None):
+        self.queries.append(processed_questions)
+        return [{"rating": 4.8, "address": "北京市延庆区G6京藏高速58号出口", "name": "北京市"}]
+
+
+def test_gate_passes_misspelled_spot_without_intent_keyword():
+    gate = IntentGate(QuestionProcessor(FakeDB(), use_llm=False))
+    assert gate.is_scenic("八达玲长城怎么样")
+    assert not gate.is_scenic("今天心情怎么样")
+
+
+def test_engine_answers_misspelled_spot_without_llm():
+    db = FakeDB()
+    engine = SQLQAEngine(db_manager=db)
+    engine.question_processor.use_llm = False
+    answer = engine.answer("八达玲长城怎么样")
+    assert answer.startswith("八达岭长城 的相关信息如下")
+    assert db.queries[0][0]["type"] == "spot_info" and db.queries[0][0]["spot_name"] == "八达岭长城"
+    assert engine.answer("今天心情怎么样") == ""
+    assert len(db.queries) == 1
@@ -0,0 +1,81 @@
+import math
+
+import pytest
+
+pytest.importorskip("langchain_community")
+
+from agent.RAG.lexical_index import BM25_B, BM25_K1, LexicalIndex, Tokenizer, build_lexical_index  # noqa: E402
+from agent.RAG.locations import LOCATION_PREFIX  # noqa: E402
+from agent.RAG.retriever import reciprocal_rank_fusion  # noqa: E402
+
+DOCS = {
+    "a": ("故宫博物院每周一闭馆，故宫博物院需要提前预约门票", {LOCATION_PREFIX + "北京市": True}),
+    "b": ("天坛公园早上六点开门，门票十五元", {LOCATION_PREFIX + "北京市": True}),
+    "c": ("外滩夜景很美，附近的豫园门票四十元", {LOCATION_PREFIX + "上海市": True}),
+    "d": ("", None),
+}
+
+
+class FakeCollection:
+    def get(self, include, limit, offset):
+        ids = list(DOCS)[offset:offset + limit]
+        return {"ids": ids, "documents": [DOCS[i][0] for i in ids], "metadatas": [DOCS[i][1] for i in ids]}
+
+
+@pytest.fixture
+def tokenizer():
+    return Tokenizer(entity_names=["故宫博物院", "天坛公园", "豫园"])
+
+
+@pytest.fixture
+def index(tmp_path, tokenizer, monkeypatch):
+    monkeypatch.setattr("agent.RAG.lexical_index.get_tokenizer", lambda: tokenizer)
+    # 每页两个块，覆盖分页读取
+    return LexicalIndex(build_lexical_index(FakeCollection(), tmp_path / "lexical", page_size=2))
+
+
+def _reference_bm25(tokenizer, query):
+    docs = {chunk_id: tokenizer.tokenize(text) for chunk_id, (text, _) in DOCS.items()}
+    avgdl = sum(len(tokens) for tokens in docs.values()) / len(docs)
+    scores = {}
+    for chunk_id, tokens in docs.items():
+        score = 0.0
+        for term in set(tokenizer.tokenize(query)):
+            tf = tokens.count(term)
+            if not tf:
+                continue
+            df = sum(term in other for other in docs.values())
+            idf = math.log1p((len(docs) - df + 0.5) / (df + 0.5))
+            score += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * len(tokens) / avgdl))
+        if score:
+            scores[chunk_id] = score
+    return scores
+
+
+def test_bm25_scores_match_reference(index, tokenizer):
+    for query in ["故宫博物院门票", "门票多少钱", "豫园夜景"]:
+        expected = _reference_bm25(tokenizer, query)
+        results = index.search(query, top_k=10, tokenizer=tokenizer)
+        assert [chunk_id for chunk_id, _ in results] == sorted(expected, key=expected.get, reverse=True)
+        for chunk_id, score in results:
+            assert score == pytest.approx(expected[chunk_id], rel=1e-5)
+
+
+def test_search_top_k_and_unknown_terms(index, tokenizer):
+    assert len(index.search("门票", top_k=2, tokenizer=tokenizer)) == 2
+    assert index.search("完全无关的词", tokenizer=tokenizer) == []
+
+
+def test_location_filter(index, tokenizer):
+    assert [c for c, _ in index.search("门票", tokenizer=tokenizer, locations=["上海市"])] == ["c"]
+    assert {c for c, _ in index.search("门票", tokenizer=tokenizer, locations=["北京市"])} == {"a", "b"}
+    assert index.search("门票", tokenizer=tokenizer, locations=["杭州市"]) == []
+
+
+def test_reciprocal_rank_fusion():
+    fused = dict(reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]], k=60))
+    assert fused["b"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused["a"] == pytest.approx(1 / 61)
+    assert fused["d"] == pytest.approx(1 / 62)
+    assert [chunk_id for chunk_id, _ in reciprocal_rank_fusion([["a", "b", "c"], ["b", "d"]])][:2] == ["b", "a"]
+    assert reciprocal_rank_fusion([[], []]) == []
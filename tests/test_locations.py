@@ -0,0 +1,88 @@
+import pytest
+
+pytest.importorskip("langchain_community")
+
+from agent.RAG import locations as locations_module, retriever  # noqa: E402
+from agent.RAG.locations import (  # noqa: E402
+    LOCATION_PREFIX, LocationTagger, _aliases, has_location, location_filter,
+)
+
+
+@pytest.fixture
+def tagger():
+    aliases = _aliases(["北京市", "上海市"], "省")
+    aliases.update(_aliases(["浙江省"], "省"))
+    aliases.update(_aliases(["北京市", "上海市", "杭州市"], "市"))
+    return LocationTagger(aliases)
+
+
+def test_tagging_uses_full_names_and_clears_stale_keys(tagger):
+    assert tagger.locations("从上海出发，去杭州和浙江其他地方，再回上海") == ["上海市", "杭州市", "浙江省"]
+    metadata = tagger.tag({"source": "a.pdf", f"{LOCATION_PREFIX}北京市": True}, "西湖位于杭州市")
+    assert metadata == {"source": "a.pdf", f"{LOCATION_PREFIX}北京市": False, f"{LOCATION_PREFIX}杭州市": True}
+    assert has_location(metadata, ["杭州市"]) and not has_location(metadata, ["北京市"])
+
+
+def test_location_filter():
+    assert location_filter([]) is None
+    assert location_filter(["北京市"]) == {f"{LOCATION_PREFIX}北京市": True}
+    assert location_filter(["北京市", "上海市"]) == {
+        "$or": [{f"{LOCATION_PREFIX}北京市": True}, {f"{LOCATION_PREFIX}上海市": True}]
+    }
+
+
+def test_destination_locations(tagger, monkeypatch):
+    monkeypatch.setattr(locations_module, "get_query_tagger", lambda: tagger)
+    assert locations_module.destination_locations("北京") == ["北京市"]
+    assert locations_module.destination_locations("东京") == []
+    assert locations_module.destination_locations("") == []
+
+
+class FakeLexicalIndex:
+    pass
+
+
+def _patch_search(monkeypatch, tagger, pool):
+    calls = []
+
+    def fake_search(store, lexical, query, top_k, threshold, mode, locations):
+        calls.append(locations)
+        hits = [r for r in pool if not locations or has_location(r.metadata, locations)]
+        return hits[:top_k], mode
+
+    monkeypatch.setattr(retriever, "_get_store", lambda: object())
+    monkeypatch.setattr(retriever, "get_lexical_index", lambda: FakeLexicalIndex())
+    monkeypatch.setattr(retriever, "get_query_tagger", lambda: tagger)
+    monkeypatch.setattr(retriever, "_search", fake_search)
+    return calls
+
+
+def _result(text, *cities):
+    metadata = {f"{LOCATION_PREFIX}{city}": True for city in cities}
+    return retriever.SearchResult(source="knowledge_base", title=text, content=text, metadata=metadata)
+
+
+def test_explicit_destination_overrides_query_tagging(tagger, monkeypatch):
+    pool = [_result("外滩", "上海市"), _result("豫园", "上海市"), _result("故宫", "北京市"), _result("天坛", "北京市")]
+    calls = _patch_search(monkeypatch, tagger, pool)
+    query = "出发地：上海，目的地：北京"
+
+    results = retriever.search_local_knowledge(query, top_k=2, mode="hybrid", locations=["北京市"])
+    assert [r.content for r in results] == ["故宫", "天坛"]
+    assert calls == [["北京市"]]
+
+    calls.clear()
+    retriever.search_local_knowledge(query, top_k=2, mode="hybrid")
+    assert calls == [["上海市", "北京市"]]  # 自由文本：从查询中抽取
+
+    calls.clear()
+    retriever.search_local_knowledge(query, top_k=2, mode="hybrid", locations=[])
+    assert calls == [[]]  # 目的地识别不出：不过滤
+
+
+def test_too_few_destination_hits_are_filled_from_the_whole_corpus(tagger, monkeypatch):
+    pool = [_result("外滩", "上海市"), _result("故宫", "北京市"), _result("豫园", "上海市")]
+    calls = _patch_search(monkeypatch, tagger, pool)
+    results = retriever.search_local_knowledge("故宫", top_k=3, mode="hybrid", locations=["北京市"])
+    assert [r.content for r in results] == ["故宫", "外滩", "豫园"]
+    assert calls == [["北京市"], None]
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from agent.sql.question_processor import CHINA_TZ, QuestionProcessor
+
+
+class FakeDB:
+    def get_all_cities(self):
+        return ["北京市", "上海市"]
+
+    def get_all_provinces(self):
+        return ["北京市", "上海市", "广东省"]
+
+    def get_all_spots(self):
+        return ["故宫博物院", "天坛公园"]
+
+
+def _processor():
+    return QuestionProcessor(FakeDB(), use_llm=False)
+
+
+def test_evening_still_open_phrasing_is_open_spots_query():
+    processor = _processor()
+    for question in ["周日晚上还营业的景点", "北京晚上也开放的景点", "上海市深夜还开门的景区"]:
+        result = processor.process(question)
+        assert result[0]["type"] == "open_spots", question
+
+
+def test_weekday_and_period_resolve_to_target_time():
+    # 2026-10-14 是周三
+    now = datetime(2026, 10, 14, 9, 0, tzinfo=CHINA_TZ)
+    target, is_now = _processor()._extract_open_time("周日晚上还营业的景点", now=now)
+    assert (target.weekday(), target.hour, target.minute, target.day) == (6, 20, 0, 18)
+    assert not is_now
+
+
+def test_midnight_in_evening_periods_is_not_noon():
+    processor = _processor()
+    now = datetime(2026, 10, 14, 9, 0, tzinfo=CHINA_TZ)
+    for question, expected in [("晚上12点还开着的景点", (15, 0, 0)), ("夜里12点半还营业的景点", (15, 0, 30)),
+                               ("周日晚上12点还开放的景点", (19, 0, 0)), ("中午12点还开着的景点", (14, 12, 0))]:
+        target, _ = processor._extract_open_time(question, now=now)
+        assert (target.day, target.hour, target.minute) == expected, question
+
+
+def test_now_uses_china_time():
+    target, is_now = _processor()._extract_open_time("现在还开着的景点")
+    assert is_now
+    assert target.utcoffset().total_seconds() == 8 * 3600
+
+
+def test_unrelated_question_is_not_open_query():
+    assert _processor()._extract_open_time("故宫博物院的营业时间") is None
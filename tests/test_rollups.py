@@ -0,0 +1,64 @@
+import json
+from decimal import Decimal
+
+from agent.sql.rollups import RollupTable, build_rollups
+
+
+def spot(spot_id, city, province, rating, cost="0", spot_type="公园"):
+    return {"id": spot_id, "name": f"景点{spot_id}", "city_name": city, "province_name": province,
+            "rating": Decimal(rating), "cost": Decimal(cost), "type": spot_type,
+            "open_time_start": None, "open_time_end": None}
+
+
+class FakeDB:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def _get_common_query(self):
+        return "SELECT ..."
+
+    def _execute_query(self, sql, params=None):
+        return [dict(row) for row in self.rows]
+
+
+def province_ids(path, province):
+    return RollupTable(path).lists[f"province|{province}|all"]
+
+
+def build(path, rows, **kwargs):
+    return build_rollups(FakeDB(rows), path, top_n=5, spot_types=["公园"], **kwargs)
+
+
+def test_unchanged_refresh_reuses_everything(tmp_path):
+    path = tmp_path / "rollups.json"
+    rows = [spot("A1", "广州市", "广东省", "4.5"), spot("B1", "深圳市", "广东省", "4.8")]
+    build(path, rows)
+    stats = build(path, rows)
+    assert stats["changed_cities"] == [] and stats["changed_provinces"] == []
+    assert province_ids(path, "广东省") == ["B1", "A1"]
+
+
+def test_removed_city_recomputes_its_province(tmp_path):
+    path = tmp_path / "rollups.json"
+    rows = [spot("A1", "广州市", "广东省", "4.5"), spot("B001D00CCF", "深圳市", "广东省", "4.8")]
+    build(path, rows)
+    stats = build(path, rows[:1])
+    assert stats["changed_provinces"] == ["广东省"]
+    assert province_ids(path, "广东省") == ["A1"]
+    data = json.loads(path.read_text(encoding="utf-8"))
+    assert "B001D00CCF" not in data["spots"]
+    assert data["provinces"] == {"广东省": ["广州市"]}
+
+
+def test_city_moving_province_updates_both(tmp_path):
+    path = tmp_path / "rollups.json"
+    rows = [spot("A1", "广州市", "广东省", "4.5"), spot("B1", "深圳市", "广东省", "4.8"),
+            spot("C1", "南宁市", "广西壮族自治区", "4.2")]
+    build(path, rows)
+    # 深圳的数据不变，只是所属省份变了；省份名不进城市指纹时也要重算
+    moved = [rows[0], dict(rows[1], province_name="广西壮族自治区"), rows[2]]
+    stats = build(path, moved)
+    assert set(stats["changed_provinces"]) == {"广东省", "广西壮族自治区"}
+    assert province_ids(path, "广东省") == ["A1"]
+    assert province_ids(path, "广西壮族自治区") == ["B1", "C1"]
+
@@ -0,0 +1,131 @@
+from types import SimpleNamespace
+
+from agent.prompts import format_travel_request_prompt
+from agent.sql.entity_matcher import EntityMatcher
+from agent.sql import route_planner
+from agent.sql.route_planner import RoutePlanner, build_route_context
+
+
+def spot(name, latitude, longitude, rating, city_name, spot_type):
+    return {"name": name, "type": spot_type, "latitude": latitude, "longitude": longitude,
+            "rating": rating, "city_name": city_name}
+
+
+SPOTS = [
+    spot("颐和园", 39.999, 116.275, 4.8, "北京市", "风景名胜;风景名胜;世界遗产|风景名胜;公园广场;公园"),
+    spot("八达岭长城", 40.356, 116.020, 4.8, "北京市", "风景名胜;风景名胜;国家级景点"),
+    spot("天坛公园", 39.882, 116.407, 4.7, "北京市", "风景名胜;公园广场;公园"),
+    spot("明十三陵", 40.253, 116.221, 4.6, "北京市", "风景名胜;风景名胜;世界遗产"),
+    spot("故宫博物院", 39.916, 116.397, 4.9, "北京市", "科教文化服务;博物馆;博物馆|风景名胜;风景名胜;世界遗产"),
+    spot("国家会议中心", 40.001, 116.392, 4.9, "北京市", "科教文化服务;会展中心;会展中心"),
+    spot("老舍故居(暂停开放)", 39.922, 116.411, 4.9, "北京市", "风景名胜;风景名胜;纪念馆"),
+    spot("北京动物园-北区", 39.944, 116.339, 4.7, "北京市", "风景名胜;公园广场;动物园"),
+    spot("北京动物园", 39.942, 116.337, 4.6, "北京市", "风景名胜;公园广场;动物园"),
+    spot("东方明珠", 31.240, 121.499, 4.6, "上海市", "风景名胜;风景名胜;观景点"),
+    spot("豫园商城", 31.227, 121.492, 4.5, "上海市", "风景名胜;风景名胜;风景名胜"),
+]
+CITIES = {"北京": "北京市", "北京市": "北京市", "上海": "上海市", "上海市": "上海市"}
+
+
+class FakeDB:
+    def __init__(self):
+        self.queries = []
+
+    def _execute_query(self, sql, params):
+        self.queries.append(sql)
+        if "WHERE c.name" in sql:
+            city_name, limit = params
+            in_city = [dict(s) for s in SPOTS if s["city_name"] == city_name]
+            return sorted(in_city, key=lambda s: -s["rating"])[:limit]
+        return [dict(s) for s in SPOTS if s["name"] in params]
+
+
+def make_planner():
+    processor = SimpleNamespace(
+        spot_matcher=EntityMatcher({s["name"]: s["name"] for s in SPOTS}),
+        city_matcher=EntityMatcher(CITIES),
+    )
+    return RoutePlanner(processor, FakeDB())
+
+
+def travel_form(**overrides):
+    form = {"source": "上海", "destination": "北京", "start_date": "2026-10-20", "end_date": "2026-10-22",
+            "travelers": 2, "budget_per_person": 3000, "accommodation_type": "经济型酒店",
+            "preferences": ["文化历史"], "transportation_mode": ["高铁"], "dietary_restrictions": []}
+    form.update(overrides)
+    return form
+
+
+def test_extract_days():
+    assert RoutePlanner.extract_days("北京三天游") == 3
+    assert RoutePlanner.extract_days("旅行日期：2026-10-20 至 2026-10-22") == 3
+    assert RoutePlanner.extract_days("2026年10月20日到10月21日去北京") == 2
+    assert RoutePlanner.extract_days("10月20日出发") is None
+    assert RoutePlanner.trip_days("2026-10-20", "2026-10-22") == 3
+    assert RoutePlanner.trip_days("", "2026-10-22") is None
+
+
+def test_form_request_suggests_top_rated_destination_spots():
+    planner = make_planner()
+    form = travel_form()
+    city, days, spots, skipped = planner.select_spots(format_travel_request_prompt(form), form_data=form)
+    assert (city, days, spots, skipped) == ("北京市", 3, [], [])
+
+    plan = planner.plan(format_travel_request_prompt(form), form_data=form)
+    routed = [s for day in plan["days"] for s in day["spots"]]
+    # 出发地上海的景点、会展中心、暂停开放的景点不排入；动物园的两个分区只取一个
+    assert {s["city_name"] for s in routed} == {"北京市"}
+    assert sorted(plan["recommended"]) == sorted(s["name"] for s in routed) == sorted(
+        ["故宫博物院", "颐和园", "八达岭长城", "明十三陵", "天坛公园", "北京动物园-北区"])
+    assert not plan["complete"]
+    prompt = RoutePlanner.format_prompt(plan)
+    assert "建议游览路线" in prompt and "请采用" not in prompt
+    assert "按目的地评分和旅行偏好挑选的候选景点" in prompt
+
+
+def test_preferred_spot_types_come_first():
+    planner = make_planner()
+    assert [s["name"] for s in planner.recommend_spots("北京市", ["休闲放松"], 3)] == [
+        "颐和园", "天坛公园", "北京动物园-北区"]
+    assert [s["name"] for s in planner.recommend_spots("北京市", ["美食体验"], 2, exclude=["故宫博物院"])] == [
+        "颐和园", "八达岭长城"]
+
+
+def test_form_without_destination_skips_engine(monkeypatch):
+    def fail():
+        raise AssertionError("不应加载SQL问答引擎")
+
+    monkeypatch.setattr(route_planner, "get_route_planner", fail)
+    form = travel_form(destination="")
+    assert build_route_context(format_travel_request_prompt(form), form_data=form) == ""
+
+
+def test_free_text_uses_city_of_named_spots():
+    planner = make_planner()
+    plan = planner.plan("从上海出发，北京两天，想去颐和园、八达岭长城、天坛公园和明十三陵")
+    assert plan["city_name"] == "北京市"
+    assert plan["n_days"] == 2 and len(plan["days"]) == 2
+    assert sorted(s["name"] for day in plan["days"] for s in day["spots"]) == ["八达岭长城", "天坛公园", "明十三陵", "颐和园"]
+    assert plan["complete"]
+    assert "请采用上述每日分组和游览顺序" in RoutePlanner.format_prompt(plan)
+
+
+def test_partial_route_is_only_a_suggestion():
+    planner = make_planner()
+    # 故宫不在景点词典中，三天只有两个能排线的景点
+    plan = planner.plan("北京三天游，想去故宫、颐和园和八达岭长城")
+    assert plan["n_days"] == 3 and len(plan["days"]) == 2
+    assert not plan["complete"]
+    prompt = RoutePlanner.format_prompt(plan)
+    assert "不要重新分组" not in prompt and "请采用" not in prompt
+    assert "只覆盖2天" in prompt
+
+
+def test_spots_outside_destination_are_reported():
+    planner = make_planner()
+    form = travel_form(destination="北京 颐和园 八达岭长城 东方明珠", end_date="2026-10-20")
+    plan = planner.plan(format_travel_request_prompt(form), form_data=form)
+    assert plan["city_name"] == "北京市"
+    assert plan["skipped"] == ["东方明珠"]
+    assert not plan["complete"]
+    assert "未排入：东方明珠" in RoutePlanner.format_prompt(plan)
@@ -0,0 +1,38 @@
+import os
+
+import agent.sql.suggest_index as suggest_index
+from agent.sql.suggest_index import build_suggest_index, get_suggest_index
+
+
+class FakeDB:
+    def __init__(self, spots, cities):
+        self.spots = spots
+        self.cities = cities
+
+    def _execute_query(self, sql):
+        return [{"name": name, "rating": rating} for name, rating in self.spots]
+
+    def get_all_cities(self):
+        return self.cities
+
+
+def test_rebuilt_index_is_reloaded(tmp_path, monkeypatch):
+    monkeypatch.setattr(suggest_index, "_suggest_index", None)
+    out = tmp_path / "suggest"
+    build_suggest_index(FakeDB([("测试甲景区", 4.5)], ["北京市"]), out)
+    first = get_suggest_index(out)
+    assert [r["name"] for r in first.suggest("测试")] == ["测试甲景区"]
+    assert get_suggest_index(out) is first
+
+    build_suggest_index(FakeDB([("测试甲景区", 4.5), ("测试乙景区", 4.8)], ["北京市"]), out)
+    # 同一秒内重建时保证修改时间不同
+    meta = out / "meta.json"
+    os.utime(meta, ns=(first.mtime + 1, first.mtime + 1))
+    second = get_suggest_index(out)
+    assert second is not first
+    assert [r["name"] for r in second.suggest("测试")] == ["测试乙景区", "测试甲景区"]
+
+
+def test_missing_index_returns_none(tmp_path, monkeypatch):
+    monkeypatch.setattr(suggest_index, "_suggest_index", None)
+    assert get_suggest_index(tmp_path / "missing") is None